@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Minimal runner for the benchmark suite when asv is not available.
+
+Each benchmark runs in a fresh process, reporting wall time for time_* benchmarks, peak resident
+set size for peakmem_* benchmarks and the returned value for track_* benchmarks:
+
+    python -m benchmarks [--match REGEX] [--max-size N]
+"""
+
+import re
+import sys
+import time
+import glob
+import os
+import argparse
+import importlib
+import inspect
+import itertools
+import resource
+import multiprocessing
+
+def discover(pattern):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(directory, 'bench_*.py'))):
+        module = importlib.import_module('benchmarks.' + os.path.splitext(os.path.basename(path))[0])
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__: continue
+            for method in dir(cls):
+                if not method.startswith(('time_', 'peakmem_', 'track_')): continue
+                label = '{}.{}.{}'.format(module.__name__.split('.')[-1], name, method)
+                if re.search(pattern, label): yield label, cls, method
+
+def combinations(cls):
+    params = getattr(cls, 'params', [])
+    if not len(params): return [()]
+    if not isinstance(params[0], (list, tuple)): params = [params]
+    return list(itertools.product(*params))
+
+def run(cls, method, params, queue):
+    try:
+        benchmark = cls()
+        if hasattr(benchmark, 'setup'): benchmark.setup(*params)
+        start = time.perf_counter()
+        value = getattr(benchmark, method)(*params)
+        elapsed = time.perf_counter() - start
+        if method.startswith('time_'): result = '{:.4g} s'.format(elapsed)
+        elif method.startswith('peakmem_'):
+            result = '{:.1f} MB'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+        else: result = '{:.6g} {}'.format(value, getattr(getattr(cls, method), 'unit', ''))
+        if hasattr(benchmark, 'teardown'): benchmark.teardown(*params)
+    except NotImplementedError:
+        result = 'skipped'
+    except Exception as e:
+        result = 'failed ({}: {})'.format(type(e).__name__, e)
+    queue.put(result)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--match', default='', help='only run benchmarks whose name matches this regex')
+    parser.add_argument('--max-size', type=float, default=None, help='skip numeric parameters larger than this')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('fork')
+    for label, cls, method in discover(args.match):
+        for params in combinations(cls):
+            numeric = [p for p in params if isinstance(p, (int, float)) and not isinstance(p, bool)]
+            if args.max_size is not None and any(p > args.max_size for p in numeric): continue
+            queue = context.Queue()
+            process = context.Process(target=run, args=(cls, method, params, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            print('{:<55s} {:<24s} {}'.format(label, ', '.join(map(str, params)), result))
+            sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks comparing literal objects against data files read by a povray loop (asv conventions).
+
+Parse times need a povray executable on the PATH, and are skipped otherwise.
+"""
+
+import os
+import glob
+import shutil
+import tempfile
+import subprocess
+import time
+import numpy as np
+from povray import molecules
+
+def write_scene(directory, n, mode):
+    rng = np.random.default_rng(0)
+    coordinates = rng.random((n, 3)) * n**(1/3)
+    data_prefix = os.path.join(directory, 'molecule') if mode == 'data' else None
+    scene = molecules.scene(coordinates, bond_threshold=0.8, data_prefix=data_prefix)
+    path = os.path.join(directory, 'scene.pov')
+    with open(path, 'w') as f: scene.write(f)
+    return path
+
+def output_bytes(directory):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, '*')))
+
+def parse(path):
+    start = time.perf_counter()
+    subprocess.run(['povray', '+I{}'.format(path), '-O-', '+W8', '+H8', '-D', '+Q0', '-V', '-GA'],
+                   cwd=os.path.dirname(path), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+class DataFileMode:
+    params = ([10**3, 10**4, 10**5], ['literal', 'data'])
+    param_names = ['n', 'mode']
+
+    def setup(self, n, mode):
+        self.directory = tempfile.mkdtemp()
+        self.path = write_scene(self.directory, n, mode)
+
+    def teardown(self, n, mode):
+        shutil.rmtree(self.directory)
+
+    def time_write(self, n, mode):
+        write_scene(self.directory, n, mode)
+
+    def track_output_bytes(self, n, mode):
+        return output_bytes(self.directory)
+    track_output_bytes.unit = 'bytes'
+
+    def track_parse_time(self, n, mode):
+        if shutil.which('povray') is None: raise NotImplementedError('povray not found')
+        return parse(self.path)
+    track_parse_time.unit = 'seconds'
+
+if __name__ == '__main__':
+    for n in [10**3, 10**4, 10**5]:
+        for mode in ['literal', 'data']:
+            with tempfile.TemporaryDirectory() as directory:
+                path = write_scene(directory, n, mode)
+                line = 'n={:<8d} {:<8s} {:12d} bytes'.format(n, mode, output_bytes(directory))
+                if shutil.which('povray'): line += ' {:8.3f} s parse'.format(parse(path))
+                print(line)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks of lines built from long polylines (asv conventions)."""
+
+import numpy as np
+
+from povray import line, polylines, arrowed_line, stipple_coordinates, grid_lines, wireframe
+from .common import output_bytes, random_walk, surface_grid
+
+class Lines:
+    params = [10**3, 10**4, 10**5, 10**6]
+    param_names = ['npoints']
+    timeout = 600
+
+    def setup(self, npoints):
+        self.coordinates = random_walk(npoints)
+
+    def time_line(self, npoints):
+        line(self.coordinates, 0.1)
+
+    def peakmem_line(self, npoints):
+        line(self.coordinates, 0.1)
+
+    def time_stippled_line(self, npoints):
+        line(self.coordinates, 0.1, stipple=(0.5, 0.25))
+
+    def time_arrowed_line(self, npoints):
+        arrowed_line(self.coordinates, 0.1, 5, 0.5, 0.3)
+
+    def time_stipple_coordinates(self, npoints):
+        stipple_coordinates(self.coordinates, (0.5, 0.25))
+
+    def time_write(self, npoints):
+        output_bytes(line(self.coordinates, 0.1))
+
+    def track_output_bytes(self, npoints):
+        return output_bytes(line(self.coordinates, 0.1))
+    track_output_bytes.unit = 'bytes'
+
+class ManyLines:
+    """Field-line style plots: many short polylines given as ragged arrays."""
+    params = [10**2, 10**3, 10**4, 5*10**4]
+    param_names = ['npolylines']
+    timeout = 600
+
+    def setup(self, npolylines):
+        counts = np.random.default_rng(0).integers(2, 30, npolylines)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.points = random_walk(self.offsets[-1])
+
+    def time_lines(self, npolylines):
+        polylines(self.points, self.offsets, 0.1)
+
+    def time_stippled_lines(self, npolylines):
+        polylines(self.points, self.offsets, 0.1, stipple=(0.5, 0.25))
+
+    def time_arrowed_lines(self, npolylines):
+        polylines(self.points, self.offsets, 0.1, arrows=(5, 0.5, 0.3))
+
+    def time_sweeps(self, npolylines):
+        polylines(self.points, self.offsets, 0.1, sweep=True)
+
+    def track_output_bytes_sweeps(self, npolylines):
+        return output_bytes(polylines(self.points, self.offsets, 0.1, sweep=True))
+    track_output_bytes_sweeps.unit = 'bytes'
+
+class Wireframe:
+    """Grid lines of an n x n surface drawn as one batch of lines."""
+    params = [10**2, 500, 10**3]
+    param_names = ['n']
+    timeout = 600
+
+    def setup(self, n):
+        self.grid = surface_grid(n)
+
+    def time_grid_lines(self, n):
+        grid_lines(*self.grid)
+
+    def time_wireframe(self, n):
+        wireframe(*self.grid, 0.01)
+
+    def time_wireframe_sweeps(self, n):
+        wireframe(*self.grid, 0.01, sweep=True)
+
+    def track_output_bytes_every_10(self, n):
+        return output_bytes(wireframe(*self.grid, 0.01, every=10))
+    track_output_bytes_every_10.unit = 'bytes'
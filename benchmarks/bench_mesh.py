@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks of triangle mesh generation and serialization (asv conventions)."""
+
+import os
+import tempfile
+import numpy as np
+
+from povray import triangulate_grid, Mesh2, surface, marching_cubes, decimation
+from .common import output_bytes, write_throughput, surface_grid
+
+class TriangulateGrid:
+    params = [10**2, 500, 10**3, 4000]
+    param_names = ['n']
+    timeout = 600
+
+    def setup(self, n):
+        self.grid = surface_grid(n)
+
+    def time_triangulate_grid(self, n):
+        triangulate_grid(*self.grid)
+
+    def peakmem_triangulate_grid(self, n):
+        triangulate_grid(*self.grid)
+
+class Mesh:
+    params = [10**2, 500, 10**3, 4000]
+    param_names = ['n']
+    timeout = 3600
+
+    def setup(self, n):
+        self.coordinates, self.triangulation = triangulate_grid(*surface_grid(n))
+        self.mesh = Mesh2(self.coordinates, self.triangulation)
+
+    def time_mesh2(self, n):
+        Mesh2(self.coordinates, self.triangulation)
+
+    def peakmem_mesh2(self, n):
+        Mesh2(self.coordinates, self.triangulation)
+
+    def time_write(self, n):
+        output_bytes(self.mesh)
+
+    def peakmem_write(self, n):
+        output_bytes(self.mesh)
+
+    def track_output_bytes(self, n):
+        return output_bytes(self.mesh)
+    track_output_bytes.unit = 'bytes'
+
+    def track_write_throughput(self, n):
+        return write_throughput(self.mesh)
+    track_write_throughput.unit = 'MB/s'
+
+class HeightFieldSurface:
+    """Uniform grids written as a height field (script plus PNG) rather than a mesh2."""
+    params = [10**2, 500, 10**3, 4000]
+    param_names = ['n']
+    timeout = 600
+
+    def setup(self, n):
+        self.grid = surface_grid(n)
+        self.directory = tempfile.TemporaryDirectory()
+        self.image = os.path.join(self.directory.name, 'heights.png')
+
+    def teardown(self, n):
+        self.directory.cleanup()
+
+    def time_write(self, n):
+        output_bytes(surface(*self.grid, image=self.image))
+
+    def track_output_bytes(self, n):
+        script = output_bytes(surface(*self.grid, image=self.image))
+        return script + os.path.getsize(self.image)
+    track_output_bytes.unit = 'bytes'
+
+class Decimate:
+    """Quadric-error simplification of a grid surface to a tenth of its triangles."""
+    params = [50, 100, 200]
+    param_names = ['n']
+    timeout = 1200
+
+    def setup(self, n):
+        self.coordinates, self.triangulation = triangulate_grid(*surface_grid(n))
+        self.target = len(self.triangulation) // 10
+
+    def time_decimate(self, n):
+        decimation.decimate(self.coordinates, self.triangulation, self.target, report_error=False)
+
+    def track_max_error(self, n):
+        return decimation.decimate(self.coordinates, self.triangulation, self.target)[2]['max_error']
+    track_max_error.unit = 'length'
+
+    def track_output_bytes(self, n):
+        return output_bytes(Mesh2(self.coordinates, self.triangulation, decimate=self.target))
+    track_output_bytes.unit = 'bytes'
+
+class MarchingCubes:
+    """Iso-surface of a sphere sampled on an n^3 grid."""
+    params = [32, 64, 128, 256]
+    param_names = ['n']
+    timeout = 600
+
+    def setup(self, n):
+        x = np.linspace(-1, 1, n)
+        self.volume = 1 - np.sqrt(x[:,None,None]**2 + x[None,:,None]**2 + x[None,None,:]**2)
+
+    def time_marching_cubes(self, n):
+        marching_cubes(self.volume, 0.2)
+
+    def peakmem_marching_cubes(self, n):
+        marching_cubes(self.volume, 0.2)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks of ball and stick models (asv conventions)."""
+
+from povray import molecules
+from .common import output_bytes, write_throughput, random_particles
+
+class BallAndStick:
+    params = [10**2, 10**3, 10**4, 10**5, 10**6]
+    param_names = ['n']
+    timeout = 600
+
+    def setup(self, n):
+        self.coordinates = random_particles(n)
+        self.model = molecules.ball_and_stick(self.coordinates, 0.5, 0.1)
+
+    def time_find_bonds(self, n):
+        molecules.find_bonds(self.coordinates)
+
+    def time_ball_and_stick(self, n):
+        molecules.ball_and_stick(self.coordinates, 0.5, 0.1)
+
+    def peakmem_ball_and_stick(self, n):
+        molecules.ball_and_stick(self.coordinates, 0.5, 0.1)
+
+    def time_write(self, n):
+        output_bytes(self.model)
+
+    def peakmem_write(self, n):
+        output_bytes(self.model)
+
+    def track_output_bytes(self, n):
+        return output_bytes(self.model)
+    track_output_bytes.unit = 'bytes'
+
+    def track_write_throughput(self, n):
+        return write_throughput(self.model)
+    track_write_throughput.unit = 'MB/s'
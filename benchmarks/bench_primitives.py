@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks of the memory footprint and construction rate of individual nodes (asv conventions)."""
+
+import time
+import tracemalloc
+import numpy as np
+from povray import Sphere, Union
+from povray.pigments import Colour
+
+n = 10**6
+
+def construct(kind, positions):
+    if kind == 'Sphere': return [Sphere(x, 0.5) for x in positions]
+    elif kind == 'Colour': return [Colour('White') for x in positions]
+    else: return [Union() for x in positions]
+
+class Nodes:
+    params = ['Sphere', 'Colour', 'Union']
+    param_names = ['kind']
+    timeout = 300
+
+    def setup(self, kind):
+        self.positions = np.random.default_rng(0).random((n, 3))
+
+    def time_construct(self, kind):
+        construct(kind, self.positions)
+
+    def track_construction_rate(self, kind):
+        start = time.perf_counter()
+        construct(kind, self.positions)
+        return n / (time.perf_counter() - start)
+    track_construction_rate.unit = 'nodes/s'
+
+    def track_bytes_per_node(self, kind):
+        tracemalloc.start()
+        try:
+            nodes = construct(kind, self.positions)
+            return tracemalloc.get_traced_memory()[0] / len(nodes)
+        finally:
+            tracemalloc.stop()
+    track_bytes_per_node.unit = 'bytes'
+
+if __name__ == '__main__':
+    benchmark = Nodes()
+    for kind in Nodes.params:
+        benchmark.setup(kind)
+        print('{:<8s} {:8.1f} bytes/node {:12.0f} nodes/s'.format(
+            kind, benchmark.track_bytes_per_node(kind), benchmark.track_construction_rate(kind)))
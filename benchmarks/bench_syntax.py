@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks for formatting numpy arrays as povray vector lists (asv conventions)."""
+
+import time
+import numpy as np
+from povray.syntax import pov_vector, pov_vectors
+
+def random_vectors(n, dtype):
+    rng = np.random.default_rng(0)
+    if dtype == 'int': return rng.integers(0, n, size=(n, 3))
+    else: return rng.random((n, 3))
+
+class FormatVectors:
+    params = ([10**3, 10**5, 10**6], ['float', 'int'], [None, 17, 6])
+    param_names = ['n', 'dtype', 'precision']
+
+    def setup(self, n, dtype, precision):
+        self.vectors = random_vectors(n, dtype)
+
+    def time_pov_vectors(self, n, dtype, precision):
+        pov_vectors(self.vectors, precision)
+
+    def track_throughput(self, n, dtype, precision):
+        start = time.perf_counter()
+        text = pov_vectors(self.vectors, precision)
+        return len(text) / (time.perf_counter() - start) / 1e6
+    track_throughput.unit = 'MB/s'
+
+class FormatVectorsPerRow:
+    """Reference: the original one-call-per-row conversion."""
+    params = ([10**3, 10**5], ['float', 'int'])
+    param_names = ['n', 'dtype']
+
+    def setup(self, n, dtype):
+        self.vectors = random_vectors(n, dtype)
+
+    def time_pov_vector(self, n, dtype):
+        ', '.join([pov_vector(x) for x in self.vectors])
+
+    def track_throughput(self, n, dtype):
+        start = time.perf_counter()
+        text = ', '.join([pov_vector(x) for x in self.vectors])
+        return len(text) / (time.perf_counter() - start) / 1e6
+    track_throughput.unit = 'MB/s'
+
+if __name__ == '__main__':
+    for n in [10**5, 10**6]:
+        for dtype in ['float', 'int']:
+            vectors = random_vectors(n, dtype)
+            for label, fmt in [('per-row', lambda v: ', '.join([pov_vector(x) for x in v])),
+                               ('vectorized', pov_vectors),
+                               ('vectorized (17 s.f.)', lambda v: pov_vectors(v, 17)),
+                               ('vectorized (6 s.f.)', lambda v: pov_vectors(v, 6))]:
+                start = time.perf_counter()
+                text = fmt(vectors)
+                elapsed = time.perf_counter() - start
+                print('n={:<8d} {:<6s} {:<20s} {:8.1f} MB/s'.format(n, dtype, label, len(text) / elapsed / 1e6))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks of Primitive.write on trees of many small nodes (asv conventions)."""
+
+from povray import Union, Sphere
+from povray.pigments import Pigment, Colour, Transmit
+from .common import output_bytes, write_throughput, random_particles
+
+def scene_tree(n):
+    """Tree of n individually coloured spheres."""
+    return Union(*[Sphere(x, 0.5, Pigment(Colour('White'), Transmit(0.5))) for x in random_particles(n)])
+
+class WriteTree:
+    params = [10**3, 10**4, 10**5]
+    param_names = ['n']
+    timeout = 600
+
+    def setup(self, n):
+        self.tree = scene_tree(n)
+
+    def time_write(self, n):
+        output_bytes(self.tree)
+
+    def peakmem_write(self, n):
+        output_bytes(self.tree)
+
+    def time_repr(self, n):
+        repr(self.tree)
+
+    def track_output_bytes(self, n):
+        return output_bytes(self.tree)
+    track_output_bytes.unit = 'bytes'
+
+    def track_write_throughput(self, n):
+        return write_throughput(self.tree)
+    track_write_throughput.unit = 'MB/s'
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Helpers shared by the benchmarks."""
+
+import time
+import numpy as np
+
+class CountingSink:
+    """Output stream discarding everything written to it, keeping count of the characters."""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, s):
+        self.size += len(s)
+
+def output_bytes(obj):
+    """Size of the script generated by a primitive, without keeping it in memory."""
+    sink = CountingSink()
+    obj.write(sink)
+    return sink.size
+
+def write_throughput(obj):
+    """Rate (in MB/s) at which a primitive generates its script."""
+    sink = CountingSink()
+    start = time.perf_counter()
+    obj.write(sink)
+    return sink.size / (time.perf_counter() - start) / 1e6
+
+def surface_grid(n):
+    """Meshgrid coordinates of a smooth n x n surface."""
+    x = np.linspace(0, 1, n)
+    X, Y = np.meshgrid(x, x)
+    return X, Y, X*(1-X) * Y*(1-Y)
+
+def random_particles(n, density=0.5, seed=0):
+    """Uniformly distributed particles, giving a few bonds per particle at unit bond length."""
+    return np.random.default_rng(seed).random((n, 3)) * (n / density)**(1/3)
+
+def random_walk(n, seed=0):
+    """Polyline of n points following a random walk with unit steps on average."""
+    return np.cumsum(np.random.default_rng(seed).normal(size=(n, 3)) / np.sqrt(3), axis=0)
@@ -19,3 +19,5 @@ from .primitives import *
 from .directives import *
 from .mesh import *
 from .lines import *
+from .instancing import *
+from .parallel import *
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Content-addressed cache of rendered images, keyed on everything that determines the image."""
+
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import Counter
+
+# Files a script pulls in: includes are scanned recursively, while data files (#fopen), images
+# (e.g. for height fields or image maps), density files and fonts are only hashed.
+file_reference = re.compile(r'(#include|#fopen\s+\w+|\b(?:png|gif|tga|iff|ppm|pgm|jpeg|tiff|exr|hdr|sys|df3|ttf))'
+                            r'\s+"([^"]+)"')
+
+def hash_file(path, hasher, block_size=1<<20):
+    """Feed the contents of a file into a hashlib object block by block."""
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''): hasher.update(block)
+
+class ScriptHasher:
+    """Writable sink hashing a script as it is streamed (e.g. by Primitive.write).
+
+    Only the running digest and a short tail of the text are kept, so scenes of any size are hashed
+    in constant memory. Files the script refers to (see file_reference) are recorded along the way.
+    The text can also be passed on to another stream, so the script is saved as it is hashed.
+    """
+
+    def __init__(self, tail=1024, stream=None):
+        """
+        Args:
+            tail: characters carried over between writes so that directives split across them are found.
+            stream: text stream each write is also passed on to (None to only hash the script).
+        """
+        self.hasher = hashlib.sha256()
+        self.references = {}
+        self.tail = tail
+        self.carry = ''
+        self.stream = stream
+
+    def write(self, s):
+        if self.stream is not None: self.stream.write(s)
+        self.hasher.update(s.encode())
+        text = self.carry + s
+        for directive, path in file_reference.findall(text):
+            self.references.setdefault(path, directive == '#include')
+        self.carry = text[-self.tail:]
+        return len(s)
+
+def script_key(scene=None, settings=(), cwd=None, input=None, stream=None):
+    """Digest of a render: its script, the files the script uses, and the render settings.
+
+    Args:
+        scene: primitive whose script is hashed as it is streamed.
+        settings: render settings that affect the image (size, options, etc.).
+        cwd: directory relative include, data and image files are resolved from.
+        input: scene file hashed instead of a scene.
+        stream: text stream the scene's script is also written to while it is hashed.
+    Returns:
+        Hexadecimal digest.
+    """
+    sink = ScriptHasher(stream=stream)
+    if scene is not None: scene.write(sink)
+    else:
+        with open(os.path.join(cwd or '', input)) as f:
+            for line in f: sink.write(line)
+    sink.hasher.update(repr(list(settings)).encode())
+
+    # Hash the contents of referenced files (following nested includes); files povray finds in its
+    # own library path are only represented by their names in the script.
+    pending, seen = list(sink.references.items()), set()
+    while pending:
+        path, include = pending.pop(0)
+        resolved = os.path.join(cwd or '', path)
+        if path in seen or not os.path.isfile(resolved): continue
+        seen.add(path)
+        sink.hasher.update(path.encode())
+        hash_file(resolved, sink.hasher)
+        if include:
+            nested = ScriptHasher()
+            with open(resolved, errors='replace') as f:
+                for line in f: nested.write(line)
+            pending += list(nested.references.items())
+
+    return sink.hasher.hexdigest()
+
+class RenderCache:
+    """On-disk store of rendered images addressed by script_key, evicting least recently used images.
+
+    Reruns of a pipeline render the same scenes over and over; with a cache only scenes whose
+    script, referenced files or settings changed are passed on to povray.
+
+    The order in which images were last used is tracked with an access counter, which is saved in
+    an index file alongside the images so that it carries over to later sessions. Images missing
+    from the index (e.g. added by another process) are treated as the least recently used.
+    """
+
+    suffix = '.image'
+    script_suffix = '.pov'
+    index_name = 'index'
+
+    def __init__(self, directory, max_entries=None, max_bytes=None):
+        """
+        Args:
+            directory: where cached images are kept (created if necessary).
+            max_entries: maximum number of images kept.
+            max_bytes: maximum total size of the images kept.
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.scripts = Counter()
+        os.makedirs(directory, exist_ok=True)
+        self.load_index()
+
+    key = staticmethod(script_key)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load_index(self):
+        """Read the order images were last used in, as saved by save_index."""
+        try:
+            with open(os.path.join(self.directory, self.index_name)) as f: keys = f.read().split()
+        except FileNotFoundError: keys = []
+        self.accesses = {key: k for k, key in enumerate(keys)}
+        self.clock = len(keys)
+
+    def save_index(self):
+        """Write the order images were last used in, least recently used first (called with the lock held)."""
+        handle, staging = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'w') as f:
+            for key in sorted(self.accesses, key=self.accesses.get): f.write(key + '\n')
+        os.replace(staging, os.path.join(self.directory, self.index_name))
+
+    def touch(self, key):
+        """Mark an image as the most recently used."""
+        with self.lock:
+            self.accesses[key] = self.clock
+            self.clock += 1
+            self.save_index()
+
+    def write_script(self, scene, settings=(), cwd=None):
+        """Write a scene's script into the cache directory, computing its key on the way.
+
+        The script is generated once, streaming into a temporary file while it is hashed, and the
+        file is then renamed after its key. It is kept until every user calls release_script.
+
+        Args:
+            scene: primitive whose script is written.
+            settings, cwd: as for script_key.
+        Returns:
+            The key and the path of the script.
+        """
+        handle, staging = tempfile.mkstemp(dir=self.directory, suffix=self.script_suffix)
+        try:
+            with os.fdopen(handle, 'w') as f: key = self.key(scene, settings, cwd, stream=f)
+        except BaseException:
+            os.remove(staging)
+            raise
+        path = os.path.join(self.directory, key + self.script_suffix)
+        with self.lock:
+            self.scripts[key] += 1
+            os.replace(staging, path)
+        return key, path
+
+    def release_script(self, key):
+        """Remove a script written by write_script once it is no longer used."""
+        with self.lock:
+            self.scripts[key] -= 1
+            if self.scripts[key] > 0: return
+            del self.scripts[key]
+            try: os.remove(os.path.join(self.directory, key + self.script_suffix))
+            except FileNotFoundError: pass
+
+    def fetch(self, key, output):
+        """Copy a cached image to output.
+
+        Returns:
+            True on a hit, False on a miss.
+        """
+        try: shutil.copyfile(self.path(key), output)
+        except FileNotFoundError:
+            with self.lock: self.misses += 1
+            return False
+        with self.lock: self.hits += 1
+        self.touch(key)
+        return True
+
+    def store(self, key, output):
+        """Add a freshly rendered image to the cache, evicting old images if over the limits."""
+        handle, staging = tempfile.mkstemp(dir=self.directory)
+        os.close(handle)
+        shutil.copyfile(output, staging)
+        os.replace(staging, self.path(key))
+        self.touch(key)
+        self.evict()
+
+    def entries(self):
+        """(last access, size, path) of every cached image, least recently used first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.suffix): continue
+            try: size = entry.stat().st_size
+            except FileNotFoundError: continue
+            entries.append((self.accesses.get(entry.name[:-len(self.suffix)], -1), size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove least recently used images until the cache is within its limits."""
+        if self.max_entries is None and self.max_bytes is None: return
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries) or
+                           (self.max_bytes is not None and total > self.max_bytes)):
+            _, size, path = entries.pop(0)
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            total -= size
+            with self.lock:
+                self.evictions += 1
+                self.accesses.pop(os.path.basename(path)[:-len(self.suffix)], None)
+        with self.lock: self.save_index()
+
+    def clear(self):
+        for _, _, path in self.entries(): os.remove(path)
+        with self.lock:
+            self.accesses.clear()
+            self.save_index()
+
+    @property
+    def stats(self):
+        """Dictionary of hit/miss statistics and the current size of the cache."""
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    hit_rate=self.hits/lookups if lookups else 0., entries=len(entries),
+                    bytes=sum(size for _, size, _ in entries))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Reorganise large flat unions and merges into spatial hierarchies with explicit bounds.
+
+povray tests a ray against every child of a union or merge, so a flat combination of many thousands
+of objects is slow to render, and a merge must also test every intersection against all of its
+other children. Nested combinations bounded by boxes let most rays skip whole groups of objects.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .primitives import *
+from .pigments import Pigment, Finish, Interior
+from .directives import Fopen, Fclose, read_rows
+
+# Children that modify a combination as a whole rather than being objects within it.
+modifiers = (Attribute, Pigment, Finish, Interior)
+
+def bounded_hierarchy(indices, lower, upper, combine, leaf, leaf_size):
+    """Build a k-d tree over boxes, splitting at the median centre along the widest axis.
+
+    Args:
+        indices: indices of the boxes to place in the tree.
+        lower, upper: corners of all of the boxes.
+        combine: class combining the children of each node (e.g. Union).
+        leaf: function creating the objects of a leaf from the indices of its boxes.
+        leaf_size: maximum number of boxes in a leaf.
+    Returns:
+        Root of the tree, each node bounded by the box enclosing its contents.
+    """
+    bound = BoundedBy(Box(lower[indices].min(axis=0), upper[indices].max(axis=0)))
+    if len(indices) <= leaf_size: return combine(*leaf(indices), bound)
+
+    centres = lower[indices] + upper[indices]
+    axis = np.argmax(np.ptp(centres, axis=0))
+    order = indices[np.argsort(centres[:,axis], kind='stable')]
+    half = len(order) // 2
+    return combine(bounded_hierarchy(order[:half], lower, upper, combine, leaf, leaf_size),
+                   bounded_hierarchy(order[half:], lower, upper, combine, leaf, leaf_size), bound)
+
+def overlapping_components(centres, radii):
+    """Label the connected components of a set of spheres, joining spheres that overlap.
+
+    Returns:
+        (n) int array of component labels.
+    """
+    pairs = cKDTree(centres).query_pairs(2*np.max(radii), output_type='ndarray')
+    i, j = pairs.T
+    touching = np.linalg.norm(centres[i] - centres[j], axis=1) < radii[i] + radii[j]
+    n = len(centres)
+    graph = coo_matrix((np.ones(np.count_nonzero(touching)), (i[touching], j[touching])), shape=(n, n))
+    return connected_components(graph, directed=False)[1]
+
+def cluster(tree, leaf_size=32, min_items=256):
+    """Spatially cluster the items of batches (see Batch) in large unions and merges.
+
+    Each union or merge whose children are batches (plus pigments, finishes, transformations and
+    so on) holding at least min_items items in total is rearranged in place into a k-d tree of
+    bounded unions. For a merge, items whose bounding spheres overlap are kept together in
+    (bounded, nested) merges, so interior surfaces are still removed where they exist, while
+    separate items are combined with the cheaper union. The rendered image is unchanged. Batches
+    written to a data file keep that mode with the same single file: it is rewritten with the items
+    in the order the clusters appear in the script, and opened once before the hierarchy, so that
+    each cluster just reads its own run of rows from it.
+
+    Args:
+        tree: root primitive (e.g. a Scene).
+        leaf_size: maximum number of items (or groups of overlapping items) in a leaf of the tree.
+        min_items: minimum number of items for a combination to be rearranged.
+    Returns:
+        Dictionary with the number of combinations rearranged ('nodes'), leaves of their hierarchies
+        ('clusters'), and items kept in merges because they overlap others ('merged').
+    """
+    stats = dict(nodes=0, clusters=0, merged=0)
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if node.generated_children: continue
+        batches = [child for child in node.children if isinstance(child, Batch)]
+        others = [child for child in node.children if not isinstance(child, Batch)]
+        total = sum(len(batch) for batch in batches)
+        if (not isinstance(node, (Union, Merge)) or total < min_items or
+            not all(isinstance(child, modifiers) for child in others)):
+            stack += [child for child in node.children if hasattr(child, 'children')]
+            continue
+
+        owner = np.repeat(np.arange(len(batches)), [len(batch) for batch in batches])
+        local = np.concatenate([np.arange(len(batch)) for batch in batches])
+        spheres = [batch.bounding_spheres() for batch in batches]
+        boxes = [batch.bounding_boxes() for batch in batches]
+        centres = np.concatenate([c for c, r in spheres])
+        radii = np.concatenate([np.broadcast_to(r, len(c)) for c, r in spheres])
+        lower = np.concatenate([lo for lo, hi in boxes])
+        upper = np.concatenate([hi for lo, hi in boxes])
+
+        # Items of batches written to data files, in the order their clusters are created (which is
+        # the order they are written out in).
+        macros = [batch.data_macro() if batch.data_file is not None else None for batch in batches]
+        sequences = [[] for batch in batches]
+        def take(b, indices):
+            if macros[b] is None: return batches[b].take(indices)
+            sequences[b].append(indices)
+            name, directives, call, nvalues = macros[b]
+            return read_rows(name, len(indices), nvalues, call)
+
+        def items(indices):
+            indices = np.sort(indices)
+            return [take(b, local[indices[owner[indices] == b]]) for b in np.unique(owner[indices])]
+
+        # Merged items are grouped into units of overlapping items; otherwise each item is a unit.
+        if isinstance(node, Merge): labels = overlapping_components(centres, radii)
+        else: labels = np.arange(total)
+        order = np.argsort(labels, kind='stable')
+        starts = np.flatnonzero(np.diff(labels[order], prepend=-1))
+        members = np.split(order, starts[1:])
+        unit_lower = np.minimum.reduceat(lower[order], starts)
+        unit_upper = np.maximum.reduceat(upper[order], starts)
+
+        def unit_leaf(units):
+            singles = np.concatenate([members[u] for u in units if len(members[u]) == 1] or [np.array([], int)])
+            objects = items(singles) if len(singles) else []
+            for u in units:
+                if len(members[u]) == 1: continue
+                stats['merged'] += len(members[u])
+                objects.append(bounded_hierarchy(members[u], lower, upper, Merge, items, leaf_size))
+            stats['clusters'] += 1
+            return objects
+
+        root = bounded_hierarchy(np.arange(len(members)), unit_lower, unit_upper, Union, unit_leaf, leaf_size)
+
+        opening, closing = [], []
+        for batch, macro, sequence in zip(batches, macros, sequences):
+            if macro is None or not sequence: continue
+            batch.take(np.concatenate(sequence), batch.data_file)
+            name, directives, call, nvalues = macro
+            opening += directives + [Fopen('{}_file'.format(name), batch.data_file)]
+            closing += [Fclose('{}_file'.format(name))]
+
+        # Left as the only object in the original combination, the hierarchy renders the same for
+        # a merge, as it has no other children whose interiors could hide its surfaces.
+        node.children = opening + [root] + others + closing
+        stats['nodes'] += 1
+    return stats
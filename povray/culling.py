@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Remove objects that cannot be seen before they are written, so povray never has to parse them."""
+
+import numpy as np
+from collections import namedtuple
+from scipy.spatial import cKDTree
+
+from .primitives import Batch, SphereBatch, Transformation
+from .directives import Declare, Macro, For
+
+CameraView = namedtuple('CameraView', ['location', 'look_at', 'sky', 'right', 'up', 'perspective'])
+CameraView.__doc__ = """Numerical parameters of a povray camera (as given to its location, look_at, etc.).
+
+Args:
+    location: position of the camera.
+    look_at: point the camera is aimed at.
+    sky: up direction of the camera.
+    right: right vector, whose length sets the width of the view.
+    up: up vector, whose length sets the height of the view.
+    perspective: perspective projection if True, otherwise orthographic.
+"""
+
+def view_basis(view):
+    """Orthonormal axes of a camera, oriented as povray does for a look_at.
+
+    Returns:
+        forward, right, up: unit vectors.
+    """
+    location, look_at, sky = [np.asarray(v, dtype=float) for v in view[:3]]
+    forward = look_at - location
+    forward /= np.linalg.norm(forward)
+    right = np.cross(sky, forward)
+    if np.allclose(right, 0): raise ValueError('camera sky is parallel to its viewing direction')
+    right /= np.linalg.norm(right)
+    return forward, right, np.cross(forward, right)
+
+def frustum_mask(centres, radii, view, margin=0.):
+    """Find spheres which intersect the volume seen by a camera.
+
+    For a perspective camera the view is a pyramid with its apex at the location, whose sides pass
+    through the edges of the right and up vectors placed a unit distance ahead (povray's default
+    direction); for an orthographic camera it is a box of the size of the right and up vectors.
+
+    Args:
+        centres: (n x 3) sphere centres.
+        radii: (n) sphere radii.
+        view: CameraView.
+        margin: extra distance by which spheres may lie outside the view and still be kept.
+    Returns:
+        (n) boolean array, True for spheres that may be visible.
+    """
+    forward, right, up = view_basis(view)
+    half_width = 0.5*np.linalg.norm(view.right)
+    half_height = 0.5*np.linalg.norm(view.up)
+    reach = np.asarray(radii) + margin
+
+    relative = np.asarray(centres) - np.asarray(view.location, dtype=float)
+    z = relative @ forward
+    x = np.abs(relative @ right)
+    y = np.abs(relative @ up)
+
+    visible = z > -reach
+    if view.perspective:
+        # Distance of the centres outside each side plane of the pyramid.
+        visible &= (x - half_width*z) / np.hypot(1, half_width) < reach
+        visible &= (y - half_height*z) / np.hypot(1, half_height) < reach
+    else:
+        visible &= (x - half_width < reach) & (y - half_height < reach)
+    return visible
+
+def contained_mask(centres, radii):
+    """Find spheres lying entirely inside another sphere (of two identical spheres, the later one).
+
+    Args:
+        centres: (n x 3) sphere centres.
+        radii: (n) sphere radii.
+    Returns:
+        (n) boolean array, True for contained spheres.
+    """
+    centres = np.asarray(centres)
+    radii = np.broadcast_to(radii, len(centres))
+    contained = np.zeros(len(centres), dtype=bool)
+    if not len(centres): return contained
+
+    # A sphere can only contain another within the difference of their radii.
+    reach = np.max(radii) - np.min(radii)
+    pairs = cKDTree(centres).query_pairs(reach, output_type='ndarray')
+    if not len(pairs): return contained
+    i, j = pairs.T
+    distances = np.linalg.norm(centres[i] - centres[j], axis=1)
+    i_in_j = distances + radii[i] <= radii[j]
+    j_in_i = distances + radii[j] <= radii[i]
+    # Identical spheres contain each other, so only the one with the larger index is removed.
+    contained[i[i_in_j & ~j_in_i]] = True
+    contained[np.maximum(i, j)[i_in_j & j_in_i]] = True
+    contained[j[j_in_i & ~i_in_j]] = True
+    return contained
+
+# Directives whose contents may be instantiated anywhere (and any number of times), so are left alone.
+placed_elsewhere = (Declare, Macro, For)
+
+def is_placed(node):
+    """Whether a node's children are written where they are in the scene's coordinates.
+
+    Children of transformed objects, declarations, macros and loops could end up anywhere, so
+    batches inside them are never culled.
+    """
+    if node.generated_children or isinstance(node, placed_elsewhere): return False
+    return not any(isinstance(child, Transformation) for child in node.children)
+
+def cull(tree, view, contained=False, margin=0.):
+    """Drop the items of batches (see Batch) in a tree which the camera cannot see.
+
+    The tree is modified in place. Objects outside the view can still show up in reflections or
+    cast shadows into it, which a margin can allow for. Only batches in untransformed parts of the
+    tree are culled (see is_placed).
+
+    Args:
+        tree: root primitive (e.g. a Scene).
+        view: CameraView.
+        contained: also remove spheres entirely inside other spheres of the same batch; only do this
+                   when they are merged (or opaque), or they would show through transparent spheres.
+        margin: extra distance by which objects may lie outside the view and still be kept.
+    Returns:
+        Dictionary with the number of items removed for lying 'outside' the view, or being
+        'contained' in others.
+    """
+    removed = dict(outside=0, contained=0)
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if not is_placed(node): continue
+        for index, child in enumerate(node.children):
+            if not isinstance(child, Batch):
+                if hasattr(child, 'children'): stack.append(child)
+                continue
+
+            centres, radii = child.bounding_spheres()
+            keep = frustum_mask(centres, radii, view, margin)
+            removed['outside'] += int(np.count_nonzero(~keep))
+            if contained and isinstance(child, SphereBatch):
+                buried = contained_mask(centres, radii) & keep
+                removed['contained'] += int(np.count_nonzero(buried))
+                keep &= ~buried
+            if keep.all(): continue
+
+            node.children[index] = child.take(np.flatnonzero(keep), child.data_file)
+    return removed
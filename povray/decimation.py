@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Simplify triangle meshes by collapsing edges in order of their quadric error (Garland & Heckbert)."""
+
+import heapq
+import numpy as np
+from scipy.spatial import cKDTree
+
+def face_planes(coordinates, triangulation):
+    """Planes of each triangle as (nx, ny, nz, d) with n.x + d = 0 and unit normal n.
+
+    Degenerate triangles have a zero plane, so they contribute nothing to quadrics.
+    """
+    A, B, C = coordinates[triangulation.T]
+    normals = np.cross(B - A, C - A)
+    norm = np.linalg.norm(normals, axis=1)
+    norm[norm == 0] = np.inf
+    normals /= norm[:,None]
+    return np.column_stack((normals, -np.sum(normals*A, axis=1)))
+
+def triangle_normals(triangles):
+    """Unnormalised normals of triangles given as (... x 3 x 3) arrays of corner coordinates."""
+    u = triangles[...,1,:] - triangles[...,0,:]
+    v = triangles[...,2,:] - triangles[...,0,:]
+    return u[...,[1,2,0]]*v[...,[2,0,1]] - u[...,[2,0,1]]*v[...,[1,2,0]]
+
+def vertex_quadrics(coordinates, triangulation):
+    """Sum of the plane quadrics (p p^T) of the triangles around each vertex.
+
+    Returns:
+        (n x 4 x 4) array of quadrics, so that v^T Q v is the sum of the squared distances of
+        v = (x, y, z, 1) from the planes.
+    """
+    planes = face_planes(coordinates, triangulation)
+    quadrics = (planes[:,:,None] * planes[:,None,:]).reshape(-1, 16)
+    Q = np.empty((len(coordinates), 16))
+    for k in range(16):
+        Q[:,k] = sum(np.bincount(triangulation[:,c], quadrics[:,k], minlength=len(coordinates)) for c in range(3))
+    return Q.reshape(-1, 4, 4)
+
+def boundary_vertices(triangulation, n):
+    """Mask of vertices on edges belonging to other than two triangles (open or non-manifold edges)."""
+    edges = np.sort(triangulation[:,[0,1,1,2,2,0]].reshape(-1, 2), axis=1)
+    edges, counts = np.unique(edges, axis=0, return_counts=True)
+    boundary = np.zeros(n, dtype=bool)
+    boundary[edges[counts != 2].reshape(-1)] = True
+    return boundary
+
+def collapse_targets(Q, coordinates, keep, remove, locked):
+    """Best position and quadric error for merging each vertex remove into keep.
+
+    The position minimising the combined quadric is used when it is well defined and lies near
+    the edge; otherwise the best of the two end points and the midpoint. Locked vertices do not move.
+
+    Returns:
+        positions: (k x 3) positions of the merged vertices.
+        costs: (k) quadric errors at those positions.
+    """
+    q = Q[keep] + Q[remove]
+    a, b = coordinates[keep], coordinates[remove]
+    candidates = [a, b, 0.5*(a + b)]
+
+    A = q[:,:3,:3]
+    scale = np.trace(A, axis1=1, axis2=2) / 3
+    solvable = np.abs(np.linalg.det(A)) > 1e-6 * scale**3
+    optimum = candidates[2].copy()
+    if np.any(solvable):
+        optimum[solvable] = np.linalg.solve(A[solvable], -q[solvable,:3,3,None])[...,0]
+    far = np.linalg.norm(optimum - candidates[2], axis=1) > np.linalg.norm(b - a, axis=1)
+    optimum[~solvable | far] = candidates[2][~solvable | far]
+    candidates.append(optimum)
+
+    candidates = np.stack(candidates, axis=1)
+    homogeneous = np.concatenate((candidates, np.ones(candidates.shape[:2] + (1,))), axis=2)
+    costs = np.einsum('kci,kij,kcj->kc', homogeneous, q, homogeneous)
+    costs[locked[keep],1:] = np.inf
+    best = np.argmin(costs, axis=1)
+    rows = np.arange(len(keep))
+    return candidates[rows,best], np.maximum(costs[rows,best], 0)
+
+def point_triangle_distance(points, a, b, c):
+    """Distance of each point from the corresponding triangle (a, b, c)."""
+    def segment_distance(p, s, e):
+        d = e - s
+        length2 = np.sum(d*d, axis=1)
+        length2[length2 == 0] = 1
+        t = np.clip(np.sum((p - s)*d, axis=1) / length2, 0, 1)
+        return np.linalg.norm(p - s - t[:,None]*d, axis=1)
+
+    normal = np.cross(b - a, c - a)
+    area2 = np.sum(normal*normal, axis=1)
+    nonzero = area2 > 0
+    area2[~nonzero] = 1
+    # Barycentric coordinates of the projection of each point onto its triangle's plane.
+    w = points - a
+    u = np.sum(np.cross(w, c - a)*normal, axis=1) / area2
+    v = np.sum(np.cross(b - a, w)*normal, axis=1) / area2
+    inside = nonzero & (u >= 0) & (v >= 0) & (u + v <= 1)
+
+    distance = np.minimum(np.minimum(segment_distance(points, a, b), segment_distance(points, b, c)),
+                          segment_distance(points, c, a))
+    distance[inside] = np.abs(np.sum(w*normal, axis=1)[inside]) / np.sqrt(area2[inside])
+    return distance
+
+def decimation_error(original, coordinates, triangulation, nearest=8, chunk_size=2**12):
+    """Largest distance of the original vertices from the simplified mesh.
+
+    Distances to the triangles with the nearest centroids give an upper bound for each vertex; only
+    vertices whose bound exceeds the largest distance found so far are then compared with every
+    triangle that could be closer, found with a k-d tree.
+    """
+    if not len(triangulation): return np.inf
+    corners = coordinates[triangulation]
+    centroids = corners.mean(axis=1)
+    reach = np.linalg.norm(corners - centroids[:,None], axis=2).max()
+    tree = cKDTree(centroids)
+
+    def closest(points, candidates, counts):
+        distance = point_triangle_distance(np.repeat(points, counts, axis=0), *np.moveaxis(corners[candidates], 1, 0))
+        return np.minimum.reduceat(distance, np.cumsum(counts) - counts)
+
+    nearest = min(nearest, len(triangulation))
+    bound = np.empty(len(original))
+    for first in range(0, len(original), chunk_size):
+        points = original[first:first+chunk_size]
+        candidates = tree.query(points, nearest)[1].reshape(len(points), -1)
+        bound[first:first+chunk_size] = closest(points, candidates.reshape(-1), np.full(len(points), nearest))
+
+    error = 0.
+    order = np.argsort(-bound)
+    for first in range(0, len(original), chunk_size):
+        vertices = order[first:first+chunk_size]
+        vertices = vertices[bound[vertices] > error]
+        if not len(vertices): break
+        candidates = tree.query_ball_point(original[vertices], bound[vertices] + reach)
+        counts = np.array([len(c) for c in candidates])
+        distance = closest(original[vertices], np.concatenate(candidates).astype(int), counts)
+        error = max(error, np.minimum(distance, bound[vertices]).max())
+    return float(error)
+
+def decimate(coordinates, triangulation, target=None, max_error=None, report_error=True):
+    """Reduce the number of triangles in a mesh while approximately preserving its shape.
+
+    Edges are collapsed one at a time from a priority queue ordered by quadric error (the sum of
+    squared distances of the merged vertex from the planes of the original triangles it replaces).
+    Quadrics, initial collapse costs and the final error are computed with array operations. Vertices
+    on the boundary of the mesh are locked, so its outline is preserved exactly, and collapses that
+    would change the topology, leave a non-manifold surface or flip triangles are skipped (so e.g. a
+    closed surface is never reduced below a tetrahedron, whatever the target).
+
+    Args:
+        coordinates: (n x 3) vertex coordinates.
+        triangulation: (m x 3) int array giving vertex indices for each triangle.
+        target: number of triangles to reduce the mesh to.
+        max_error: largest quadric error (as a distance) allowed for any collapse.
+        report_error: whether to measure the geometric error of the result (see decimation_error).
+    Returns:
+        coordinates: (n' x 3) vertex coordinates.
+        triangulation: (m' x 3) int array giving vertex indices for each triangle.
+        report: dictionary with the numbers of triangles 'before' and 'after' and the 'max_error',
+                the largest distance of an original vertex from the simplified mesh (None if not measured).
+    """
+    if target is None and max_error is None:
+        raise ValueError('decimation needs a target number of triangles or a maximum error')
+    original = np.asarray(coordinates, dtype=float).reshape(-1, 3)
+    triangulation = np.asarray(triangulation).reshape(-1, 3)
+    dtype = triangulation.dtype
+    n, m = len(original), len(triangulation)
+    if target is None: target = 0
+    max_cost = np.inf if max_error is None else max_error**2
+
+    coordinates = original.copy()
+    Q = vertex_quadrics(coordinates, triangulation)
+    locked = boundary_vertices(triangulation, n)
+
+    faces = triangulation.tolist()
+    face_alive = [True] * m
+    vertex_faces = [set() for _ in range(n)]
+    for f, face in enumerate(faces):
+        for vertex in face: vertex_faces[vertex].add(f)
+    version = [0] * n
+
+    def queue_collapses(keep, remove):
+        # Always keep the locked end of an edge.
+        swap = locked[remove]
+        keep, remove = np.where(swap, remove, keep), np.where(swap, keep, remove)
+        movable = ~(locked[keep] & locked[remove])
+        keep, remove = keep[movable], remove[movable]
+        if not len(keep): return []
+        positions, costs = collapse_targets(Q, coordinates, keep, remove, locked)
+        # Ties (e.g. across flat regions) go to the shortest edges, which keeps triangles well shaped.
+        lengths = np.sum((coordinates[keep] - coordinates[remove])**2, axis=1)
+        return [(cost, length, k, r, version[k], version[r], tuple(p)) for cost, length, k, r, p in
+                zip(costs.tolist(), lengths.tolist(), keep.tolist(), remove.tolist(), positions.tolist())]
+
+    edges = np.unique(np.sort(triangulation[:,[0,1,1,2,2,0]].reshape(-1, 2), axis=1), axis=0)
+    heap = queue_collapses(edges[:,0], edges[:,1])
+    heapq.heapify(heap)
+
+    ntriangles = m
+    while heap and ntriangles > target:
+        cost, length, keep, remove, keep_version, remove_version, position = heapq.heappop(heap)
+        if cost > max_cost: break
+        if version[keep] != keep_version or version[remove] != remove_version: continue
+
+        shared = vertex_faces[keep] & vertex_faces[remove]
+        if not shared: continue
+
+        # Link condition: the only common neighbours are the vertices opposite the collapsing edge,
+        # otherwise the collapse would pinch the surface.
+        def neighbours(vertex):
+            return {w for f in vertex_faces[vertex] for w in faces[f]} - {vertex}
+        opposite = {w for f in shared for w in faces[f]} - {keep, remove}
+        if neighbours(keep) & neighbours(remove) != opposite: continue
+
+        # Never collapse away the last triangles around an edge (e.g. of a lone triangle).
+        changed = list((vertex_faces[keep] | vertex_faces[remove]) - shared)
+        if not changed: continue
+        # Reject collapses leaving two triangles on the same corners, e.g. squashing a tetrahedron
+        # into a two-sided "pillow", which is no longer a manifold surface.
+        merged = {tuple(sorted(keep if vertex == remove else vertex for vertex in faces[f])) for f in changed}
+        if len(merged) < len(changed): continue
+
+        # Reject collapses that flip (or flatten) any of the surviving triangles.
+        corners = np.array([faces[f] for f in changed])
+        triangles = np.stack((coordinates[corners], coordinates[corners]))
+        triangles[1][(corners == keep) | (corners == remove)] = position
+        old, new = triangle_normals(triangles)
+        if np.any(np.sum(old*new, axis=1) <= 1e-3 * np.sum(old*old, axis=1)): continue
+
+        for f in shared:
+            face_alive[f] = False
+            for vertex in faces[f]: vertex_faces[vertex].discard(f)
+        for f in vertex_faces[remove]:
+            faces[f] = [keep if vertex == remove else vertex for vertex in faces[f]]
+        vertex_faces[keep] |= vertex_faces[remove]
+        vertex_faces[remove] = set()
+        ntriangles -= len(shared)
+
+        coordinates[keep] = position
+        Q[keep] += Q[remove]
+        version[keep] += 1
+        version[remove] += 1
+
+        around = np.fromiter(neighbours(keep), dtype=int)
+        for collapse in queue_collapses(np.full(len(around), keep), around): heapq.heappush(heap, collapse)
+
+    triangulation = np.array([face for face, alive in zip(faces, face_alive) if alive], dtype=int).reshape(-1, 3)
+    used = np.zeros(n, dtype=bool)
+    used[triangulation.reshape(-1)] = True
+    coordinates, triangulation = coordinates[used], (np.cumsum(used) - 1)[triangulation]
+
+    report = dict(before=m, after=len(triangulation), max_error=None)
+    if report_error:
+        report['max_error'] = decimation_error(original, coordinates, triangulation)
+    return coordinates, triangulation.astype(dtype), report
@@ -18,6 +18,11 @@
 from .primitives import Primitive
 
 class Macro(Primitive):
+    __slots__ = ('name', 'arguments')
+
+    body_open = ''
+    body_close = '#end'
+
     def __init__(self, name, *args, arguments=[], **kwargs):
         self.name = name
         self.arguments = arguments
@@ -25,50 +30,70 @@ class Macro(Primitive):
 
     @property
     def header(self):
-        return '#{directive} {name}({arguments})'.format(directive=super().header, name=self.name,
+        return '#{directive} {name}({arguments})'.format(directive=self.keyword, name=self.name,
                                                          arguments=','.join(self.arguments))
 
-    @property
-    def body_open(self):
-        return ''
+class Version(Primitive):
+    __slots__ = ('version',)
 
-    @property
-    def body_close(self):
-        return '#end'
+    header = '#version'
+    body_open = ' '
+    body_close = ';'
 
-class Version(Primitive):
     def __init__(self, version, *args, **kwargs):
         self.version = version
         super().__init__(*args, **kwargs)
 
-    @property
-    def header(self):
-        return '#{}'.format(super().header)
-
-    @property
-    def body_open(self):
-        return ' '
-
     @property
     def body(self):
         return '{}'.format(self.version)
 
-    @property
-    def body_close(self):
-        return ';'
-
 class Include(Primitive):
+    __slots__ = ('path',)
+
+    header = '#include'
+    body_open = ' "'
+    body_close = '"'
+
     def __init__(self, path, *args, **kwargs):
         self.path = path
         super().__init__(*args, **kwargs)
 
+    @property
+    def body(self):
+        return '{}'.format(self.path)
+
+class Declare(Primitive):
+    __slots__ = ('name', 'arguments')
+
+    body_open = ' = '
+    body_close = ';'
+
+    def __init__(self, name, *args, **kwargs):
+        self.name = name
+        self.arguments = []
+        super().__init__(*args, **kwargs)
+
     @property
     def header(self):
-        return '#{}'.format(super().header)
+        return '#{directive} {name}'.format(directive=self.keyword, name=self.name)
+
+class Local(Declare): pass
+
+class Fopen(Primitive):
+    __slots__ = ('name', 'path', 'mode')
+
+    body_open = ' "'
+
+    def __init__(self, name, path, *args, mode='read', **kwargs):
+        self.name = name
+        self.path = path
+        self.mode = mode
+        super().__init__(*args, **kwargs)
 
     @property
-    def body_open(self):
-        return ' "'
+    def header(self):
+        return '#{directive} {name}'.format(directive=self.keyword, name=self.name)
 
     @property
     def body(self):
@@ -76,24 +101,87 @@ class Include(Primitive):
 
     @property
     def body_close(self):
-        return '"'
+        return '" {}'.format(self.mode)
+
+class Fclose(Primitive):
+    __slots__ = ('name',)
+
+    body_open = ''
+    body_close = ''
 
-class Declare(Primitive):
     def __init__(self, name, *args, **kwargs):
         self.name = name
-        self.arguments = []
         super().__init__(*args, **kwargs)
 
     @property
     def header(self):
-        return '#{directive} {name}'.format(directive=super().header, name=self.name)
+        return '#{directive} {name}'.format(directive=self.keyword, name=self.name)
 
-    @property
-    def body_open(self):
-        return ' = '
+class Read(Primitive):
+    __slots__ = ('name', 'identifiers')
+
+    header = '#read'
+    body_open = ' ('
+    body_close = ')'
+
+    def __init__(self, name, *identifiers, **kwargs):
+        self.name = name
+        self.identifiers = identifiers
+        super().__init__(**kwargs)
 
     @property
-    def body_close(self):
-        return ';'
+    def body(self):
+        return ', '.join([self.name, *self.identifiers])
 
-def Local(Declare): pass
+class For(Primitive):
+    __slots__ = ('identifier', 'start', 'end')
+
+    body_open = ''
+    body_close = '#end'
+
+    def __init__(self, identifier, start, end, *args, **kwargs):
+        self.identifier = identifier
+        self.start = start
+        self.end = end
+        super().__init__(*args, **kwargs)
+
+    @property
+    def header(self):
+        return '#{directive} ({identifier}, {start}, {end})'.format(
+            directive=self.keyword, identifier=self.identifier, start=self.start, end=self.end)
+
+def read_loop(name, path, count, nvalues, *body):
+    """Directives reading a data file row by row (see syntax.write_data_file).
+
+    Each of the count rows is read into the identifiers {name}_0, {name}_1, ..., {name}_{nvalues-1}
+    before the body is instantiated.
+
+    Args:
+        name: identifier prefix for the variables used by the loop.
+        path: data file to read.
+        count: number of rows to read.
+        nvalues: number of values in each row.
+        body: objects instantiated once per row.
+    Returns:
+        List of directives performing the loop.
+    """
+    handle = '{}_file'.format(name)
+    return [Declare('{}_count'.format(name), value=count),
+            Fopen(handle, path),
+            read_rows(name, '{}_count'.format(name), nvalues, *body),
+            Fclose(handle)]
+
+def read_rows(name, count, nvalues, *body):
+    """Loop reading the next count rows of a data file opened as {name}_file (see read_loop).
+
+    Successive loops over the same open file continue where the previous one stopped, so a file
+    can be read in parts from different places in the script.
+
+    Args:
+        name, nvalues, body: see read_loop.
+        count: number of rows to read (or an identifier holding it).
+    Returns:
+        The #for directive.
+    """
+    values = ['{}_{}'.format(name, k) for k in range(nvalues)]
+    return For('{}_index'.format(name), 1, count, Read('{}_file'.format(name), *values), *body)
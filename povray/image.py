@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Minimal reading and writing of images using only numpy and the standard library."""
+
+import re
+import zlib
+import struct
+import numpy as np
+
+def read_ppm(path):
+    """Read a binary (P6) PPM or (P5) PGM image, such as povray writes with +FP.
+
+    Args:
+        path: image file.
+    Returns:
+        (height x width x 3) array for PPM or (height x width) for PGM, of dtype uint8 or uint16
+        depending on the maximum value in the header.
+    """
+    with open(path, 'rb') as f: data = f.read()
+
+    # The header is four whitespace-separated tokens, possibly with comments in between.
+    header = re.match(rb'(P[56])((?:\s+(?:#[^\n]*\n\s*)*\d+){3})\s', data)
+    if header is None: raise ValueError('{} is not a binary PPM/PGM image'.format(path))
+    magic = header.group(1)
+    width, height, maxval = [int(x) for x in re.findall(rb'\d+', re.sub(rb'#[^\n]*\n', b'', header.group(2)))]
+
+    channels = 3 if magic == b'P6' else 1
+    dtype = np.dtype('u1') if maxval < 256 else np.dtype('>u2')
+    pixels = np.frombuffer(data, dtype, count=width*height*channels, offset=header.end())
+    pixels = pixels.astype(dtype.newbyteorder('='))
+    if channels == 1: return pixels.reshape(height, width)
+    return pixels.reshape(height, width, channels)
+
+def write_ppm(path, pixels):
+    """Write a binary PPM (RGB) or PGM (grayscale) image.
+
+    Args:
+        path: image file.
+        pixels: (height x width x 3) or (height x width) array of dtype uint8 or uint16.
+    """
+    pixels = np.asarray(pixels)
+    magic = b'P6' if pixels.ndim == 3 else b'P5'
+    maxval = 255 if pixels.dtype == np.uint8 else 65535
+    height, width = pixels.shape[:2]
+    with open(path, 'wb') as f:
+        f.write(b'%s\n%d %d\n%d\n' % (magic, width, height, maxval))
+        f.write(pixels.astype('u1' if maxval == 255 else '>u2').tobytes())
+
+def write_png(path, pixels, compression=6):
+    """Write a PNG image, compressed with zlib.
+
+    Args:
+        path: image file.
+        pixels: (height x width) grayscale, or (height x width x 3) RGB, or (height x width x 4)
+                RGBA array of dtype uint8 or uint16.
+        compression: zlib compression level.
+    """
+    pixels = np.asarray(pixels)
+    if pixels.dtype not in [np.uint8, np.uint16]: raise ValueError('PNG pixels must be uint8 or uint16')
+    height, width = pixels.shape[:2]
+    channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+    colour_type = {1: 0, 3: 2, 4: 6}[channels]
+    bit_depth = 8 * pixels.dtype.itemsize
+
+    # Each scanline is preceded by its filter type (0 = none); samples are big-endian.
+    rows = np.ascontiguousarray(pixels, dtype=pixels.dtype.newbyteorder('>')).reshape(height, -1).view(np.uint8)
+    scanlines = np.hstack((np.zeros((height, 1), dtype=np.uint8), rows))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bit_depth, colour_type, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(scanlines.tobytes(), compression)))
+        f.write(chunk(b'IEND', b''))
+
+def unfilter_scanlines(data, height, stride, bpp):
+    """Undo the per-scanline filters of a (non-interlaced) PNG image.
+
+    None, Sub and Up filters are undone a whole row at a time; Average and Paeth depend on the
+    previous byte of the same row, so are undone byte by byte.
+
+    Args:
+        data: decompressed image data, each row preceded by its filter type.
+        height: number of rows.
+        stride: number of bytes in each row (excluding the filter type).
+        bpp: number of bytes in each pixel (at least 1).
+    Returns:
+        (height x stride) uint8 array of raw rows.
+    """
+    scanlines = np.frombuffer(data, np.uint8, count=height*(stride+1)).reshape(height, stride+1)
+    rows = np.zeros((height + 1, stride), dtype=np.uint8) # With a zero row above the first.
+    for i, (kind, line) in enumerate(zip(scanlines[:,0], scanlines[:,1:]), 1):
+        above = rows[i-1]
+        if kind == 0: rows[i] = line
+        elif kind == 1: rows[i] = np.cumsum(line.reshape(-1, bpp), axis=0, dtype=np.uint8).reshape(-1)
+        elif kind == 2: rows[i] = line + above
+        elif kind in (3, 4):
+            row, up = line.tolist(), above.tolist()
+            for k in range(stride):
+                left = row[k-bpp] if k >= bpp else 0
+                if kind == 3: predictor = (left + up[k]) // 2
+                else:
+                    corner = up[k-bpp] if k >= bpp else 0
+                    p = left + up[k] - corner
+                    pa, pb, pc = abs(p - left), abs(p - up[k]), abs(p - corner)
+                    predictor = left if pa <= pb and pa <= pc else up[k] if pb <= pc else corner
+                row[k] = (row[k] + predictor) & 0xff
+            rows[i] = row
+        else: raise ValueError('unknown PNG filter type {}'.format(kind))
+    return rows[1:]
+
+def read_png(path):
+    """Read a PNG image, such as write_png or povray writes.
+
+    Grayscale, RGB and their alpha variants are supported with 8 or 16 bits per sample; palette,
+    low bit depth and interlaced images are not.
+
+    Args:
+        path: image file.
+    Returns:
+        (height x width) array for grayscale, or (height x width x channels) otherwise, of dtype
+        uint8 or uint16 depending on the bit depth.
+    """
+    with open(path, 'rb') as f: data = f.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n': raise ValueError('{} is not a PNG image'.format(path))
+
+    header, compressed, position = None, [], 8
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position+8])
+        content = data[position+8:position+8+length]
+        if kind == b'IHDR': header = struct.unpack('>IIBBBBB', content)
+        elif kind == b'IDAT': compressed.append(content)
+        elif kind == b'IEND': break
+        position += 12 + length
+    if header is None: raise ValueError('{} has no PNG header'.format(path))
+
+    width, height, bit_depth, colour_type, compression, filtering, interlace = header
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}.get(colour_type)
+    if channels is None or bit_depth not in (8, 16) or interlace:
+        raise ValueError('unsupported PNG format in {} (colour type {}, bit depth {}, interlace {})'.format(
+                         path, colour_type, bit_depth, interlace))
+
+    bpp = channels * bit_depth // 8
+    rows = unfilter_scanlines(zlib.decompress(b''.join(compressed)), height, width*bpp, bpp)
+    pixels = rows.view('>u2').astype(np.uint16) if bit_depth == 16 else rows
+    if channels == 1: return pixels.reshape(height, width)
+    return pixels.reshape(height, width, channels)
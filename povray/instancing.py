@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import copy
+from collections import Counter
+
+from .primitives import *
+from .directives import *
+from .pigments import *
+from .mesh import Mesh2
+
+# Blocks that can be declared once and then referenced by name within the same kind of block.
+declarable_modifiers = (Pigment, Finish, Interior)
+# Objects that can be declared once and then referenced via object { ... }.
+declarable_objects = (Union, Merge, Intersection, Difference, Sphere, Cylinder, Cone, Mesh2, Object)
+# Nodes whose contents depend on their context (e.g. macro arguments), so are left untouched.
+opaque = (Macro, For)
+
+def is_opaque(node):
+    """Whether a node is left untouched, including nodes whose children are generated on demand."""
+    return isinstance(node, opaque) or node.generated_children
+
+def split_transformations(node):
+    """Separate the trailing transformations of an object from the rest of its children."""
+    if not isinstance(node, declarable_objects): return node.children, []
+    k = len(node.children)
+    while k > 0 and isinstance(node.children[k-1], Transformation): k -= 1
+    return node.children[:k], node.children[k:]
+
+def declare_repeats(scene, min_count=2, prefix='shared'):
+    """Declare repeated subtrees once and replace each occurrence with a reference.
+
+    Identical subtrees are found by hash-consing: each node is assigned an integer id from its
+    own signature and the ids of its children, so identical subtrees share an id. Pigments,
+    finishes and interiors occurring at least min_count times are replaced by a reference
+    (e.g. pigment { sharedPigment0 }). Objects are compared ignoring any trailing
+    transformations, so the same object placed at different positions is replaced by
+    object { sharedUnion0 translate <...> }.
+
+    Each declaration is placed just before the top-level child of the scene where the subtree
+    first occurs, so that any identifiers it uses are already defined.
+
+    Args:
+        scene: root of the tree (typically a Scene).
+        min_count: number of occurrences for a subtree to be declared.
+        prefix: prefix of the declared identifiers.
+    Returns:
+        New tree with the declarations; the original tree is not modified.
+    """
+
+    interned = {}
+    node_ids = {}
+    counts = Counter()
+
+    def intern(key):
+        return interned.setdefault(key, len(interned))
+
+    def visit(node):
+        if id(node) not in node_ids:
+            if is_opaque(node):
+                content_id = intern(('opaque', id(node)))
+                transformations = ()
+            else:
+                content, transformations = split_transformations(node)
+                content_id = intern((node.signature(), tuple([visit(child) for child in content])))
+                transformations = tuple([visit(child) for child in transformations])
+            node_ids[id(node)] = content_id, intern((content_id, transformations))
+
+        content_id, full_id = node_ids[id(node)]
+        if isinstance(node, declarable_modifiers + declarable_objects): counts[content_id] += 1
+        return full_id
+
+    def declarable(node):
+        if isinstance(node, declarable_modifiers): return len(node.children) > 0
+        return isinstance(node, declarable_objects)
+
+    def count_written(node, usage, expanded):
+        """Count occurrences that will actually be written out, given the selected declarations.
+
+        The contents of a declared subtree are only written once (in its declaration), so
+        subtrees only repeated within it should not be declared separately.
+        """
+        if is_opaque(node): return
+        content_id = node_ids[id(node)][0]
+        if declarable(node):
+            usage[content_id] += 1
+            if content_id in selected:
+                if content_id in expanded: return
+                expanded.add(content_id)
+        for child in node.children: count_written(child, usage, expanded)
+
+    declared = {}
+    rewritten = {}
+
+    def rewrite(node, declarations):
+        if id(node) in rewritten: return rewritten[id(node)]
+
+        content_id = node_ids[id(node)][0]
+        if is_opaque(node) or not len(node.children) and not declarable(node):
+            replacement = node
+        elif declarable(node) and content_id in selected:
+            content, transformations = split_transformations(node)
+            if content_id not in declared:
+                definition = copy.copy(node)
+                definition.children = [rewrite(child, declarations) for child in content]
+                name = '{}{}{}'.format(prefix, type(node).__name__, len(declared))
+                declarations += [Declare(name, definition)]
+                declared[content_id] = name
+            name = declared[content_id]
+            if isinstance(node, declarable_modifiers): replacement = type(node)(value=name)
+            else: replacement = Object(*transformations, value=name)
+        else:
+            replacement = copy.copy(node)
+            replacement.children = [rewrite(child, declarations) for child in node.children]
+
+        rewritten[id(node)] = replacement
+        return replacement
+
+    for child in scene.children: visit(child)
+
+    selected = {content_id for content_id, count in counts.items() if count >= min_count}
+    while True:
+        usage, expanded = Counter(), set()
+        for child in scene.children: count_written(child, usage, expanded)
+        previous, selected = selected, {content_id for content_id in selected if usage[content_id] >= min_count}
+        if selected == previous: break
+
+    root = copy.copy(scene)
+    root.children = []
+    for child in scene.children:
+        declarations = []
+        child = rewrite(child, declarations)
+        root.children += declarations + [child]
+    return root
@@ -16,67 +16,237 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import numpy as np
-from scipy import interpolate
 from .primitives import *
 
 def stipple_coordinates(coordinates, resolutions=None, exclude_out_of_bounds=False, eps=1e-12):
+    """Sample points along a polyline at regular intervals of arc length.
+
+    Sample positions repeat the cumulative resolutions every sum(resolutions) along the line, so
+    resolutions (gap, dash) gives the start and end of every dash (see resample).
+
+    Args:
+        coordinates: (n x d) points of the polyline.
+        resolutions: lengths between consecutive samples, repeating (None to return the points as is).
+        exclude_out_of_bounds: if True, samples beyond the end of the line are dropped; otherwise the
+                               first of them is moved to the end of the line.
+    Returns:
+        (m x d) sample points.
+    """
     if resolutions is None: return coordinates
-    ds = np.linalg.norm(np.diff(coordinates, axis=0), axis=1)
-    path_lengths = np.concatenate(([0], np.cumsum(ds, axis=0)))
-    f = interpolate.interp1d(path_lengths, coordinates.T)
-
-    stencil_size = np.sum(resolutions)
-    stencil = np.cumsum(resolutions)
-    sample_points = np.arange(0, path_lengths[-1], stencil_size)
-    sample_points = (np.tile(sample_points.reshape(-1,1), len(stencil)) + stencil).reshape(-1)
-
-    out_of_bounds = sample_points > path_lengths[-1]
+    coordinates = np.asarray(coordinates)
+    return resample(coordinates, [0, len(coordinates)], resolutions, exclude_out_of_bounds)[0]
+
+def polyline_segments(points, offsets):
+    """Indices of the start point of every segment in a set of polylines.
+
+    Polylines are given as ragged arrays: polyline k is points[offsets[k]:offsets[k+1]], which may
+    be empty.
+
+    Args:
+        points: (n x d) concatenated points of all the polylines.
+        offsets: (k+1) int array of the index of the first point of each polyline, ending with n.
+    Returns:
+        Int array of indices i such that (points[i], points[i+1]) is a segment of a polyline.
+    """
+    if not len(points): return np.array([], dtype=int)
+    ends = np.zeros(len(points), dtype=bool)
+    ends[np.asarray(offsets)[1:] - 1] = True
+    return np.flatnonzero(~ends[:-1])
+
+def resample(points, offsets, pattern, exclude_out_of_bounds=False):
+    """Sample points along polylines at regular intervals of arc length.
+
+    Sample positions within each polyline repeat the cumulative pattern every sum(pattern) along
+    its length, e.g. pattern (gap, dash) samples the start and end of every dash. All polylines are
+    sampled at once: each sample is located on its segment by a binary search of the cumulative
+    arc lengths and then linearly interpolated.
+
+    Args:
+        points: (n x d) concatenated points of all the polylines.
+        offsets: (k+1) start index of each polyline (see polyline_segments).
+        pattern: lengths between consecutive samples, repeating; either one (p) pattern for every
+                 polyline, or a (k x p) array giving a pattern for each polyline.
+        exclude_out_of_bounds: if True, samples beyond the end of a polyline are dropped; otherwise
+                               the first of them is moved to the end of the polyline.
+    Returns:
+        samples: (m x d) concatenated sample points.
+        offsets: (k+1) start index of the samples of each polyline.
+    """
+    points = np.asarray(points)
+    offsets = np.asarray(offsets)
+    npolylines = len(offsets) - 1
+    first, last = offsets[:-1], offsets[1:] - 1
+
+    # Arc length along the concatenated polylines, not advancing between consecutive polylines.
+    step = np.zeros(len(points))
+    segments = polyline_segments(points, offsets)
+    step[segments+1] = np.linalg.norm(points[segments+1] - points[segments], axis=1)
+    arc = np.cumsum(step)
+    # Empty polylines have no points to index (their first may even be past the end), and so are
+    # given zero length, which leaves them without samples.
+    nonempty = last >= first
+    base, lengths = np.zeros(npolylines), np.zeros(npolylines)
+    base[nonempty] = arc[first[nonempty]]
+    lengths[nonempty] = arc[last[nonempty]] - base[nonempty]
+
+    pattern = np.asarray(pattern, dtype=float)
+    stencil = np.broadcast_to(np.cumsum(pattern, axis=-1), (npolylines, pattern.shape[-1]))
+    period = stencil[:,-1]
+    if np.any(period <= 0): raise ValueError('resampling pattern must have a positive total length')
+    nstencil = stencil.shape[1]
+
+    repeats = np.ceil(lengths / period).astype(int)
+    counts = repeats * nstencil
+    owner = np.repeat(np.arange(npolylines), counts)
+    local = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    position = (local // nstencil) * period[owner] + stencil[owner, local % nstencil]
+
+    out_of_bounds = position > lengths[owner]
     if exclude_out_of_bounds:
-        sample_points = sample_points[~out_of_bounds]
+        keep = ~out_of_bounds
     else:
-        sample_points[out_of_bounds] = path_lengths[-1]
-        sample_points = sample_points[:1+np.where(out_of_bounds)[0][0]]
-
-    return f(sample_points).T
-
-def line(coordinates, line_width, *args, stipple=None, smooth=True, **kwargs):
-    """Generates a line in 3d as the union of cylinders that can be rendered with ray-tracing."""
-
-    objects = []
+        # Samples are in increasing order within each polyline, so the first out of bounds is the
+        # one following a sample inside (or starting the polyline).
+        previous_inside = np.concatenate(([False], ~out_of_bounds[:-1] & (owner[1:] == owner[:-1])))
+        first_out = out_of_bounds & (previous_inside | (local == 0))
+        position[first_out] = lengths[owner[first_out]]
+        keep = ~out_of_bounds | first_out
+    owner, position = owner[keep], position[keep]
+
+    # Linear interpolation along the segment containing each sample.
+    target = base[owner] + position
+    hi = np.clip(np.searchsorted(arc, target), first[owner] + 1, last[owner])
+    lo = hi - 1
+    width = arc[hi] - arc[lo]
+    slope = (points[hi] - points[lo]) / np.where(width > 0, width, 1)[:,None]
+    samples = slope * (target - arc[lo])[:,None] + points[lo]
+    samples[width == 0] = points[lo][width == 0]
+
+    counts = np.bincount(owner, minlength=npolylines)
+    return samples, np.concatenate(([0], np.cumsum(counts)))
+
+def paired_samples(samples, offsets):
+    """Split the samples of each polyline into consecutive (start, end) pairs, e.g. dashes.
+
+    Returns:
+        start, end: (m x d) end points of each pair.
+        owner: (m) index of the polyline of each pair.
+    """
+    counts = np.diff(offsets)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(len(samples)) - np.repeat(offsets[:-1], counts)
+    start = np.flatnonzero((local % 2 == 0) & (local + 1 < counts[owner]))
+    return samples[start], samples[start+1], owner[start]
+
+def dash_segments(points, offsets, pattern, exclude_out_of_bounds=False):
+    """End points of the dashes along polylines, as flat arrays ready for CylinderBatch or ConeBatch.
+
+    Args:
+        points: (n x d) concatenated points of all the polylines.
+        offsets: (k+1) start index of each polyline (see polyline_segments).
+        pattern: (gap, dash) lengths, or a (k x 2) array of them for each polyline.
+        exclude_out_of_bounds: drop dashes running beyond the end of a polyline instead of cutting
+                               them short.
+    Returns:
+        start, end: (m x d) end points of each dash.
+        owner: (m) index of the polyline of each dash.
+    """
+    samples, sample_offsets = resample(points, offsets, pattern, exclude_out_of_bounds)
+    return paired_samples(samples, sample_offsets)
+
+def unique_points(points):
+    """Indices of the first occurrence of each distinct point, in their original order.
+
+    Rather than sorting whole rows as np.unique(points, axis=0) does, points are sorted by a hash
+    of their bytes, so that only a single integer sort is needed.
+
+    Args:
+        points: (n x d) array of points.
+    Returns:
+        Sorted int array of indices.
+    """
+    points = np.ascontiguousarray(points, dtype=float) + 0. # Normalise -0 to 0.
+    if not len(points): return np.array([], dtype=int)
+    words = points.view(np.uint64)
+    key = np.zeros(len(points), dtype=np.uint64)
+    for column in words.T: key = (key ^ column) * np.uint64(0x100000001b3)
+    order = np.argsort(key, kind='stable')
+    ordered = points[order]
+    # Equal points have equal keys, so follow one another; hash collisions merely keep a duplicate.
+    first = np.ones(len(points), dtype=bool)
+    first[1:] = (key[order][1:] != key[order][:-1]) | np.any(ordered[1:] != ordered[:-1], axis=1)
+    return np.sort(order[first])
+
+def polylines(points, offsets, line_width, *args, stipple=None, arrows=None, reverse=False, smooth=True, sweep=False,
+              **kwargs):
+    """Generates many lines in 3d at once, as cylinders (or sphere sweeps) that can be rendered with ray-tracing.
+
+    Args:
+        points: (n x 3) concatenated points of all the polylines.
+        offsets: (k+1) int array of the index of the first point of each polyline, ending with n,
+                 so that polyline i is points[offsets[i]:offsets[i+1]].
+        line_width: radius of the lines.
+        stipple: (gap, dash) lengths to draw dashed lines (see resample), or a (k x 2) array of them
+                 for each polyline.
+        arrows: (separation, length, width) of cones placed along the lines; each may also be a (k)
+                array giving its value for each polyline.
+        reverse: point the arrows towards the start of the lines.
+        smooth: round the joints between cylinders with spheres.
+        sweep: draw each polyline (or dash) as a single sphere_sweep instead of cylinders and spheres.
+    Returns:
+        Merge of all the objects.
+    """
+    points = np.asarray(points)
+    offsets = np.asarray(offsets)
 
     if stipple is not None:
-        coordinates = stipple_coordinates(coordinates, stipple)
-        for coords in zip(coordinates[::2], coordinates[1::2]):
-            objects += [child for child in line(coords, line_width, *args, smooth=False, **kwargs).children]
-
+        samples, sample_offsets = resample(points, offsets, stipple)
+        start, end, owner = paired_samples(samples, sample_offsets)
+        joints = samples
     else:
+        segments = polyline_segments(points, offsets)
+        start, end = points[segments], points[segments+1]
+        joints = points
+    nonzero = np.any(start != end, axis=1)
+    start, end = start[nonzero], end[nonzero]
+
+    if not sweep:
+        objects = [CylinderBatch(start, end, line_width)]
+        if smooth:
+            # Round the edges of the cylinders where the lines join to make it smooth.
+            objects += [SphereBatch(joints[unique_points(joints)], line_width)]
+    elif stipple is not None:
+        objects = [SphereSweep(dash, line_width) for dash in np.stack((start, end), axis=1)]
+    else:
+        # Sweeps cannot pass through the same point twice in a row, so drop repeated points.
+        counts = np.diff(offsets)
+        owner = np.repeat(np.arange(len(counts)), counts)
+        distinct = np.ones(len(points), dtype=bool)
+        distinct[1:] = np.any(points[1:] != points[:-1], axis=1) | (owner[1:] != owner[:-1])
+        counts = np.bincount(owner[distinct], minlength=len(counts))
+        polylines = np.split(points[distinct], np.cumsum(counts)[:-1])
+        objects = [SphereSweep(polyline, line_width) for polyline in polylines if len(polyline) > 1]
+
+    if arrows is not None:
+        separation, length, width = arrows
+        pattern = np.stack(np.broadcast_arrays(separation, length), axis=-1)
+        a, b, owner = dash_segments(points, offsets, pattern, exclude_out_of_bounds=True)
+        if reverse: a, b = b, a
+        if np.ndim(width): width = np.asarray(width)[owner]
+        objects += [ConeBatch(a, b, width, 0)]
 
-        # Create the line as a series of cylinders joining adjacent points.
-        for v1, v2 in zip(coordinates, coordinates[1:]):
-            if np.linalg.norm(v2 - v1) > 0:
-                objects += [Cylinder(pov_vector(v1), pov_vector(v2), line_width)]
+    return Merge(*objects, *args, **kwargs)
 
-    if smooth:
-        # Round the edges of the cylinders where the lines join to make it smooth.
-        for v in np.unique(coordinates, axis=0):
-            objects += [Sphere(pov_vector(v), line_width)]
+def line(coordinates, line_width, *args, stipple=None, smooth=True, **kwargs):
+    """Generates a line in 3d as the union of cylinders that can be rendered with ray-tracing."""
 
-    return Merge(*objects, *args, **kwargs)
+    coordinates = np.asarray(coordinates)
+    return polylines(coordinates, [0, len(coordinates)], line_width, *args, stipple=stipple, smooth=smooth, **kwargs)
 
 def arrowed_line(coordinates, line_width, arrow_separation, arrow_length, arrow_width, *args, smooth=True, reverse=False, **kwargs):
     """Generates a line containing arrows in 3d as the union of cylinders and cones
     that can be rendered with ray-tracing."""
 
-    objects = []
-
-    # Create the line as a series of cylinders joining adjacent points.
-    for v1, v2 in zip(coordinates, coordinates[1:]):
-        if np.linalg.norm(v2 - v1) > 0:
-            objects += [Cylinder(pov_vector(v1), pov_vector(v2), line_width)]
-
-    arrow_coords = stipple_coordinates(coordinates, (arrow_separation, arrow_length), exclude_out_of_bounds=True)
-    for a, b in zip(arrow_coords[::2], arrow_coords[1::2]):
-        if reverse: a, b = b, a
-        objects += [Cone(a, b, arrow_width, 0)]
-
-    return Merge(*objects, *args, **kwargs)
+    coordinates = np.asarray(coordinates)
+    return polylines(coordinates, [0, len(coordinates)], line_width, *args, arrows=(arrow_separation, arrow_length, arrow_width),
+                     reverse=reverse, smooth=False, **kwargs)
@@ -15,9 +15,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import hashlib
+import functools
 import numpy as np
-from .syntax import pov_vector
-from .primitives import Primitive, Attribute
+from .syntax import pov_vector, iter_pov_vectors, write_data_file, to_identifier, default_chunk_size
+from .primitives import Primitive, Attribute, Expression, Scale, Translate, Matrix
+from .directives import read_loop
+from .image import write_png
+from .lines import polylines
+from . import decimation
 
 def triangulate_grid(*args):
     """Triangulate a 2d grid of coordinates to obtain a triangle mesh.
@@ -29,51 +35,197 @@ def triangulate_grid(*args):
         Meshgrid coordinates (e.g. from output of numpy.meshgrid).
     Returns:
         coordinates: vertex coordinates referenced by triangulation.
-        triangulation: (n x 3) int array giving vertex indices for each triangle.
+        triangulation: (n x 3) int array giving vertex indices for each triangle (int32 unless
+                       there are too many vertices).
     """
     nrows, ncols = args[0].shape
     triangles_per_strip = 2*(ncols - 1)
     nstrips = nrows - 1
     ntriangles = nstrips * triangles_per_strip
 
-    triangulation = np.empty((ntriangles, 3), dtype=int)
+    dtype = np.int32 if nrows*ncols <= np.iinfo(np.int32).max else np.int64
+    triangulation = np.empty((ntriangles, 3), dtype=dtype)
     # Two basic triangles in a strip:
     triangulation[::2] = [0, ncols, 1]
     triangulation[1::2] = [1, ncols, ncols+1]
     # Shift vertex indices along the appropriate number of columns within a strip.
-    triangulation += np.tile(np.repeat(np.arange(ncols - 1), 2), nstrips)[:, np.newaxis]
+    triangulation += np.tile(np.repeat(np.arange(ncols - 1, dtype=dtype), 2), nstrips)[:, np.newaxis]
     # Shift vertex indices along the rows to get the correct indices for each strip.
-    triangulation += np.repeat(ncols*np.arange(nstrips), triangles_per_strip)[:,np.newaxis]
+    triangulation += np.repeat(ncols*np.arange(nstrips, dtype=dtype), triangles_per_strip)[:,np.newaxis]
 
-    coordinates = np.array([x.flatten() for x in args]).T
+    coordinates = np.column_stack([np.ravel(x) for x in args])
     return coordinates, triangulation
 
+def vertex_normals(coordinates, triangulation, weighting='area', chunk_size=default_chunk_size):
+    """Estimate the normal at each vertex of a triangle mesh from its faces.
+
+    Face contributions are scatter-added onto the vertices in a single pass over the triangles
+    (processed a block at a time), so vertices shared by many faces are correctly accounted for.
+
+    Args:
+        coordinates: (n x 3) vertex coordinates.
+        triangulation: (m x 3) int array giving vertex indices for each triangle.
+        weighting: how each face normal is weighted at its corners: 'area' (by triangle area),
+                   'angle' (by the interior angle at that corner) or 'uniform'.
+        chunk_size: number of triangles processed at a time.
+    Returns:
+        (n x 3) array of unit vertex normals (zero for vertices not in any triangle).
+    """
+    if weighting not in ['area', 'angle', 'uniform']:
+        raise ValueError('unknown normal weighting: {}'.format(weighting))
+
+    n = len(coordinates)
+    normals = np.zeros((n, 3))
+    for start in range(0, len(triangulation), chunk_size):
+        block = np.asarray(triangulation[start:start+chunk_size])
+        A, B, C = coordinates[block.T]
+        face_normals = np.cross(B - A, C - A)
+
+        if weighting == 'area':
+            weights = np.repeat(face_normals[:,np.newaxis], 3, axis=1)
+        else:
+            norm = np.linalg.norm(face_normals, axis=1)
+            norm[norm == 0] = 1
+            unit_normals = face_normals / norm[:,np.newaxis]
+            if weighting == 'uniform':
+                weights = np.repeat(unit_normals[:,np.newaxis], 3, axis=1)
+            else:
+                # Edge vectors leaving each corner, for the angle subtended at that corner.
+                u = np.stack((B - A, C - B, A - C), axis=1)
+                v = -np.roll(u, 1, axis=1)
+                angles = np.arctan2(np.linalg.norm(np.cross(u, v), axis=2), np.sum(u*v, axis=2))
+                weights = unit_normals[:,np.newaxis] * angles[...,np.newaxis]
+
+        vertices = block.reshape(-1)
+        weights = weights.reshape(-1, 3)
+        for k in range(3):
+            normals[:,k] += np.bincount(vertices, weights=weights[:,k], minlength=n)
+
+    norm = np.linalg.norm(normals, axis=1)
+    norm[norm == 0] = 1
+    return normals / norm[:,np.newaxis]
+
+def weld_vertices(coordinates, triangulation, tolerance=0):
+    """Merge duplicate vertices of a triangle mesh.
+
+    Vertices are considered duplicates when they fall in the same cell of a grid with spacing
+    given by the tolerance (or are exactly equal for zero tolerance). Triangles that become
+    degenerate after merging are removed.
+
+    Args:
+        coordinates: (n x d) vertex coordinates.
+        triangulation: (m x 3) int array giving vertex indices for each triangle.
+        tolerance: distance below which vertices are merged.
+    Returns:
+        coordinates: unique vertex coordinates referenced by triangulation.
+        triangulation: (m' x 3) int array giving vertex indices for each triangle.
+    """
+    coordinates = np.asarray(coordinates)
+    if tolerance > 0: keys = np.round(coordinates / tolerance).astype(np.int64)
+    else: keys = coordinates
+
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    triangulation = inverse.reshape(-1)[triangulation]
+
+    a, b, c = triangulation.T
+    degenerate = (a == b) | (b == c) | (c == a)
+    return coordinates[first], triangulation[~degenerate]
+
 def grid_lines(*args):
     """Coordinates of lines along a 2d grid of coordinates to obtain the grid lines.
 
+    Both sets of lines are views of a single (nrows x ncols x d) array, so no copies are made per line.
+
     Args:
         Meshgrid coordinates (e.g. from output of numpy.meshgrid).
     Returns:
-        xcoords: sequence of coordinates for first set of grid lines.
-        ycoords: sequence of coordinates for second set of grid lines.
+        xcoords: (nrows x ncols x d) array whose rows are the first set of grid lines.
+        ycoords: (ncols x nrows x d) array whose rows are the second set of grid lines.
     """
+    xcoords = np.stack(args, axis=-1)
+    return xcoords, xcoords.transpose(1, 0, 2)
 
-    nrows, ncols = args[0].shape
+def wireframe(X, Y, Z, line_width, *args, every=1, **kwargs):
+    """Grid lines of a surface drawn as a single set of lines (see polylines).
+
+    Args:
+        X, Y, Z: meshgrid coordinates of the surface.
+        line_width: radius of the lines.
+        every: draw only every k-th grid line in each direction (the last line is always drawn to
+               close the outline), or a pair (krows, kcols) for each direction separately.
+        kwargs: further options for polylines (e.g. sweep, smooth or stipple).
+    Returns:
+        Merge of the objects drawing the lines.
+    """
+    xcoords, ycoords = grid_lines(X, Y, Z)
+    every = np.broadcast_to(every, 2)
 
-    xcoords, ycoords = [], []
-    for row in range(nrows): xcoords += [np.array([x[row] for x in args]).T]
-    for col in range(ncols): ycoords += [np.array([x[:,col] for x in args]).T]
-    return xcoords, ycoords
+    points, counts = [], []
+    for coords, k in zip((xcoords, ycoords), every):
+        selected = np.arange(0, len(coords), k)
+        if selected[-1] != len(coords) - 1: selected = np.append(selected, len(coords) - 1)
+        points += [coords[selected].reshape(-1, 3)]
+        counts += [np.full(len(selected), coords.shape[1])]
+    offsets = np.concatenate(([0], np.cumsum(np.concatenate(counts))))
+    return polylines(np.concatenate(points), offsets, line_width, *args, **kwargs)
 
 class VectorBundle(Primitive):
-    def __init__(self, coordinates, *args, **kwargs):
+    """List of vectors backed directly by a numpy array.
+
+    The array (which may be memory-mapped) is referenced rather than copied, and its text
+    is only generated block by block while the object is being written out.
+
+    If a data file is given, the vectors are written there instead (when the object is created)
+    and read back by a #for loop inside the list, which povray parses much faster than literal
+    vectors.
+    """
+
+    __slots__ = ('coordinates', 'precision', 'data_file', 'chunk_size')
+
+    def __init__(self, coordinates, *args, precision=None, data_file=None, chunk_size=default_chunk_size, **kwargs):
         self.coordinates = coordinates
-        self.vectors = [pov_vector(x) for x in self.coordinates]
+        self.precision = precision
+        self.data_file = data_file
+        self.chunk_size = chunk_size
         super().__init__(*args, **kwargs)
+        if data_file is not None: self.write_data()
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def write_data(self):
+        """Write the data file read back by the script (again, if the vectors have changed)."""
+        write_data_file(self.data_file, [self.coordinates], self.precision, self.chunk_size)
+
+    def signature(self):
+        digest = hashlib.sha1(np.ascontiguousarray(self.coordinates).tobytes()).hexdigest()
+        return (type(self), np.shape(self.coordinates), np.asarray(self.coordinates).dtype.str, digest,
+                self.precision, self.data_file)
 
     @property
     def body(self):
-        return '{}, {}'.format(len(self.vectors), ', '.join(self.vectors))
+        return ''.join(self.iter_body())
+
+    def iter_body(self):
+        yield '{}, '.format(len(self))
+        yield from iter_pov_vectors(self.coordinates, self.precision, chunk_size=self.chunk_size)
+
+    def iter_chunks(self, nest=None):
+        if self.data_file is None:
+            yield from super().iter_chunks(nest)
+            return
+
+        if nest is None: nest = self.start_nest
+        indent = '  ' * nest
+        nvalues = np.prod(np.shape(self.coordinates)[1:], dtype=int)
+        name = to_identifier(self.data_file)
+        vector = Expression('<{}>'.format(', '.join(['{}_{}'.format(name, k) for k in range(nvalues)])))
+
+        yield '{}{}{}{},'.format(indent, self.header, self.body_open, len(self))
+        for obj in read_loop(name, self.data_file, len(self), nvalues, vector):
+            yield '\n'
+            yield from obj.iter_chunks(nest+1)
+        yield '\n{}{}'.format(indent, self.body_close)
 
 class VertexVectors(VectorBundle): pass
 class NormalVectors(VectorBundle): pass
@@ -81,36 +233,473 @@ class FaceIndices(VectorBundle): pass
 class InsideVector(Attribute): pass
 
 class Mesh2(Primitive):
-    """Generates a povray "mesh2" object ready to be rendered with ray-tracing."""
+    """Generates a povray "mesh2" object ready to be rendered with ray-tracing.
+
+    The mesh keeps references to the input arrays rather than copies, so memory-mapped
+    arrays (e.g. from numpy.load(..., mmap_mode='r')) are only read as they are written out.
+    """
+
+    __slots__ = ('coordinates', 'triangulation', 'chunk_size', 'decimation',
+                 'vertex_vectors', 'normal_vectors', 'face_indices', 'inside_vector')
 
-    def __init__(self, coordinates, triangulation, *args, inside_vector=None, **kwargs):
+    def __init__(self, coordinates, triangulation, *args, normals='area', weld=None, decimate=None,
+                 inside_vector=None, precision=None, data_prefix=None, chunk_size=default_chunk_size, **kwargs):
         """Create the mesh from raw data.
 
         Args:
             coordinates: vertex coordinates.
             triangulation: vertex indices.
+            normals: array of vertex normals, or how to compute them from the faces ('area',
+                     'angle' or 'uniform' weighting; see vertex_normals). If 'flat' or None then
+                     no normals are written and the mesh is rendered with flat shading.
+            weld: if not None, merge vertices closer than this tolerance before writing.
+            decimate: if not None, simplify the mesh before writing (see decimation.decimate), to
+                      either this number of triangles or with a dictionary of options (e.g.
+                      {'max_error': 1e-3}). The outcome is reported in the decimation attribute.
             inside_vector: vector direction to cast rays in order to determine interior.
+            precision: significant figures written for vertices and normals (None for full precision).
+            data_prefix: if not None, the vertices, normals and faces are written to the data files
+                         {data_prefix}_vertices.dat, {data_prefix}_normals.dat and
+                         {data_prefix}_faces.dat and read back by the script.
+            chunk_size: number of vectors processed at a time when computing normals and writing.
         """
-        triangulation = np.atleast_2d(triangulation)
+        triangulation = np.atleast_2d(np.asarray(triangulation))
         ntriangles, d = triangulation.shape
         assert d == 3
 
-        coordinates = np.array(coordinates).reshape(-1,d)
-        A, B, C = coordinates[triangulation.T]
-        self.face_normals = np.cross(B - A, C - A)
-        vertex_normals = np.zeros(coordinates.shape)
+        coordinates = np.asarray(coordinates).reshape(-1,d)
+        if weld is not None:
+            if not isinstance(normals, str) and normals is not None:
+                raise ValueError('cannot weld vertices with precomputed normals')
+            coordinates, triangulation = weld_vertices(coordinates, triangulation, weld)
+
+        self.decimation = None
+        if decimate is not None:
+            if not isinstance(normals, str) and normals is not None:
+                raise ValueError('cannot decimate meshes with precomputed normals')
+            if not isinstance(decimate, dict): decimate = dict(target=decimate)
+            coordinates, triangulation, self.decimation = decimation.decimate(coordinates, triangulation, **decimate)
+
+        self.coordinates = coordinates
+        self.triangulation = triangulation
+        self.chunk_size = chunk_size
 
-        for vertices in triangulation.T:
-            vertex_normals[vertices] += self.face_normals
+        if isinstance(normals, str) and normals == 'flat':
+            normals = None
+        if isinstance(normals, str):
+            normals = vertex_normals(coordinates, triangulation, normals, chunk_size)
+        elif normals is not None:
+            normals = np.asarray(normals).reshape(-1,d)
+            assert normals.shape == coordinates.shape
 
-        vertex_normals = (vertex_normals.T / np.linalg.norm(vertex_normals, axis=1)).T
+        def data_file(suffix):
+            if data_prefix is None: return None
+            return '{}_{}.dat'.format(data_prefix, suffix)
 
         super().__init__(*args, **kwargs)
-        self.vertex_vectors = VertexVectors(coordinates)
-        self.normal_vectors = NormalVectors(vertex_normals)
-        self.face_indices = FaceIndices(triangulation)
-        self.children += [self.vertex_vectors, self.normal_vectors, self.face_indices]
+        self.vertex_vectors = VertexVectors(coordinates, precision=precision,
+                                            data_file=data_file('vertices'), chunk_size=chunk_size)
+        self += [self.vertex_vectors]
+        if normals is None:
+            self.normal_vectors = None
+        else:
+            self.normal_vectors = NormalVectors(normals, precision=precision,
+                                                data_file=data_file('normals'), chunk_size=chunk_size)
+            self += [self.normal_vectors]
+        self.face_indices = FaceIndices(triangulation, data_file=data_file('faces'), chunk_size=chunk_size)
+        self += [self.face_indices]
 
-        if inside_vector is not None:
+        if inside_vector is None:
+            self.inside_vector = None
+        else:
             self.inside_vector = InsideVector(pov_vector(inside_vector))
-            self.children += [self.inside_vector]
+            self += [self.inside_vector]
+
+    def compute_face_normals(self, triangulation=None):
+        """Unnormalised face normals, with magnitude equal to twice the triangle area.
+
+        Args:
+            triangulation: subset of triangles to evaluate (all triangles if None).
+        Returns:
+            (n x 3) array of face normals.
+        """
+        if triangulation is None: triangulation = self.triangulation
+        A, B, C = self.coordinates[triangulation.T]
+        return np.cross(B - A, C - A)
+
+    @property
+    def face_normals(self):
+        return self.compute_face_normals()
+
+# Exchanges the y and z axes, between povray's convention of heights along y and ours along z.
+swap_yz = np.array([1, 0, 0, 0, 0, 1, 0, 1, 0, 0, 0, 0], dtype=float)
+
+class HeightField(Primitive):
+    """Generates a povray "height_field" for a surface z = f(x, y) on a uniform, axis-aligned grid.
+
+    The heights are stored in a 16-bit grayscale PNG (written when the object is created), so they
+    are quantised to 1/65535 of their range, but the file is far smaller than the equivalent mesh2
+    and is parsed much faster. povray places height fields in the unit cube with heights along y,
+    so the object is transformed back onto the grid with heights along z.
+    """
+
+    __slots__ = ('heights', 'path', 'smooth')
+
+    def __init__(self, heights, path, *args, extent=((0, 1), (0, 1)), smooth=True, **kwargs):
+        """
+        Args:
+            heights: (nrows x ncols) array, where heights[i,j] is the height at x = x0 + j*(x1-x0)/(ncols-1)
+                     and y = y0 + i*(y1-y0)/(nrows-1).
+            path: PNG file to write the heights to.
+            extent: ((x0, x1), (y0, y1)) corners of the grid.
+            smooth: interpolate normals across the surface rather than shading each triangle flat.
+        """
+        heights = np.asarray(heights)
+        if heights.ndim != 2 or min(heights.shape) < 2:
+            raise ValueError('height field needs a 2d grid of at least 2 x 2 heights')
+        if not np.all(np.isfinite(heights)):
+            raise ValueError('height field cannot have missing (non-finite) heights')
+
+        (x0, x1), (y0, y1) = extent
+        zmin, zmax = heights.min(), heights.max()
+        zrange = zmax - zmin if zmax > zmin else 1
+
+        # The first image row is furthest along povray's z, i.e. at the end of our y range.
+        levels = np.round((heights[::-1] - zmin) * (65535 / zrange)).astype(np.uint16)
+        write_png(path, levels)
+
+        self.heights = heights
+        self.path = path
+        self.smooth = smooth
+        super().__init__(Scale(np.array([x1 - x0, zrange, y1 - y0], dtype=float)),
+                         Translate(np.array([x0, zmin, y0], dtype=float)),
+                         Matrix(swap_yz), *args, **kwargs)
+
+    @property
+    def body(self):
+        return 'png "{}"{}'.format(self.path, ' smooth' if self.smooth else '')
+
+    def signature(self):
+        digest = hashlib.sha1(np.ascontiguousarray(self.heights, dtype=float).tobytes()).hexdigest()
+        return super().signature() + (digest,)
+
+def grid_extent(X, Y, rtol=1e-9):
+    """Extent of a meshgrid (with numpy.meshgrid's default 'xy' indexing) if it is uniform and axis-aligned.
+
+    Args:
+        X, Y: meshgrid coordinates.
+        rtol: relative tolerance on the spacing of grid points.
+    Returns:
+        ((x0, x1), (y0, y1)) corners of the grid, or None if it is not uniform and axis-aligned.
+    """
+    X, Y = np.asarray(X), np.asarray(Y)
+    if X.ndim != 2 or X.shape != Y.shape or min(X.shape) < 2: return None
+    if not (np.all(X == X[:1]) and np.all(Y == Y[:,:1])): return None
+
+    x, y = X[0], Y[:,0]
+    for v in [x, y]:
+        steps = np.diff(v)
+        if steps[0] == 0 or not np.allclose(steps, steps[0], rtol=rtol, atol=0): return None
+    return (x[0], x[-1]), (y[0], y[-1])
+
+def surface(X, Y, Z, *args, image=None, smooth=True, **kwargs):
+    """Surface z = f(x, y) through gridded points, as a height field where possible or else a mesh.
+
+    Args:
+        X, Y, Z: meshgrid coordinates (e.g. from numpy.meshgrid).
+        image: PNG file for the heights of a height field; without one a mesh is always used.
+        smooth: interpolate the normals of a height field.
+        kwargs: options for Mesh2, used when the grid is not uniform and axis-aligned, or has
+                missing (non-finite) heights.
+    Returns:
+        HeightField or Mesh2.
+    """
+    if image is not None and np.all(np.isfinite(Z)):
+        # Grids from meshgrid(..., indexing='ij') are the transpose of the default layout.
+        for arrays in [(X, Y, Z), (np.transpose(X), np.transpose(Y), np.transpose(Z))]:
+            extent = grid_extent(*arrays[:2])
+            if extent is not None: return HeightField(arrays[2], image, *args, extent=extent, smooth=smooth)
+    return Mesh2(*triangulate_grid(X, Y, Z), *args, **kwargs)
+
+def triangulate_grid_tile(arrays, rows, columns, mask=None, normals='area'):
+    """Triangulate one rectangular block of cells of a 2d grid.
+
+    Normals are computed with a halo of one cell around the block, so that vertices on its edges
+    get the same normals as in the neighbouring blocks and the blocks join up seamlessly.
+
+    Args:
+        arrays: meshgrid coordinate arrays (e.g. memory-mapped), of which only the block is read.
+        rows, columns: (start, stop) range of the cells in the block.
+        mask: boolean array over the grid points, True where data is missing; triangles touching
+              a missing point (or a non-finite coordinate) are dropped.
+        normals: weighting of the vertex normals (see vertex_normals), or None for none.
+    Returns:
+        coordinates: vertex coordinates of the block referenced by triangulation.
+        triangulation: (n x 3) int32 array giving vertex indices for each triangle.
+        normals: vertex normals (None if not computed).
+    """
+    nrows, ncols = arrays[0].shape
+    (r0, r1), (c0, c1) = rows, columns
+    h0, h1 = max(r0-1, 0), min(r1+1, nrows-1)
+    g0, g1 = max(c0-1, 0), min(c1+1, ncols-1)
+
+    block = [np.asarray(a[h0:h1+1, g0:g1+1], dtype=float) for a in arrays]
+    valid = np.logical_and.reduce([np.isfinite(b) for b in block])
+    if mask is not None: valid &= ~np.asarray(mask[h0:h1+1, g0:g1+1], dtype=bool)
+
+    coordinates, triangulation = triangulate_grid(*block)
+    triangulation = triangulation[valid.reshape(-1)[triangulation].all(axis=1)]
+    if normals is not None: normals = vertex_normals(coordinates, triangulation, normals)
+
+    # Keep only the triangles of cells inside the block (rather than its halo).
+    width = g1 - g0 + 1
+    cell_rows = h0 + triangulation.min(axis=1) // width
+    cell_cols = g0 + (triangulation % width).min(axis=1)
+    inside = (cell_rows >= r0) & (cell_rows < r1) & (cell_cols >= c0) & (cell_cols < c1)
+    triangulation = triangulation[inside]
+
+    used = np.zeros(len(coordinates), dtype=bool)
+    used[triangulation.reshape(-1)] = True
+    remap = (np.cumsum(used) - 1).astype(np.int32)
+    coordinates = coordinates[used]
+    if normals is not None: normals = normals[used]
+    return coordinates, remap[triangulation], normals
+
+class GridTiles:
+    """Sequence of Mesh2 tiles of a large grid, each triangulated only when it is accessed.
+
+    Used as the children of a TiledMesh, so that tiles are generated, written and discarded one
+    after another; any further items (e.g. pigments) follow the tiles.
+    """
+
+    def __init__(self, arrays, tile_size, mask, normals, extra, options):
+        self.arrays = arrays
+        self.tile_size = tile_size
+        self.mask = mask
+        self.normals = normals
+        self.extra = list(extra)
+        self.options = options
+        nrows, ncols = arrays[0].shape
+        self.row_starts = range(0, nrows-1, tile_size)
+        self.column_starts = range(0, ncols-1, tile_size)
+        self.ntiles = len(self.row_starts) * len(self.column_starts)
+
+    def __len__(self):
+        return self.ntiles + len(self.extra)
+
+    def __iadd__(self, extra):
+        self.extra += extra
+        return self
+
+    def __iter__(self):
+        for i in range(len(self)): yield self[i]
+
+    def __getitem__(self, index):
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self): raise IndexError('tile index out of range')
+        if index >= self.ntiles: return self.extra[index - self.ntiles]
+
+        nrows, ncols = self.arrays[0].shape
+        r0 = self.row_starts[index // len(self.column_starts)]
+        c0 = self.column_starts[index % len(self.column_starts)]
+        rows = (r0, min(r0 + self.tile_size, nrows-1))
+        columns = (c0, min(c0 + self.tile_size, ncols-1))
+        coordinates, triangulation, normals = triangulate_grid_tile(self.arrays, rows, columns, self.mask,
+                                                                    self.normals)
+        # A tile with every cell missing has nothing to draw.
+        if not len(triangulation): return Expression('')
+
+        options = dict(self.options)
+        if options.get('data_prefix') is not None:
+            options['data_prefix'] = '{}_{}'.format(options['data_prefix'], index)
+        return Mesh2(coordinates, triangulation, normals='flat' if normals is None else normals, **options)
+
+class TiledMesh(Primitive):
+    """Union of Mesh2 tiles covering a (possibly huge, memory-mapped) grid, streamed tile by tile.
+
+    Only one tile (plus a one-cell halo) is held in memory at a time while the script is written,
+    however large the grid. Triangles touching missing data are left out. Passes over the tree
+    (e.g. instancing.declare_repeats, culling.cull or the parallel writer) treat it as a leaf, so
+    they never generate its tiles.
+    """
+
+    header = 'union'
+    generated_children = True
+
+    def __init__(self, X, Y, Z, *args, tile_size=1024, mask=None, normals='area', **kwargs):
+        """
+        Args:
+            X, Y, Z: meshgrid coordinates; these are broadcast against each other, so e.g. sparse
+                     meshgrids (numpy.meshgrid(..., sparse=True)) need not be expanded.
+            tile_size: number of cells along each side of a tile.
+            mask: boolean array over the grid points, True where data is missing (non-finite
+                  coordinates are always treated as missing).
+            normals: weighting of the vertex normals (see vertex_normals), or 'flat'/None for none.
+            kwargs: further options for each Mesh2 (precision, inside_vector, chunk_size, and a
+                    data_prefix to which the tile index is appended).
+        """
+        value = kwargs.pop('value', None)
+        super().__init__(value=value)
+        if normals == 'flat': normals = None
+        self.children = GridTiles(np.broadcast_arrays(X, Y, Z), tile_size, mask, normals, args, kwargs)
+
+# Corners of a cube are numbered by their offsets x + 2y + 4z, and each edge joins a corner to the
+# corner one step further along an axis.
+cube_corners = np.array([[(k >> a) & 1 for a in range(3)] for k in range(8)])
+cube_edges = [(k, k | (1 << a), a) for a in range(3) for k in range(8) if not k & (1 << a)]
+
+@functools.lru_cache(maxsize=None)
+def marching_cubes_table():
+    """Triangles of the iso-surface through a cube for each of the 256 configurations of its corners.
+
+    The table is built from scratch: on each face of the cube, the points where the surface crosses
+    its edges are joined in pairs, always cutting off the inside corners on faces where this is
+    ambiguous. That choice only depends on the face itself, so neighbouring cubes agree and the
+    surface has no cracks. The joins form closed loops which are oriented so that triangles face
+    away from the inside (larger values), and then triangulated as fans.
+
+    Returns:
+        counts: (256) number of triangles for each configuration.
+        triangles: (256 x max_count x 3) edge indices (see cube_edges) of the corners of each
+                   triangle, padded with -1.
+    """
+    edge_index = {(c0, c1): e for e, (c0, c1, a) in enumerate(cube_edges)}
+    edge_index.update({(c1, c0): e for (c0, c1), e in list(edge_index.items())})
+    faces = []
+    for a in range(3):
+        b, c = (a+1) % 3, (a+2) % 3
+        for side in range(2):
+            loop = [(0, 0), (1, 0), (1, 1), (0, 1)]
+            faces.append([(side << a) | (u << b) | (v << c) for u, v in loop])
+
+    midpoints = np.array([0.5*(cube_corners[c0] + cube_corners[c1]) for c0, c1, a in cube_edges])
+    table = []
+    for config in range(256):
+        inside = [(config >> k) & 1 for k in range(8)]
+
+        # Join the crossing points on each face.
+        neighbours = {}
+        def join(e1, e2):
+            neighbours.setdefault(e1, []).append(e2)
+            neighbours.setdefault(e2, []).append(e1)
+        for face in faces:
+            sides = [edge_index[face[i], face[(i+1) % 4]] for i in range(4)]
+            crossings = [i for i in range(4) if inside[face[i]] != inside[face[(i+1) % 4]]]
+            if len(crossings) == 2:
+                join(sides[crossings[0]], sides[crossings[1]])
+            elif len(crossings) == 4:
+                for i in range(4):
+                    if inside[face[i]]: join(sides[i-1], sides[i])
+
+        triangles = []
+        while neighbours:
+            # Follow a loop of crossing points around the cube.
+            start = min(neighbours)
+            loop, previous = [start], None
+            while True:
+                following = [e for e in neighbours[loop[-1]] if e != previous]
+                previous, current = loop[-1], following[0]
+                if current == start: break
+                loop.append(current)
+            for e in loop: del neighbours[e]
+
+            # Orient the loop so its normal points away from the inside corners along its edges.
+            points = midpoints[loop]
+            normal = np.sum(np.cross(points, np.roll(points, -1, axis=0)), axis=0)
+            inwards = np.sum([(cube_corners[c1] - cube_corners[c0]) * (1 if inside[c1] else -1)
+                              for c0, c1, a in [cube_edges[e] for e in loop]], axis=0)
+            if np.dot(normal, inwards) > 0: loop = loop[::-1]
+            triangles += [(loop[0], loop[i], loop[i+1]) for i in range(1, len(loop)-1)]
+        table.append(triangles)
+
+    counts = np.array([len(triangles) for triangles in table])
+    padded = -np.ones((256, counts.max(), 3), dtype=int)
+    for config, triangles in enumerate(table):
+        if triangles: padded[config,:len(triangles)] = triangles
+    return counts, padded
+
+def marching_cubes(volume, level, spacing=(1, 1, 1), origin=(0, 0, 0), slab_size=32):
+    """Extract a triangulated iso-surface from a 3d scalar field, ready for Mesh2.
+
+    Every cube of the grid is classified at once with array operations, a slab of planes at a time
+    so that large (e.g. memory-mapped) volumes are processed in bounded memory. Vertices lie on
+    the grid edges crossing the surface and are shared by every triangle touching them, including
+    across slabs.
+
+    Args:
+        volume: (nx x ny x nz) array of values; volume[i,j,k] is at origin + (i, j, k)*spacing.
+        level: value of the iso-surface; values above it are inside.
+        spacing: distance between grid points along each axis.
+        origin: position of volume[0,0,0].
+        slab_size: number of planes of cubes processed at a time along the first axis.
+    Returns:
+        coordinates: (n x 3) vertex coordinates.
+        triangulation: (m x 3) int array giving vertex indices for each triangle.
+        normals: (n x 3) unit vertex normals, from the gradient of the field (pointing outwards).
+    """
+    counts, table = marching_cubes_table()
+    nx, ny, nz = volume.shape
+    spacing = np.broadcast_to(np.asarray(spacing, dtype=float), 3)
+    origin = np.broadcast_to(np.asarray(origin, dtype=float), 3)
+
+    edge_start = np.array([cube_corners[c0] for c0, c1, a in cube_edges])
+    edge_axis = np.array([a for c0, c1, a in cube_edges])
+    axis_step = np.eye(3, dtype=int)
+
+    edge_ids, positions, gradients, faces = [], [], [], []
+    for i0 in range(0, nx-1, slab_size):
+        i1 = min(i0 + slab_size, nx-1)
+        # Read one plane of halo either side, so gradients on slab boundaries are those of the whole volume.
+        h0, h1 = max(i0-1, 0), min(i1+2, nx)
+        block = np.asarray(volume[h0:h1], dtype=float)
+        values = block[i0-h0:i1-h0+1]
+
+        inside = values > level
+        config = np.zeros((i1-i0, ny-1, nz-1), dtype=np.uint8)
+        for k, (x, y, z) in enumerate(cube_corners):
+            config |= inside[x:x+i1-i0, y:y+ny-1, z:z+nz-1].astype(np.uint8) << k
+        cubes = np.flatnonzero(counts[config].reshape(-1))
+        if not len(cubes): continue
+
+        # One row per triangle of each cube crossing the surface.
+        config = config.reshape(-1)[cubes]
+        ntriangles = counts[config]
+        cube = np.repeat(cubes, ntriangles)
+        triangle = np.arange(len(cube)) - np.repeat(np.cumsum(ntriangles) - ntriangles, ntriangles)
+        edges = table[np.repeat(config, ntriangles), triangle]
+
+        # Identify each edge globally by its starting grid point and direction.
+        cx, cy, cz = np.unravel_index(cube, (i1-i0, ny-1, nz-1))
+        start = np.stack((cx[:,None] + i0 + edge_start[edges,0], cy[:,None] + edge_start[edges,1],
+                          cz[:,None] + edge_start[edges,2]), axis=-1)
+        ids = (np.ravel_multi_index(tuple(np.moveaxis(start, -1, 0)), (nx, ny, nz)) * 3 + edge_axis[edges])
+        unique, first, inverse = np.unique(ids.reshape(-1), return_index=True, return_inverse=True)
+
+        # Interpolate positions and gradients along each crossing edge.
+        p0 = start.reshape(-1, 3)[first]
+        p1 = p0 + axis_step[(unique % 3)]
+        v0 = block[p0[:,0]-h0, p0[:,1], p0[:,2]]
+        v1 = block[p1[:,0]-h0, p1[:,1], p1[:,2]]
+        t = ((level - v0) / (v1 - v0))[:,None]
+        grad = np.stack(np.gradient(block, *spacing), axis=-1)
+        g0 = grad[p0[:,0]-h0, p0[:,1], p0[:,2]]
+        g1 = grad[p1[:,0]-h0, p1[:,1], p1[:,2]]
+
+        edge_ids.append(unique)
+        positions.append(origin + (p0 + t*(p1 - p0)) * spacing)
+        gradients.append(g0 + t*(g1 - g0))
+        faces.append(unique[inverse.reshape(-1, 3)])
+
+    if not edge_ids: return np.zeros((0, 3)), np.zeros((0, 3), dtype=int), np.zeros((0, 3))
+
+    # Edges on the planes between slabs appear in both, with identical positions and gradients.
+    edge_ids = np.concatenate(edge_ids)
+    unique, first, inverse = np.unique(edge_ids, return_index=True, return_inverse=True)
+    coordinates = np.concatenate(positions)[first]
+    gradient = np.concatenate(gradients)[first]
+    triangulation = np.searchsorted(unique, np.concatenate(faces))
+    if len(unique) <= np.iinfo(np.int32).max: triangulation = triangulation.astype(np.int32)
+
+    norm = np.linalg.norm(gradient, axis=1)
+    norm[norm == 0] = 1
+    return coordinates, triangulation, -gradient / norm[:,None]
@@ -15,59 +15,237 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
 import numpy as np
-from scipy.spatial.distance import pdist, squareform
+from itertools import chain
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import cKDTree
 
 from .primitives import *
 from .directives import *
 from .pigments import *
 from .lines import *
 from .scene import *
+from .mesh import Mesh2, marching_cubes
+from . import culling
+from .culling import CameraView
 
 default_epsilon = 1e-12
 default_diameter = 1
 default_bond_threshold = default_diameter + default_epsilon
 
-def ball_and_stick(coordinates, ball_radius, stick_radius, bonds=None, bond_threshold=default_bond_threshold):
+def find_bonds(coordinates, bond_threshold=default_bond_threshold, box=None):
+    """Find all pairs of particles closer than a threshold distance.
+
+    Uses a k-d tree so that only nearby pairs are examined, rather than all n^2 pairs.
+
+    Args:
+        coordinates: (n x d) particle positions.
+        bond_threshold: particles are bonded when their separation is below this distance.
+        box: side length(s) of a periodic box with a corner at the origin, in which case
+             separations follow the minimum-image convention (None for no periodicity).
+    Returns:
+        (m x 2) int array of bonded particle indices (i, j) with i < j, sorted by i then j.
+    """
+    if box is not None:
+        # np.mod can round tiny negative values up to exactly box, which the tree rejects.
+        coordinates = np.mod(coordinates, box)
+        coordinates = np.where(coordinates >= box, coordinates - box, coordinates)
+    tree = cKDTree(coordinates, boxsize=box)
+    bonds = tree.query_pairs(bond_threshold, output_type='ndarray')
+
+    # query_pairs includes separations equal to the threshold, but bonds must be strictly closer.
+    separations = minimum_image(coordinates[bonds[:,1]] - coordinates[bonds[:,0]], box)
+    bonds = bonds[np.linalg.norm(separations, axis=1) < bond_threshold]
+
+    bonds = np.sort(bonds, axis=1)
+    return bonds[np.lexsort((bonds[:,1], bonds[:,0]))]
+
+def minimum_image(displacements, box=None):
+    """Apply the minimum-image convention to displacement vectors in a periodic box.
+
+    Args:
+        displacements: (n x d) displacement vectors.
+        box: side length(s) of the periodic box (None for no periodicity).
+    Returns:
+        Shortest periodic images of the displacements.
+    """
+    if box is None: return displacements
+    box = np.asarray(box, dtype=float)
+    return displacements - box * np.round(displacements / box)
+
+class NeighbourList:
+    """Verlet neighbour list finding bonds across consecutive frames of a trajectory.
+
+    Candidate pairs are found within the bond threshold plus a skin distance. Until some particle has
+    moved more than half the skin since then, no pair outside the candidates can have come within
+    the threshold, so each frame only filters the candidates instead of searching all particles.
+    """
+
+    def __init__(self, bond_threshold=default_bond_threshold, skin=0.3, box=None):
+        """
+        Args:
+            bond_threshold: particles are bonded when their separation is below this distance.
+            skin: extra distance within which candidate pairs are kept.
+            box: side length(s) of a periodic box (see find_bonds).
+        """
+        self.bond_threshold = bond_threshold
+        self.skin = skin
+        self.box = box
+        self.reference = None
+        self.candidates = None
+        self.builds = 0
+        self.frames = 0
+
+    def needs_rebuild(self, coordinates):
+        if self.reference is None or self.reference.shape != coordinates.shape: return True
+        displacements = minimum_image(coordinates - self.reference, self.box)
+        return np.max(np.einsum('ij,ij->i', displacements, displacements)) > (0.5*self.skin)**2
+
+    def build(self, coordinates):
+        self.candidates = find_bonds(coordinates, self.bond_threshold + self.skin, self.box)
+        self.reference = np.array(coordinates, dtype=float)
+        self.builds += 1
+
+    def bonds(self, coordinates):
+        """Bonds for a frame, identical to find_bonds(coordinates, bond_threshold, box).
+
+        Args:
+            coordinates: (n x d) particle positions.
+        Returns:
+            (m x 2) int array of bonded particle indices, sorted as by find_bonds.
+        """
+        coordinates = np.asarray(coordinates)
+        if self.needs_rebuild(coordinates): self.build(coordinates)
+        self.frames += 1
+
+        i, j = self.candidates.T
+        separations = minimum_image(coordinates[j] - coordinates[i], self.box)
+        return self.candidates[np.einsum('ij,ij->i', separations, separations) < self.bond_threshold**2]
+
+def ball_and_stick(coordinates, ball_radius, stick_radius, bonds=None, bond_threshold=default_bond_threshold, box=None,
+                   data_prefix=None):
+    """Create a ball and stick model of a molecule or other set of bonded particles.
+
+    Args:
+        coordinates: (n x d) particle positions.
+        ball_radius: radius of the spheres representing the particles.
+        stick_radius: radius of the cylinders representing the bonds.
+        bonds: (m x 2) int array of bonded particle indices; if None then bonds are found between
+               particles closer than bond_threshold (see find_bonds). An (n x n) boolean adjacency
+               matrix is also accepted.
+        bond_threshold: maximum separation for particles to be bonded when bonds is None.
+        box: side length(s) of a periodic box; bonds across its boundaries are drawn as two
+             half-sticks leaving each particle towards its partner's nearest image.
+        data_prefix: if not None, the balls and sticks are written to the data files
+                     {data_prefix}_atoms.dat and {data_prefix}_bonds.dat which are read back by
+                     the script (see Batch).
+    Returns:
+        balls: merge of spheres for each particle.
+        sticks: merge of cylinders for each bond.
+    """
     n, d = coordinates.shape
 
-    balls = Merge()
-    for x in coordinates:
-        balls += [Sphere(x, ball_radius)]
+    def data_file(suffix):
+        if data_prefix is None: return None
+        return '{}_{}.dat'.format(data_prefix, suffix)
+
+    balls = Merge(SphereBatch(coordinates, ball_radius, data_file=data_file('atoms')))
 
     if bonds is None:
-        bonds = squareform(pdist(coordinates) < bond_threshold)
+        bonds = find_bonds(coordinates, bond_threshold, box)
+    else:
+        bonds = np.asarray(bonds)
+        if bonds.dtype == bool: bonds = np.argwhere(np.triu(bonds, 1))
+        bonds = bonds.reshape(-1, 2)
 
-    if not bonds.any():
+    if not len(bonds):
         raise RuntimeError('no bonds found between particles!')
 
-    sticks = Merge()
-    for i in range(len(coordinates)):
-        x1 = coordinates[i]
-        for j in range(i+1, len(coordinates)):
-            if bonds[i, j]:
-                x2 = coordinates[j]
-                sticks += line([x1, x2], stick_radius)
+    start = coordinates[bonds[:,0]]
+    end = coordinates[bonds[:,1]]
+    separation = minimum_image(end - start, box)
+
+    if box is not None:
+        # Bonds wrapping around the box are split into a half-stick leaving each particle.
+        wrapped = np.any(~np.isclose(start + separation, end), axis=1)
+        half = 0.5*separation[wrapped]
+        start, end = (np.concatenate((start[~wrapped], start[wrapped], end[wrapped])),
+                      np.concatenate((end[~wrapped], start[wrapped] + half, end[wrapped] - half)))
+
+    nonzero = np.any(start != end, axis=1)
+    sticks = Merge(CylinderBatch(start[nonzero], end[nonzero], stick_radius, data_file=data_file('bonds')))
 
     return Union(balls, sticks)
 
-def scene(coordinates, ball_radius=0.5, stick_radius=0.05,
-          perspective=True, camera_distance=4,
-          ball_colour='White', ball_alpha=0.8, stick_colour='Yellow',
-          **kwargs):
+def gaussian_density(coordinates, sigma=0.5, spacing=0.1, cutoff=3, chunk_size=64):
+    """Sum of gaussians centred on each particle, sampled on a regular grid.
 
-    n, d = coordinates.shape
-    assert d == 3
+    Each particle only contributes to the cube of grid points within cutoff*sigma of it. Gaussians
+    are separable, so these contributions are outer products of three 1d gaussians, and those of
+    chunk_size particles at a time are accumulated with one bincount.
 
-    max_distance = np.max(np.linalg.norm(coordinates, axis=1))
-    camera_position = np.random.random(d)
-    camera_position /= np.linalg.norm(camera_position)
-    camera_position *= camera_distance*max_distance
+    Args:
+        coordinates: (n x 3) particle positions.
+        sigma: width of each gaussian.
+        spacing: distance between grid points.
+        cutoff: range of each gaussian in units of sigma; the grid extends this far past the particles.
+        chunk_size: number of particles processed at a time.
+    Returns:
+        density: (nx x ny x nz) density on the grid.
+        origin: position of density[0,0,0].
+    """
+    radius = cutoff * sigma
+    origin = np.min(coordinates, axis=0) - radius
+    shape = np.ceil((np.max(coordinates, axis=0) + radius - origin) / spacing).astype(int) + 1
+    strides = np.array([shape[1]*shape[2], shape[2], 1])
 
-    focus_position = np.zeros(d)
+    reach = int(np.ceil(radius / spacing))
+    stencil = np.arange(-reach, reach+1)
 
-    camera_position_reference = 'cameraPos'
-    focus_position_reference = 'focusPos'
+    density = np.zeros(np.prod(shape))
+    for start in range(0, len(coordinates), chunk_size):
+        x = coordinates[start:start+chunk_size]
+        points = np.rint((x - origin) / spacing).astype(int)[:,:,None] + stencil
+        weights = np.exp(-0.5*((origin[:,None] + points*spacing - x[:,:,None])/sigma)**2)
+        # Points outside the grid (only possible near its edges) contribute nothing.
+        outside = (points < 0) | (points >= shape[:,None])
+        weights[outside] = 0
+        points[outside] = 0
+
+        indices = points * strides[:,None]
+        indices = indices[:,0,:,None,None] + indices[:,1,None,:,None] + indices[:,2,None,None,:]
+        weights = weights[:,0,:,None,None] * weights[:,1,None,:,None] * weights[:,2,None,None,:]
+        density += np.bincount(indices.reshape(-1), weights.reshape(-1), minlength=len(density))
+
+    return density.reshape(shape), origin
+
+def density_surface(coordinates, *args, sigma=0.5, level=0.5, spacing=0.1, **kwargs):
+    """Smooth molecular surface: an iso-surface of the gaussian density of the particles.
+
+    Args:
+        coordinates: (n x 3) particle positions.
+        args: modifiers for the Mesh2.
+        sigma, spacing: see gaussian_density.
+        level: density of the surface (an isolated particle's surface is at
+               distance sigma*sqrt(-2 log(level)) from its centre).
+        kwargs: further options for the Mesh2.
+    Returns:
+        Mesh2 of the surface.
+    """
+    density, origin = gaussian_density(coordinates, sigma, spacing)
+    vertices, triangulation, normals = marching_cubes(density, level, spacing, origin)
+    return Mesh2(vertices, triangulation, *args, normals=normals, **kwargs)
+
+def materials(ball_colour='White', ball_alpha=0.8, stick_colour='Yellow'):
+    """Finishes and pigments of a ball and stick model.
+
+    Returns:
+        declarations: directives declaring the finishes.
+        ball_modifiers: pigment and finish to add to the balls.
+        stick_modifiers: pigment and finish to add to the sticks.
+    """
     ball_pigment = Pigment( Colour(ball_colour), Transmit(ball_alpha) )
     stick_pigment = Pigment( Colour(stick_colour) )
 
@@ -80,39 +258,204 @@ def scene(coordinates, ball_radius=0.5, stick_radius=0.05,
     stick_finish_definition = Finish( Ambient(0.1), Diffuse(0.8), Phong(0.1), PhongSize(40) )
     stick_finish_reference = Finish(value=stick_finish_name)
 
-    balls, sticks = ball_and_stick(coordinates, ball_radius, stick_radius, **kwargs)
-    balls += [ball_pigment, ball_finish_reference]
-    sticks += [stick_pigment, stick_finish_reference]
+    declarations = [Declare(ball_finish_name, ball_finish_definition),
+                    Declare(stick_finish_name, stick_finish_definition)]
+    return declarations, [ball_pigment, ball_finish_reference], [stick_pigment, stick_finish_reference]
+
+def camera_view(coordinates, perspective=True, camera_distance=4, camera_direction=None, sky_direction=None,
+                seed=None):
+    """Place a camera looking at the origin from outside a set of particles.
+
+    Args:
+        coordinates: (n x 3) particle positions, which set the distance of the camera.
+        perspective: perspective projection if True, otherwise orthographic.
+        camera_distance: distance of the camera in units of the furthest particle from the origin.
+        camera_direction: direction of the camera from the origin (random if None).
+        sky_direction: up direction of the camera (random if None).
+        seed: seed for the random directions, so that the camera is reproducible (if None they are
+              drawn from numpy's global random state).
+    Returns:
+        CameraView.
+    """
+    n, d = coordinates.shape
+    random = np.random if seed is None else np.random.default_rng(seed)
+
+    max_distance = np.max(np.linalg.norm(coordinates, axis=1))
+    camera_position = random.random(d) if camera_direction is None else np.array(camera_direction, dtype=float)
+    camera_position /= np.linalg.norm(camera_position)
+    camera_position *= camera_distance*max_distance
+
+    focus_position = np.zeros(d)
 
     right_direction = np.eye(1,d,0).reshape(-1)
     up_direction = np.eye(1,d,1).reshape(-1)
-    if perspective:
-        projection = Perspective()
-    else:
+    if not perspective:
         dimensions = np.max(coordinates, axis=1) - np.min(coordinates, axis=1)
         rescale = camera_distance*np.max(dimensions)
         right_direction *= rescale
         up_direction *= rescale
-        projection = Orthographic()
 
-    #sky_direction = np.eye(1,d,d-1).reshape(-1)
-    sky_direction = np.random.random(d)
+    sky_direction = random.random(d) if sky_direction is None else np.array(sky_direction, dtype=float)
     sky_direction /= np.linalg.norm(sky_direction)
 
+    return CameraView(camera_position, focus_position, sky_direction, right_direction, up_direction, perspective)
+
+def camera_and_light(view):
+    """Camera for a CameraView, with a parallel light source shining from behind it.
+
+    Returns:
+        List of directives and objects setting up the camera and light.
+    """
+    camera_position_reference = 'cameraPos'
+    focus_position_reference = 'focusPos'
+    projection = Perspective() if view.perspective else Orthographic()
+
     camera = Camera(projection, Location(camera_position_reference),
                     LookAt(focus_position_reference),
-                    Sky(pov_vector(sky_direction)),
-                    Right(pov_vector(right_direction)),
-                    Up(pov_vector(up_direction)))
+                    Sky(pov_vector(view.sky)),
+                    Right(pov_vector(view.right)),
+                    Up(pov_vector(view.up)))
     light = LightSource(camera_position_reference, Colour('White'),
                         Parallel(),
                         PointAt(focus_position_reference),
                         Shadowless())
 
-    scene = Scene()
-    scene += [Declare(ball_finish_name, ball_finish_definition),
-              Declare(stick_finish_name, stick_finish_definition),
-              Declare(camera_position_reference, value=pov_vector(camera_position)),
-              Declare(focus_position_reference, value=pov_vector(focus_position)),
-              camera, light, balls, sticks]
+    return [Declare(camera_position_reference, value=pov_vector(view.location)),
+            Declare(focus_position_reference, value=pov_vector(view.look_at)),
+            camera, light]
+
+def scene(coordinates, ball_radius=0.5, stick_radius=0.05,
+          perspective=True, camera_distance=4,
+          ball_colour='White', ball_alpha=0.8, stick_colour='Yellow',
+          camera_direction=None, sky_direction=None, seed=None,
+          cull=False, cull_contained=False, cull_margin=0.,
+          **kwargs):
+    """Scene of a ball and stick model viewed from outside.
+
+    Args:
+        coordinates: (n x 3) particle positions.
+        ball_radius, stick_radius: see ball_and_stick.
+        perspective, camera_distance, camera_direction, sky_direction, seed: see camera_view.
+        ball_colour, ball_alpha, stick_colour: see materials.
+        cull: drop balls and sticks outside the camera's view (see culled_scene to also get the
+              numbers of objects removed).
+        cull_contained: when culling, also drop balls buried entirely inside other balls.
+        cull_margin: distance outside the view within which objects are kept when culling.
+        kwargs: further options for ball_and_stick.
+    Returns:
+        The Scene.
+    """
+    scene, view = _scene_and_view(coordinates, ball_radius, stick_radius, perspective, camera_distance,
+                                  ball_colour, ball_alpha, stick_colour,
+                                  camera_direction, sky_direction, seed, kwargs)
+    if cull: culling.cull(scene, view, cull_contained, cull_margin)
     return scene
+
+def culled_scene(coordinates, ball_radius=0.5, stick_radius=0.05,
+                 perspective=True, camera_distance=4,
+                 ball_colour='White', ball_alpha=0.8, stick_colour='Yellow',
+                 camera_direction=None, sky_direction=None, seed=None,
+                 contained=False, margin=0., **kwargs):
+    """Scene of a ball and stick model without the objects the camera cannot see (see culling.cull).
+
+    Args:
+        contained: also drop balls buried entirely inside other balls.
+        margin: distance outside the view within which objects are kept.
+        Others: see scene.
+    Returns:
+        scene: the Scene.
+        removed: dictionary of the numbers of objects removed.
+    """
+    scene, view = _scene_and_view(coordinates, ball_radius, stick_radius, perspective, camera_distance,
+                                  ball_colour, ball_alpha, stick_colour,
+                                  camera_direction, sky_direction, seed, kwargs)
+    return scene, culling.cull(scene, view, contained, margin)
+
+def _scene_and_view(coordinates, ball_radius, stick_radius, perspective, camera_distance,
+                    ball_colour, ball_alpha, stick_colour, camera_direction, sky_direction, seed, kwargs):
+    """Scene of a ball and stick model together with the view of its camera (see scene)."""
+    n, d = coordinates.shape
+    assert d == 3
+
+    declarations, ball_modifiers, stick_modifiers = materials(ball_colour, ball_alpha, stick_colour)
+    view = camera_view(coordinates, perspective, camera_distance, camera_direction, sky_direction, seed)
+
+    balls, sticks = ball_and_stick(coordinates, ball_radius, stick_radius, **kwargs)
+    balls += ball_modifiers
+    sticks += stick_modifiers
+
+    scene = Scene()
+    scene += declarations + camera_and_light(view) + [balls, sticks]
+    return scene, view
+
+def _write_frame(path, include, coordinates, ball_radius, stick_radius, modifiers, version, kwargs):
+    """Write the script of one trajectory frame (executed by the workers of write_trajectory)."""
+    balls, sticks = ball_and_stick(coordinates, ball_radius, stick_radius, **kwargs)
+    balls += modifiers[0]
+    sticks += modifiers[1]
+    with open(path, 'w') as f: Script(Version(version), Include(include), balls, sticks).write(f)
+    return path
+
+def write_trajectory(frames, directory='.', frame_name='frame{:04d}.pov', include_name='trajectory.inc',
+                     ball_radius=0.5, stick_radius=0.05, perspective=True, camera_distance=4,
+                     ball_colour='White', ball_alpha=0.8, stick_colour='Yellow',
+                     camera_direction=None, sky_direction=None, seed=0, workers=1, skin=None, **kwargs):
+    """Write the scripts of a molecular-dynamics movie.
+
+    Everything shared between frames (settings, finishes, camera and light) is written once to an
+    include file; each frame's script only includes it and adds that frame's balls and sticks. The
+    camera is placed once from the first frame, so it does not move during the movie.
+
+    Frames are read lazily, so a memory-mapped trajectory is never loaded whole, and their scripts
+    are generated by a pool of worker processes holding only a few frames at a time.
+
+    Args:
+        frames: (T x n x 3) array (e.g. a numpy.memmap) or iterable of (n x 3) particle positions.
+        directory: where the scripts are written; render them with this as povray's working directory.
+        frame_name: format string for the file name of each frame's script.
+        include_name: file name of the shared include file.
+        ball_radius, stick_radius, perspective, camera_distance, ball_colour, ball_alpha, stick_colour:
+            as in scene.
+        camera_direction, sky_direction, seed: camera placement (see camera_and_light); unlike for
+            scene, the seed defaults to a fixed value so that reruns reproduce the same movie.
+        workers: number of processes generating frames (1 to generate them in this process).
+        skin: if not None, bonds are found in this process with a NeighbourList of this skin distance,
+              which is only rebuilt when particles have moved far enough.
+        kwargs: further options for ball_and_stick; a data_prefix is formatted with the frame index
+                (e.g. 'atoms{:04d}'), and should be absolute unless directory is the current directory.
+    Returns:
+        List of paths of the frame scripts.
+    """
+    frames = iter(frames)
+    first = np.asarray(next(frames))
+    frames = chain([first], frames)
+
+    declarations, ball_modifiers, stick_modifiers = materials(ball_colour, ball_alpha, stick_colour)
+    view = camera_view(first, perspective, camera_distance, camera_direction, sky_direction, seed)
+    shared = Scene()
+    shared += declarations + camera_and_light(view)
+    with open(os.path.join(directory, include_name), 'w') as f: shared.write(f)
+
+    version = shared.children[0].version
+    modifiers = (ball_modifiers, stick_modifiers)
+    data_prefix = kwargs.pop('data_prefix', None)
+    if skin is not None:
+        neighbours = NeighbourList(kwargs.get('bond_threshold', default_bond_threshold), skin, kwargs.get('box'))
+
+    def jobs():
+        for t, coordinates in enumerate(frames):
+            options = kwargs if data_prefix is None else dict(kwargs, data_prefix=data_prefix.format(t))
+            if skin is not None: options = dict(options, bonds=neighbours.bonds(coordinates))
+            yield (os.path.join(directory, frame_name.format(t)), include_name, np.asarray(coordinates),
+                   ball_radius, stick_radius, modifiers, version, options)
+
+    if workers == 1: return [_write_frame(*job) for job in jobs()]
+
+    # Keep a bounded window of frames in flight so that memory use does not grow with the movie.
+    paths, pending = [], deque()
+    with ProcessPoolExecutor(workers) as executor:
+        for job in jobs():
+            pending.append(executor.submit(_write_frame, *job))
+            if len(pending) >= 2*workers: paths.append(pending.popleft().result())
+        paths += [future.result() for future in pending]
+    return paths
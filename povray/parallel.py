@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .primitives import Batch, stream_writer, default_buffer_size
+
+# Tree being written, as seen by each worker process.
+_tree = None
+
+def _initialize(tree):
+    global _tree
+    _tree = tree
+
+def _resolve(path):
+    node = _tree
+    for i in path: node = node.children[i]
+    return node
+
+def _format(tasks):
+    """Format a group of tasks in a worker process.
+
+    Each task is either literal text, a (path, nest) pair for a subtree or a
+    (path, nest, start, stop) tuple for a block of items in a batch.
+    """
+    text = []
+    for task in tasks:
+        if type(task) is str:
+            text += [task]
+        elif len(task) == 2:
+            path, nest = task
+            text += _resolve(path).iter_chunks(nest)
+        else:
+            path, nest, start, stop = task
+            if start > 0: text += ['\n']
+            text += _resolve(path).take(slice(start, stop)).iter_chunks(nest)
+    return ''.join(text)
+
+def weight(node, weights):
+    """Estimated cost of writing a subtree, as its number of nodes or batch items."""
+    if id(node) not in weights:
+        # Generated children are not inspected, so they are only generated when written.
+        if node.generated_children: weights[id(node)] = 1 + len(node.children)
+        elif len(node.children): weights[id(node)] = 1 + sum([weight(child, weights) for child in node.children])
+        elif hasattr(node, '__len__'): weights[id(node)] = 1 + len(node)
+        else: weights[id(node)] = 1
+    return weights[id(node)]
+
+def partition(tree, nest, target):
+    """Split the script of a tree into groups of tasks of roughly equal cost.
+
+    Containers heavier than the target are expanded into their children, and batches heavier
+    than the target are split into blocks of items. Consecutive light tasks are grouped together.
+
+    Args:
+        tree: root node.
+        nest: indentation level of the root.
+        target: cost of each group of tasks.
+    Returns:
+        List of groups of tasks (see _format).
+    """
+    weights = {}
+    groups, group, cost = [], [], 0
+
+    def add(task, task_cost):
+        nonlocal group, cost
+        group += [task]
+        cost += task_cost
+        if cost >= target:
+            groups.append(group)
+            group, cost = [], 0
+
+    def visit(node, path, nest):
+        w = weight(node, weights)
+        if w > target and len(node.children) and not node.generated_children:
+            k = 0
+            for part in node.iter_parts(nest):
+                if type(part) is str: add(part, 0)
+                else:
+                    child, child_nest = part
+                    visit(child, path + (k,), child_nest)
+                    k += 1
+        elif w > target and isinstance(node, Batch) and node.data_file is None:
+            block = max(1, int(target))
+            for start in range(0, len(node), block):
+                stop = min(start + block, len(node))
+                add((path, nest, start, stop), stop - start)
+        else:
+            add((path, nest), w)
+
+    visit(tree, (), nest)
+    if group: groups.append(group)
+    return groups
+
+def write_parallel(tree, f=sys.stdout, nest=None, processes=None, tasks_per_process=8,
+                   buffer_size=default_buffer_size):
+    """Generate the povray script of a tree using a pool of worker processes.
+
+    The script is partitioned into independent pieces (subtrees, or blocks of items in large
+    batches) which are formatted in parallel and written out in order, so the output is
+    identical to Primitive.write. Workers receive the tree once when they start and then only the
+    paths of the subtrees to format. Under the 'fork' start method (the default on Linux) workers
+    inherit the tree without copying; under 'spawn' or 'forkserver' (the defaults on Windows and
+    macOS) the tree is pickled and sent to each worker once, so it must be picklable and the
+    start-up cost grows with its size.
+
+    Args:
+        tree: root node to write.
+        f: filestream to output to (see stream_writer).
+        nest: indentation level (defaults to the root's start_nest).
+        processes: number of worker processes (defaults to the number of cores).
+        tasks_per_process: number of pieces per worker, to balance uneven pieces.
+        buffer_size: number of characters to accumulate before writing.
+    """
+    if nest is None: nest = tree.start_nest
+    if processes is None: processes = os.cpu_count()
+    if processes <= 1: return tree.write(f, nest, buffer_size)
+
+    total = weight(tree, {})
+    groups = partition(tree, nest, max(1, total / (processes * tasks_per_process)))
+
+    write = stream_writer(f)
+    buffer, size = [], 0
+    with ProcessPoolExecutor(processes, initializer=_initialize, initargs=(tree,)) as executor:
+        # Only keep a limited number of pieces in flight, so memory use stays bounded.
+        pending = deque()
+        groups = iter(groups)
+        for group in groups:
+            pending.append(executor.submit(_format, group))
+            if len(pending) >= 2*processes: break
+        while pending:
+            text = pending.popleft().result()
+            group = next(groups, None)
+            if group is not None: pending.append(executor.submit(_format, group))
+
+            buffer.append(text)
+            size += len(text)
+            if size >= buffer_size:
+                write(''.join(buffer))
+                buffer, size = [], 0
+    if buffer: write(''.join(buffer))
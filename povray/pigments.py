@@ -17,18 +17,18 @@
 
 from .primitives import Primitive, Attribute
 
-class Pigment(Primitive): pass
-class Colour(Attribute): pass
-class Transmit(Attribute): pass
+class Pigment(Primitive): __slots__ = ()
+class Colour(Attribute): __slots__ = ()
+class Transmit(Attribute): __slots__ = ()
 
-class Finish(Primitive): pass
-class Ambient(Attribute): pass
-class Diffuse(Attribute): pass
-class Specular(Attribute): pass
-class Roughness(Attribute): pass
-class Reflection(Primitive): pass
-class Phong(Attribute): pass
-class PhongSize(Attribute): pass
+class Finish(Primitive): __slots__ = ()
+class Ambient(Attribute): __slots__ = ()
+class Diffuse(Attribute): __slots__ = ()
+class Specular(Attribute): __slots__ = ()
+class Roughness(Attribute): __slots__ = ()
+class Reflection(Primitive): __slots__ = ()
+class Phong(Attribute): __slots__ = ()
+class PhongSize(Attribute): __slots__ = ()
 
-class Interior(Primitive): pass
-class Ior(Attribute): pass
+class Interior(Primitive): __slots__ = ()
+class Ior(Attribute): __slots__ = ()
@@ -17,14 +17,63 @@
 
 import sys
 import io
+import os
+import hashlib
+import copy
+import numpy as np
 
 from .syntax import *
 
-class Primitive:
+default_buffer_size = 1 << 20
+
+def stream_writer(f):
+    """Obtain a function writing text to an output stream.
+
+    Args:
+        f: text or binary file object (e.g. the stdin pipe of a subprocess), socket, or raw
+           file descriptor.
+    Returns:
+        Function taking a string and writing it in full to the stream.
+    """
+    if isinstance(f, int):
+        def write(s):
+            data = memoryview(s.encode())
+            while len(data): data = data[os.write(f, data):]
+        return write
+    if hasattr(f, 'sendall'): return lambda s: f.sendall(s.encode())
+    if isinstance(f, io.TextIOBase): return f.write
+    if isinstance(f, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(f, 'mode', ''):
+        return lambda s: f.write(s.encode())
+    return f.write
+
+class Node(type):
+    """Metaclass for the tree of povray primitives.
+
+    The povray keyword for each class is derived from its name once, rather than on every write.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls.keyword = to_snake_case(name)
+        cls.automatic_header = 'header' not in namespace and all(getattr(base, 'automatic_header', True) for base in bases)
+        if cls.automatic_header: cls.header = cls.keyword
+        return cls
+
+class Primitive(metaclass=Node):
+    # Nodes are created in huge numbers, so the library's own classes declare __slots__ rather
+    # than carrying a per-instance __dict__ (subclasses without __slots__ get one as usual).
+    __slots__ = ('value', 'children')
+
+    body_open = '{'
+    body_close = '}'
+    start_nest = 0
+    # Nodes whose children are generated on demand (see mesh.TiledMesh) are treated as leaves by
+    # passes over the tree, so their children are only ever generated while being written.
+    generated_children = False
+
     def __init__(self, *args, value=None, **kwargs):
         self.value = value
-        self.children = [arg for arg in args]
-        self.children = list(chain(self.children)) # flatten list of lists
+        self.children = list(chain(args))
 
     def __iter__(self):
         for child in self.children: yield child
@@ -36,104 +85,162 @@ class Primitive:
         self.children += element
         return self
 
-    @property
-    def header(self):
-        return to_snake_case(self.__class__.__name__)
-
-    @property
-    def body_open(self):
-        return '{'
-
-    @property
-    def body_close(self):
-        return '}'
-
     @property
     def body(self):
-        if self.value is not None: return self.value
-        raise NotImplementedError
+        return self.value
 
-    @property
-    def start_nest(self):
-        return 0
+    def iter_body(self):
+        """Generate the body in pieces, so that large bodies can be streamed out."""
+        body = self.body
+        if body is not None: yield '{}'.format(body)
 
-    def write(self, f=sys.stdout, nest=None):
-        """Generate the povray script.
+    def iter_parts(self, nest):
+        """Generate the script of this node with its children left unexpanded.
 
         Args:
-            f: filestream to output to.
+            nest: indentation level.
+        Returns:
+            Generator yielding strings of this node's own text, interleaved with a (child, nest)
+            pair in place of each child.
         """
 
-        if nest is None: nest = self.start_nest
         indent = '  ' * nest
-        f.write('{}{}'.format(indent, self.header))
 
         if len(self.children):
-            if len(self.body_open): f.write('\n{}{}'.format(indent, self.body_open))
+            header = self.header
+            if len(self.body_open): yield '{}{}\n{}{}'.format(indent, header, indent, self.body_open)
+            else: yield '{}{}'.format(indent, header)
 
             # If a body is defined, then write it first.
-            try:
-                body = self.body
-                f.write('\n  {}{}'.format(indent, body))
-            except: pass
+            body = self.iter_body()
+            first = next(body, None)
+            if first is not None:
+                yield '\n  {}{}'.format(indent, first)
+                yield from body
 
             for i,child in enumerate(self.children):
-                if i > 0 or len(self.header): f.write('\n')
-                #if nest == 0: f.write('\n')
-                child.write(f, nest+1)
-            f.write('\n{}{}'.format(indent, self.body_close))
+                if i > 0 or len(header): yield '\n'
+                yield child, nest+1
+            yield '\n{}{}'.format(indent, self.body_close)
 
         else:
-            f.write('{}{}{}'.format(self.body_open, self.body, self.body_close))
+            yield '{}{}{}'.format(indent, self.header, self.body_open)
+            yield from self.iter_body()
+            yield self.body_close
+
+    def iter_chunks(self, nest=None):
+        """Generate the povray script in pieces.
+
+        Args:
+            nest: indentation level (defaults to start_nest).
+        Returns:
+            Generator yielding strings which concatenate to give the script.
+        """
+
+        if nest is None: nest = self.start_nest
+        for part in self.iter_parts(nest):
+            if type(part) is str: yield part
+            else:
+                child, child_nest = part
+                yield from child.iter_chunks(child_nest)
+
+    def write(self, f=sys.stdout, nest=None, buffer_size=default_buffer_size):
+        """Generate the povray script.
+
+        Output is accumulated into blocks of roughly buffer_size characters before each write,
+        so large scenes are streamed out in constant memory with few system calls.
+
+        Args:
+            f: filestream to output to (see stream_writer for the supported kinds of stream).
+            nest: indentation level (defaults to start_nest).
+            buffer_size: number of characters to accumulate before writing.
+        """
+
+        write = stream_writer(f)
+        buffer, size = [], 0
+        for chunk in self.iter_chunks(nest):
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                write(''.join(buffer))
+                buffer, size = [], 0
+        if buffer: write(''.join(buffer))
 
     def __repr__(self):
-        f = io.StringIO()
-        self.write(f)
-        return f.getvalue()
+        return ''.join(self.iter_chunks())
+
+    def signature(self):
+        """Hashable summary of this node's own content (excluding its children).
+
+        Two subtrees write out identically when their nodes have equal signatures and their
+        children match, which is used to find repeated subtrees (see instancing).
+        """
+        return (type(self), self.header, self.body_open, self.body_close, ''.join(self.iter_body()))
 
 class Attribute(Primitive):
     """Simple one line key-value attribute."""
 
+    __slots__ = ()
+
+    body_open = ' '
+    body_close = ' '
+
     def __init__(self, value, *args, **kwargs):
         super().__init__(*args, value=value, **kwargs)
 
-    @property
-    def body_open(self):
-        return ' '
-
     @property
     def body(self):
         return '{}'.format(self.value)
 
-    @property
-    def body_close(self):
-        return ' '
-
 class Flag(Attribute):
     """Attribute without a value."""
 
+    __slots__ = ()
+
+    body = ''
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, value=None, **kwargs)
 
-    @property
-    def body_open(self):
-        return ' '
+class Expression(Primitive):
+    """Povray expression or statement written out verbatim."""
 
-    @property
-    def body(self):
-        return ''
+    __slots__ = ()
 
-    @property
-    def body_open(self):
-        return ' '
+    header = ''
+    body_open = ''
+    body_close = ''
+
+    def __init__(self, value, *args, **kwargs):
+        super().__init__(*args, value=value, **kwargs)
+
+# Transformations:
+class Transformation(Attribute):
+    __slots__ = ()
+
+    def __init__(self, value, *args, **kwargs):
+        super().__init__(pov_vector(value), *args, **kwargs)
+
+class Translate(Transformation): __slots__ = ()
+class Rotate(Transformation): __slots__ = ()
+class Scale(Transformation): __slots__ = ()
+class Matrix(Transformation): __slots__ = ()
+
+# Reference to a declared object:
+class Object(Primitive): __slots__ = ()
 
 # Basic combinations of objects:
-class Union(Primitive): pass
-class Merge(Primitive): pass
-class Intersection(Primitive): pass
-class Difference(Primitive): pass
+class Union(Primitive): __slots__ = ()
+class Merge(Primitive): __slots__ = ()
+class Intersection(Primitive): __slots__ = ()
+class Difference(Primitive): __slots__ = ()
+
+# Manual bounding volume of an object:
+class BoundedBy(Primitive): __slots__ = ()
 
 class Sphere(Primitive):
+    __slots__ = ('position', 'radius')
+
     def __init__(self, position, radius, *args, **kwargs):
         self.position = pov_vector(position)
         self.radius = str(radius)
@@ -144,6 +251,8 @@ class Sphere(Primitive):
         return '{}, {}'.format(self.position, self.radius)
 
 class Cylinder(Primitive):
+    __slots__ = ('position1', 'position2', 'radius')
+
     def __init__(self, position1, position2, radius, *args, **kwargs):
         self.position1 = pov_vector(position1)
         self.position2 = pov_vector(position2)
@@ -155,6 +264,8 @@ class Cylinder(Primitive):
         return '{}, {}, {}'.format(self.position1, self.position2, self.radius)
 
 class Cone(Primitive):
+    __slots__ = ('position1', 'position2', 'radius1', 'radius2')
+
     def __init__(self, position1, position2, radius1, radius2, *args, **kwargs):
         self.position1 = pov_vector(position1)
         self.position2 = pov_vector(position2)
@@ -165,3 +276,309 @@ class Cone(Primitive):
     @property
     def body(self):
         return '{}, {}, {}, {}'.format(self.position1, self.radius1, self.position2, self.radius2)
+
+class SphereSweep(Primitive):
+    """Sphere swept along a spline through a sequence of points, i.e. a smooth tube of one object."""
+
+    __slots__ = ('points', 'radii', 'spline', 'precision')
+
+    def __init__(self, points, radii, *args, spline='linear_spline', precision=None, **kwargs):
+        self.points = np.asarray(points)
+        self.radii = np.broadcast_to(radii, len(self.points))
+        self.spline = spline
+        self.precision = precision
+        super().__init__(*args, **kwargs)
+
+    @property
+    def body(self):
+        return ''.join(self.iter_body())
+
+    def iter_body(self):
+        number = number_format(np.dtype(float), self.precision)
+        row = '<{0}, {0}, {0}>, {0}'.format(number)
+        values = np.column_stack((self.points, self.radii)).astype(float)
+        yield '{} {}, '.format(self.spline, len(values))
+        yield ', '.join([row] * len(values)) % tuple(values.ravel().tolist())
+
+class Box(Primitive):
+    __slots__ = ('corner1', 'corner2')
+
+    def __init__(self, corner1, corner2, *args, **kwargs):
+        self.corner1 = pov_vector(corner1)
+        self.corner2 = pov_vector(corner2)
+        super().__init__(*args, **kwargs)
+
+    @property
+    def body(self):
+        return '{}, {}'.format(self.corner1, self.corner2)
+
+class Batch(Primitive):
+    """Many objects of the same type, with their parameters held as contiguous arrays.
+
+    Each item is written out exactly as the equivalent individual object would be (e.g. a
+    SphereBatch writes a sequence of sphere objects), but all items are formatted together a
+    block at a time rather than going through a python object per item. Batches can be placed
+    inside a Union, Merge etc. like any other child.
+
+    Items can optionally be coloured individually by indexing into a palette of colours.
+
+    For large batches the parameters can instead be written to a separate data file, which the
+    script reads back in a #for loop instantiating a macro per item. The script is then much
+    smaller and povray parses it much faster than the equivalent literal objects. The file is
+    written when the batch is created (see write_data), so writing the script out repeatedly
+    does not rewrite it. Parameters taking the same value for every item (e.g. a single radius)
+    are declared once in the script rather than repeated on every row.
+    """
+
+    __slots__ = ('colours', 'colour_indices', 'precision', 'data_file', 'chunk_size')
+    item = Primitive
+    # Attributes holding one row per item, which are sliced when taking a subset.
+    row_fields = ()
+
+    def __init__(self, colours=None, colour_indices=None, precision=None, data_file=None,
+                 chunk_size=default_chunk_size):
+        """
+        Args:
+            colours: palette of povray colour expressions (e.g. 'Red' or 'rgb <1,0,0>').
+            colour_indices: index into the palette for each item.
+            precision: significant figures written for each number (None for full precision).
+            data_file: if not None, path of the data file written alongside the script.
+            chunk_size: number of items formatted at a time.
+        """
+        if (colours is None) != (colour_indices is None):
+            raise ValueError('colours and colour_indices must be given together')
+        self.colours = colours
+        self.colour_indices = colour_indices
+        self.precision = precision
+        self.data_file = data_file
+        self.chunk_size = chunk_size
+        super().__init__()
+        if data_file is not None: self.write_data()
+
+    @property
+    def fields(self):
+        """Arrays of parameters for each item, in the order they appear in the item's body."""
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.fields[0])
+
+    @property
+    def header(self):
+        return to_snake_case(self.item.__name__)
+
+    def signature(self):
+        digest = hashlib.sha1()
+        for field in self.fields:
+            # Integer and float fields are written differently, even when their values are equal.
+            digest.update(np.asarray(field).dtype.kind.encode())
+            digest.update(np.ascontiguousarray(field, dtype=float).tobytes())
+        if self.colours is not None: digest.update(np.ascontiguousarray(self.colour_indices).tobytes())
+        # The palette may be any sequence of colour expressions, including a numpy array of strings.
+        colours = None if self.colours is None else tuple(map(str, np.asarray(self.colours).ravel()))
+        return (type(self), len(self), digest.hexdigest(), colours, self.precision, self.data_file)
+
+    def instance(self, *values):
+        """Create a single item from one value (or identifier) per field."""
+        return self.item(*values)
+
+    def bounding_spheres(self):
+        """Centres (n x 3) and radii (n) of spheres enclosing each item."""
+        raise NotImplementedError
+
+    def bounding_boxes(self):
+        """Lower and upper corners (n x 3 each) of axis-aligned boxes enclosing each item."""
+        centres, radii = self.bounding_spheres()
+        radii = np.asarray(radii)[:,None]
+        return centres - radii, centres + radii
+
+    def iter_chunks(self, nest=None):
+        if nest is None: nest = self.start_nest
+        if self.data_file is not None:
+            yield from self.iter_data_chunks(nest)
+            return
+
+        # Integer fields are written as integers, as the equivalent individual objects would be.
+        fields = [np.asarray(field) for field in self.fields]
+        fields = [field if np.issubdtype(field.dtype, np.integer) else field.astype(float, copy=False)
+                  for field in fields]
+        numbers = [number_format(field.dtype, self.precision) for field in fields]
+        body = ', '.join(['<{}>'.format(', '.join([number] * field.shape[1])) if field.ndim > 1 else number
+                          for field, number in zip(fields, numbers)])
+        mixed = len({field.dtype for field in fields}) > 1
+        if self.colours is not None:
+            body += ' pigment{colour %s}'
+            palette = np.asarray(self.colours, dtype=object)
+        item = '{}{}{}{}{}'.format('  ' * nest, self.header, self.body_open, body, self.body_close)
+
+        for start in range(0, len(self), self.chunk_size):
+            stop = start + self.chunk_size
+            if mixed:
+                # Stacking would cast everything to float, so rows are assembled field by field.
+                columns = [field[start:stop].reshape(len(field[start:stop]), -1).tolist() for field in fields]
+                block = [list(chain.from_iterable(row)) for row in zip(*columns)]
+            else: block = np.column_stack([field[start:stop] for field in fields]).tolist()
+            if self.colours is not None:
+                colours = palette[self.colour_indices[start:stop]]
+                block = [row + [colour] for row, colour in zip(block, colours)]
+            text = '\n'.join([item] * len(block)) % tuple(chain.from_iterable(block))
+            if start > 0: text = '\n' + text
+            yield text
+
+    def take(self, indices, data_file=None):
+        """Batch of a subset of the items.
+
+        Args:
+            indices: indices (or slice) of the items to keep.
+            data_file: path of the subset's own data file (None to write it inline), which is
+                       written immediately. Subsets of a batch written to a data file need
+                       distinct paths to keep that mode.
+        Returns:
+            New batch of the same type with the same options.
+        """
+        subset = copy.copy(self)
+        for name in self.row_fields: setattr(subset, name, getattr(self, name)[indices])
+        if self.colours is not None: subset.colour_indices = np.asarray(self.colour_indices)[indices]
+        subset.data_file = data_file
+        if data_file is not None: subset.write_data()
+        return subset
+
+    def data_fields(self):
+        """Fields held in the data file, and whether each takes the same value for every item."""
+        fields = [np.asarray(field) for field in self.fields]
+        if self.colours is not None: fields += [np.asarray(self.colour_indices, dtype=int)]
+        constant = [len(field) > 0 and bool((field == field[0]).all()) for field in fields]
+        # At least one field stays in the file, so that every row has something to read.
+        if all(constant): constant[0] = False
+        return fields, constant
+
+    def write_data(self):
+        """Write the data file read back by the script.
+
+        This happens when the batch is created, so only needs calling again if its parameters
+        are changed afterwards.
+        """
+        fields, constant = self.data_fields()
+        fields = [field for field, same in zip(fields, constant) if not same]
+        write_data_file(self.data_file, fields, self.precision, self.chunk_size)
+
+    def iter_data_chunks(self, nest):
+        """Generate the script reading the data file back (see write_data)."""
+        from .directives import read_loop
+
+        name, objects, call, nvalues = self.data_macro()
+        objects += read_loop(name, self.data_file, len(self), nvalues, call)
+        for i, obj in enumerate(objects):
+            if i > 0: yield '\n'
+            yield from obj.iter_chunks(nest)
+
+    def data_macro(self):
+        """Directives defining a macro that creates an item from one row of the data file.
+
+        Returns:
+            name: identifier prefix of the data file's variables (see directives.read_loop).
+            directives: list of declarations, ending with the macro.
+            call: expression calling the macro with the values read from a row.
+            nvalues: number of values in each row.
+        """
+        from .directives import Macro, Declare
+        from .pigments import Pigment, Colour
+
+        fields, constant = self.data_fields()
+        nvalues = sum([np.prod(field.shape[1:], dtype=int) for field, same in zip(fields, constant) if not same])
+        name = to_identifier(self.data_file)
+
+        arguments = ['A{}'.format(i) for i in range(len(self.fields))]
+        item = self.instance(*arguments)
+        objects = []
+        if self.colours is not None:
+            palette = '{}_colours'.format(name)
+            objects += [Declare(palette, value='array[{}] {{{}}}'.format(len(self.colours), ', '.join(self.colours)))]
+            arguments += ['C']
+            item += [Pigment(Colour('{}[C]'.format(palette)))]
+        macro = '{}_item'.format(name)
+        objects += [Macro(macro, item, arguments=arguments)]
+
+        # Reassemble the values read from each row (or declared once) into the arguments of the macro.
+        values = iter(['{}_{}'.format(name, k) for k in range(nvalues)])
+        call = []
+        for i, (field, same) in enumerate(zip(fields, constant)):
+            if same:
+                number = number_format(field.dtype, self.precision)
+                if field.ndim > 1: number = '<{}>'.format(', '.join([number] * field.shape[1]))
+                declared = '{}_constant{}'.format(name, i)
+                objects += [Declare(declared, value=number % tuple(np.ravel(field[0]).tolist()))]
+                call += [declared]
+            elif field.ndim > 1: call += ['<{}>'.format(', '.join([next(values) for k in range(field.shape[1])]))]
+            else: call += [next(values)]
+        call = Expression('{}({})'.format(macro, ', '.join(call)))
+        return name, objects, call, nvalues
+
+class SphereBatch(Batch):
+    __slots__ = ('positions', 'radii')
+    item = Sphere
+    row_fields = ('positions', 'radii')
+
+    def __init__(self, positions, radii, **kwargs):
+        self.positions = np.asarray(positions)
+        self.radii = np.broadcast_to(radii, len(self.positions))
+        super().__init__(**kwargs)
+
+    @property
+    def fields(self):
+        return [self.positions, self.radii]
+
+    def bounding_spheres(self):
+        return self.positions, self.radii
+
+class CylinderBatch(Batch):
+    __slots__ = ('positions1', 'positions2', 'radii')
+    item = Cylinder
+    row_fields = ('positions1', 'positions2', 'radii')
+
+    def __init__(self, positions1, positions2, radii, **kwargs):
+        self.positions1 = np.asarray(positions1)
+        self.positions2 = np.asarray(positions2)
+        self.radii = np.broadcast_to(radii, len(self.positions1))
+        super().__init__(**kwargs)
+
+    @property
+    def fields(self):
+        return [self.positions1, self.positions2, self.radii]
+
+    def bounding_spheres(self):
+        half = 0.5*np.linalg.norm(self.positions2 - self.positions1, axis=1)
+        return 0.5*(self.positions1 + self.positions2), half + self.radii
+
+    def bounding_boxes(self):
+        radii = np.asarray(self.radii)[:,None]
+        return (np.minimum(self.positions1, self.positions2) - radii,
+                np.maximum(self.positions1, self.positions2) + radii)
+
+class ConeBatch(Batch):
+    __slots__ = ('positions1', 'positions2', 'radii1', 'radii2')
+    item = Cone
+    row_fields = ('positions1', 'positions2', 'radii1', 'radii2')
+
+    def __init__(self, positions1, positions2, radii1, radii2, **kwargs):
+        self.positions1 = np.asarray(positions1)
+        self.positions2 = np.asarray(positions2)
+        self.radii1 = np.broadcast_to(radii1, len(self.positions1))
+        self.radii2 = np.broadcast_to(radii2, len(self.positions1))
+        super().__init__(**kwargs)
+
+    @property
+    def fields(self):
+        return [self.positions1, self.radii1, self.positions2, self.radii2]
+
+    def instance(self, position1, radius1, position2, radius2):
+        return Cone(position1, position2, radius1, radius2)
+
+    def bounding_spheres(self):
+        half = 0.5*np.linalg.norm(self.positions2 - self.positions1, axis=1)
+        return 0.5*(self.positions1 + self.positions2), half + np.maximum(self.radii1, self.radii2)
+
+    def bounding_boxes(self):
+        radii = np.maximum(self.radii1, self.radii2)[:,None]
+        return (np.minimum(self.positions1, self.positions2) - radii,
+                np.maximum(self.positions1, self.positions2) + radii)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Render scenes by streaming their scripts straight into povray subprocesses."""
+
+import os
+import re
+import time
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .image import read_ppm, write_ppm, write_png
+
+default_executable = 'povray'
+
+class RenderError(RuntimeError):
+    pass
+
+RenderResult = namedtuple('RenderResult', ['output', 'parse_time', 'render_time', 'wall_time', 'attempts', 'log'])
+RenderResult.__doc__ = """Outcome of a render.
+
+Args:
+    output: path of the rendered image.
+    parse_time: time povray reported for parsing the scene (None if not reported).
+    render_time: time povray reported for tracing the image (None if not reported).
+    wall_time: elapsed time of the successful attempt, including streaming the scene.
+    attempts: number of attempts made.
+    log: povray's diagnostic output from the successful attempt.
+"""
+
+def reported_time(log, name):
+    """Extract a timing (in seconds) from povray's statistics, e.g. name='Parse' or 'Trace'."""
+    match = re.search(r'{} Time:.*\(\s*([\d.]+) seconds\)'.format(name), log)
+    if match is None: return None
+    return float(match.group(1))
+
+def command(output, width, height, threads=None, options=(), executable=default_executable, input='-'):
+    """Command line arguments for povray.
+
+    Args:
+        output: path of the image to write.
+        width: image width in pixels.
+        height: image height in pixels.
+        threads: number of render threads (defaults to povray's choice).
+        options: additional povray command line options (e.g. ['+A0.3']).
+        executable: povray executable.
+        input: scene file to read ('-' for standard input).
+    Returns:
+        List of arguments.
+    """
+    args = [executable, '+I{}'.format(input), '+O{}'.format(output),
+            '+W{}'.format(width), '+H{}'.format(height), '-D', '-V']
+    if threads is not None: args += ['+WT{}'.format(threads)]
+    return args + list(options)
+
+def run(args, scene=None, timeout=None, cwd=None):
+    """Run povray, streaming a scene into its standard input.
+
+    Args:
+        args: command line arguments (see command).
+        scene: primitive whose script is written to standard input (None to leave it closed).
+        timeout: time in seconds after which povray is killed.
+        cwd: working directory for povray, which resolves relative include and data files.
+    Returns:
+        Diagnostic output of povray.
+    Raises:
+        RenderError: if povray fails or times out.
+        Any error raised while generating the scene's script, after povray has been stopped.
+    """
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, cwd=cwd)
+
+    # Drain povray's diagnostics concurrently so it never blocks on a full pipe while we stream.
+    log = []
+    reader = threading.Thread(target=lambda: log.append(process.stderr.read()))
+    reader.start()
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        process.kill()
+    timer = threading.Timer(timeout, kill) if timeout is not None else None
+    if timer is not None: timer.start()
+
+    try:
+        if scene is not None: scene.write(process.stdin)
+        process.stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass # povray exited early, which is reported below.
+    except BaseException:
+        # The script could not be generated, so povray would wait forever for the rest of it.
+        process.kill()
+        raise
+    finally:
+        try: process.stdin.close()
+        except OSError: pass # Unwritten input left in the pipe after povray exited.
+        process.wait()
+        if timer is not None: timer.cancel()
+        reader.join()
+
+    log = log[0].decode(errors='replace') if log else ''
+    if timed_out.is_set():
+        raise RenderError('povray timed out after {} s'.format(timeout))
+    if process.returncode != 0:
+        raise RenderError('povray exited with status {}:\n{}'.format(process.returncode, log))
+    return log
+
+def render(scene, output, width=800, height=600, threads=None, options=(), executable=default_executable,
+           timeout=None, retries=0, cwd=None, input='-', cache=None):
+    """Render a scene, piping its script straight into povray without a temporary file.
+
+    With a cache the script is instead written once into the cache directory while its key is
+    computed, and povray reads it from there on a miss, so the scene is only generated once.
+
+    Args:
+        scene: primitive (typically a Scene) to render, or None if povray reads the input file.
+        output: path of the image to write.
+        width, height: image size in pixels.
+        threads: number of render threads for this job (defaults to povray's choice).
+        options: additional povray command line options.
+        executable: povray executable (or a stand-in emulating its command line).
+        timeout: time in seconds allowed for each attempt.
+        retries: number of further attempts after a failure.
+        cwd: working directory for povray.
+        input: scene file for povray to read instead of streaming the scene ('-' to stream).
+        cache: RenderCache to take the image from if this render was done before (reported with
+               zero attempts), and to store it in otherwise.
+    Returns:
+        RenderResult.
+    Raises:
+        RenderError: if every attempt fails.
+    """
+    if cache is None:
+        return render_attempts(scene, output, command(output, width, height, threads, options, executable, input),
+                               timeout, retries, cwd)
+
+    start = time.perf_counter()
+    settings = [width, height, list(options), os.path.basename(executable), os.path.splitext(output)[1]]
+    destination = os.path.join(cwd or '', output)
+    if scene is None:
+        key, script = cache.key(None, settings, cwd, input), None
+    else:
+        key, script = cache.write_script(scene, settings, cwd)
+        input = os.path.abspath(script)
+    try:
+        if cache.fetch(key, destination):
+            return RenderResult(output, None, None, time.perf_counter() - start, 0, '')
+        result = render_attempts(None, output, command(output, width, height, threads, options, executable, input),
+                                 timeout, retries, cwd)
+    finally:
+        if script is not None: cache.release_script(key)
+    cache.store(key, destination)
+    return result
+
+def render_attempts(scene, output, args, timeout, retries, cwd):
+    """Run povray until it succeeds or the retries are used up (see render)."""
+    for attempt in range(1, retries+2):
+        start = time.perf_counter()
+        try:
+            log = run(args, scene, timeout, cwd)
+        except RenderError:
+            if attempt > retries: raise
+            continue
+        return RenderResult(output, reported_time(log, 'Parse'), reported_time(log, 'Trace'),
+                            time.perf_counter() - start, attempt, log)
+
+class RenderPool:
+    """Bounded pool of povray subprocesses rendering independent jobs (e.g. animation frames).
+
+    Each job occupies one worker while its scene is streamed to povray and rendered, so at most
+    `workers` povray processes run at once, each with `threads` render threads.
+    """
+
+    def __init__(self, workers=1, threads=None, executable=default_executable, timeout=None, retries=0,
+                 cwd=None, cache=None):
+        """
+        Args:
+            workers: maximum number of concurrent povray processes.
+            threads: default number of render threads per job.
+            executable: povray executable.
+            timeout: default time in seconds allowed for each attempt.
+            retries: default number of further attempts after a failure.
+            cwd: default working directory for povray.
+            cache: RenderCache shared by the jobs.
+        """
+        self.defaults = dict(threads=threads, executable=executable, timeout=timeout, retries=retries, cwd=cwd,
+                             cache=cache)
+        self.executor = ThreadPoolExecutor(workers)
+
+    def submit(self, scene, output, width=800, height=600, **kwargs):
+        """Queue a render (see render for the arguments).
+
+        Returns:
+            concurrent.futures.Future resolving to a RenderResult.
+        """
+        kwargs = dict(self.defaults, **kwargs)
+        return self.executor.submit(render, scene, output, width, height, **kwargs)
+
+    def map(self, scenes, outputs, width=800, height=600, **kwargs):
+        """Render many scenes, yielding their results in order.
+
+        Args:
+            scenes: iterable of scenes.
+            outputs: iterable of output paths, one per scene.
+        Returns:
+            Generator of RenderResults.
+        """
+        futures = [self.submit(scene, output, width, height, **kwargs) for scene, output in zip(scenes, outputs)]
+        for future in futures: yield future.result()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def render_frames(scenes, output_pattern, width=800, height=600, workers=1, **kwargs):
+    """Render a sequence of scenes in parallel, one povray process per frame.
+
+    Args:
+        scenes: iterable of scenes.
+        output_pattern: format string for the output path of each frame, e.g. 'frame{:04d}.png'.
+        workers: maximum number of concurrent povray processes.
+        kwargs: further options for RenderPool (threads, executable, timeout, retries, cwd, cache).
+    Returns:
+        List of RenderResults, one per frame.
+    """
+    scenes = list(scenes)
+    outputs = [output_pattern.format(i) for i in range(len(scenes))]
+    with RenderPool(workers, **kwargs) as pool:
+        return list(pool.map(scenes, outputs, width, height))
+
+def region_options(tile):
+    """Partial render options (+SR/+ER/+SC/+EC) restricting povray to a tile.
+
+    Args:
+        tile: (row_start, row_stop, column_start, column_stop) with zero-based, half-open ranges.
+    Returns:
+        List of options.
+    """
+    r0, r1, c0, c1 = tile
+    return ['+SR{}'.format(r0+1), '+ER{}'.format(r1), '+SC{}'.format(c0+1), '+EC{}'.format(c1)]
+
+def plan_tiles(width, height, ntiles, columns=1, row_cost=None):
+    """Split a frame into bands of rows (each optionally split into columns) of equal estimated cost.
+
+    Args:
+        width, height: image size in pixels.
+        ntiles: number of row bands.
+        columns: number of tiles each band is split into.
+        row_cost: relative cost of rendering each row (uniform by default).
+    Returns:
+        List of (row_start, row_stop, column_start, column_stop) tiles.
+    """
+    ntiles = max(1, min(ntiles, height))
+    columns = max(1, min(columns, width))
+    if row_cost is None: row_cost = np.ones(height)
+    cumulative = np.concatenate(([0], np.cumsum(row_cost)))
+    targets = cumulative[-1] * np.arange(1, ntiles) / ntiles
+    rows = np.unique(np.concatenate(([0], np.searchsorted(cumulative, targets), [height])))
+    cols = np.unique(np.linspace(0, width, columns+1).round().astype(int))
+    return [(int(r0), int(r1), int(c0), int(c1)) for r0, r1 in zip(rows[:-1], rows[1:])
+            for c0, c1 in zip(cols[:-1], cols[1:])]
+
+class TileBalancer:
+    """Learns the cost of each image row from timed tile renders, so later frames are split evenly.
+
+    Reuse one balancer across the frames of an animation (or repeated renders of a scene): the empty
+    sky renders in no time while rows full of atoms dominate, and bands are resized accordingly.
+    """
+
+    def __init__(self, height, smoothing=0.5):
+        """
+        Args:
+            height: image height in pixels.
+            smoothing: weight given to the previous estimate when a new measurement arrives.
+        """
+        self.row_cost = np.ones(height)
+        self.smoothing = smoothing
+
+    def tiles(self, width, ntiles, columns=1):
+        """Tiles of equal estimated cost (see plan_tiles)."""
+        return plan_tiles(width, len(self.row_cost), ntiles, columns, self.row_cost)
+
+    def cost(self, tile):
+        """Estimated relative cost of a tile."""
+        r0, r1, c0, c1 = tile
+        return self.row_cost[r0:r1].sum()
+
+    def update(self, tiles, times):
+        """Fold the measured render times of a set of tiles into the row cost estimate.
+
+        Args:
+            tiles: rendered tiles.
+            times: time spent rendering each tile.
+        """
+        measured = np.zeros_like(self.row_cost)
+        for (r0, r1, c0, c1), t in zip(tiles, times): measured[r0:r1] += t / (r1-r0)
+        covered = measured > 0
+        if not covered.any(): return
+        # Keep every row slightly costly so that bands never grow without bound.
+        measured = measured / measured[covered].mean() + 1e-3
+        previous = self.row_cost / self.row_cost.mean()
+        self.row_cost = np.where(covered, self.smoothing*previous + (1-self.smoothing)*measured, previous)
+
+def render_tile(script, tile, width, height, **kwargs):
+    """Render one tile of a scene file (see render_tiled), returning only the tile's pixels.
+
+    This is a plain module-level function so that it can be shipped to process pools or remote
+    executors; the script must be readable from wherever it runs.
+
+    Args:
+        script: path of the scene file.
+        tile: (row_start, row_stop, column_start, column_stop) region to render.
+        width, height: size of the whole image in pixels.
+        kwargs: further options for render (threads, options, executable, timeout, retries, cwd).
+    Returns:
+        (pixels, RenderResult) where pixels is a (rows x columns x 3) array.
+    """
+    kwargs['options'] = list(kwargs.get('options', ())) + region_options(tile) + ['+FP']
+    handle, output = tempfile.mkstemp(suffix='.ppm', dir=os.path.dirname(script))
+    os.close(handle)
+    try:
+        result = render(None, output, width, height, input=script, **kwargs)
+        pixels = read_ppm(output)
+    finally:
+        os.remove(output)
+
+    # Depending on the version and output format, povray either writes the full frame (with only
+    # the region rendered) or just the region.
+    r0, r1, c0, c1 = tile
+    rows = slice(r0, r1) if pixels.shape[0] == height and r1-r0 != height else slice(None)
+    cols = slice(c0, c1) if pixels.shape[1] == width and c1-c0 != width else slice(None)
+    pixels = pixels[rows, cols]
+    if pixels.shape[:2] != (r1-r0, c1-c0):
+        raise RenderError('tile {} has unexpected size {}'.format(tile, pixels.shape[:2]))
+    return pixels, result
+
+TiledRenderResult = namedtuple('TiledRenderResult', ['output', 'tiles', 'results', 'wall_time'])
+TiledRenderResult.__doc__ = """Outcome of a tiled render.
+
+Args:
+    output: path of the stitched image.
+    tiles: (row_start, row_stop, column_start, column_stop) of each tile.
+    results: RenderResult of each tile.
+    wall_time: elapsed time of the whole render.
+"""
+
+def render_tiled(scene, output, width=800, height=600, workers=None, ntiles=None, columns=1, balancer=None,
+                 executor=None, scratch=None, **kwargs):
+    """Render a single frame split into tiles across many povray processes, then stitch them together.
+
+    The scene script is written once and every tile renders it with povray's partial render options.
+    Tiles are dispatched most expensive first, so the pool stays busy until the frame is finished.
+
+    Args:
+        scene: primitive (typically a Scene) to render.
+        output: path of the stitched image (PNG if it ends in .png, otherwise PPM).
+        width, height: image size in pixels.
+        workers: number of concurrent povray processes for the local pool (defaults to the CPU count).
+        ntiles: number of row bands (defaults to four per worker).
+        columns: number of tiles each band is split into.
+        balancer: TileBalancer sizing bands by their measured cost; it is updated with the timings of
+                  this render.
+        executor: concurrent.futures executor to dispatch tiles on (e.g. a cluster client for remote
+                  nodes); a local pool is used by default.
+        scratch: directory for the scene script and tile images, which must be visible to every worker
+                 (a temporary directory by default).
+        kwargs: further options for render (threads, options, executable, timeout, retries, cwd).
+    Returns:
+        TiledRenderResult.
+    Raises:
+        RenderError: if any tile fails.
+    """
+    start = time.perf_counter()
+    if workers is None: workers = os.cpu_count() or 1
+    if ntiles is None: ntiles = 4*workers
+    if balancer is None: balancer = TileBalancer(height)
+    if len(balancer.row_cost) != height: raise ValueError('balancer was sized for a different image height')
+    tiles = sorted(balancer.tiles(width, ntiles, columns), key=balancer.cost, reverse=True)
+
+    # Relative data and include files are resolved from here, not the scratch directory.
+    kwargs.setdefault('cwd', os.getcwd())
+
+    with tempfile.TemporaryDirectory(dir=scratch) as directory:
+        script = os.path.join(directory, 'scene.pov')
+        with open(script, 'w') as f: scene.write(f)
+
+        pool = executor if executor is not None else ThreadPoolExecutor(workers)
+        try:
+            futures = {pool.submit(render_tile, script, tile, width, height, **kwargs): tile for tile in tiles}
+            frame, results = None, {}
+            for future in as_completed(futures):
+                tile = futures[future]
+                pixels, results[tile] = future.result()
+                if frame is None: frame = np.zeros((height, width) + pixels.shape[2:], dtype=pixels.dtype)
+                r0, r1, c0, c1 = tile
+                frame[r0:r1, c0:c1] = pixels
+        finally:
+            if executor is None: pool.shutdown(cancel_futures=True)
+
+    tiles = sorted(tiles)
+    results = [results[tile] for tile in tiles]
+    balancer.update(tiles, [r.render_time if r.render_time is not None else r.wall_time for r in results])
+
+    if output.lower().endswith('.png'): write_png(output, frame)
+    else: write_ppm(output, frame)
+    return TiledRenderResult(output, tiles, results, time.perf_counter() - start)
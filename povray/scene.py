@@ -39,7 +39,15 @@ class Parallel(Flag): pass
 class Shadowless(Flag): pass
 class PointAt(Attribute): pass
 
-class Scene(Primitive):
+class Script(Primitive):
+    """Top-level container writing its children one after another, e.g. a scene or include file."""
+    header = ''
+    body_open = ''
+    body_close = ''
+    indent = ''
+    start_nest = -1
+
+class Scene(Script):
     def __init__(self,
                  version=3.7, assumed_gamma=2.2, max_trace_level=256, ambient_light='White'):
         super().__init__()
@@ -49,23 +57,3 @@ class Scene(Primitive):
                  GlobalSettings( AssumedGamma(assumed_gamma),
                                  MaxTraceLevel(max_trace_level),
                                  AmbientLight(ambient_light) )]
-
-    @property
-    def header(self):
-        return ''
-
-    @property
-    def body_open(self):
-        return ''
-
-    @property
-    def body_close(self):
-        return ''
-
-    @property
-    def indent(self):
-        return ''
-
-    @property
-    def start_nest(self):
-        return -1
@@ -16,7 +16,11 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import re
+import os
 from itertools import chain
+import numpy as np
+
+default_chunk_size = 1 << 16
 
 def pov_vector(v):
     """Convert numpy vector into form parseable by povray.
@@ -27,7 +31,111 @@ def pov_vector(v):
         String representation of vector ready for povray.
     """
     if type(v) is str: return v
-    else: return str(v.tolist()).replace('[', '<').replace(']', '>')
+    if v.ndim == 0: return repr(v.item())
+    if v.ndim > 1: return str(v.tolist()).replace('[', '<').replace(']', '>')
+    return '<{}>'.format(', '.join(map(repr, v.tolist())))
+
+def number_format(dtype, precision=None):
+    """printf-style conversion specifier used to write numbers of a given type.
+
+    Integers are always written exactly. Floats default to their shortest round-trip
+    representation, which is exactly what pov_vector (and the original per-row conversion)
+    writes, including a trailing '.0' on whole numbers (e.g. 0.0 rather than 0). Converting
+    each float to its shortest form dominates the cost, so this default is only modestly
+    faster than per-row conversion. With a finite precision floats are written with that many
+    significant figures and trailing zeros are dropped (e.g. 0); precision=17 is still lossless
+    and formats about 1.5x faster than the default, at the cost of longer digit strings for
+    values like 0.1.
+
+    Args:
+        dtype: numpy dtype of the numbers to write.
+        precision: number of significant figures for floats (None for full precision).
+    Returns:
+        Conversion specifier, e.g. '%r' or '%.6g'.
+    """
+    if np.issubdtype(dtype, np.integer): return '%d'
+    if precision is None: return '%r'
+    return '%.{}g'.format(precision)
+
+def iter_pov_vectors(v, precision=None, separator=', ', chunk_size=default_chunk_size):
+    """Convert an array of vectors into povray text, a block of rows at a time.
+
+    Each block is formatted with a single printf-style operation over the whole block,
+    rather than converting each row separately.
+
+    Args:
+        v: (n x d) numpy array of vectors (a single vector is treated as n = 1).
+        precision: number of significant figures for floats (None for full precision).
+        separator: string placed between consecutive vectors.
+        chunk_size: number of rows formatted in each block.
+    Returns:
+        Generator yielding the text in pieces; joined they give the full vector list.
+    """
+    v = np.asarray(v)
+    if v.ndim == 1: v = v.reshape(1, -1)
+    n, d = v.shape
+    row = '<{}>'.format(', '.join([number_format(v.dtype, precision)] * d))
+
+    for start in range(0, n, chunk_size):
+        block = v[start:start+chunk_size]
+        text = separator.join([row] * len(block)) % tuple(block.ravel().tolist())
+        if start > 0: text = separator + text
+        yield text
+
+def pov_vectors(v, precision=None, separator=', '):
+    """Convert an array of vectors into a povray list of vectors.
+
+    >>> pov_vectors(np.array([[0, 1, 2], [3, 4, 5]]))
+    '<0, 1, 2>, <3, 4, 5>'
+
+    Args:
+        v: (n x d) numpy array of vectors.
+        precision: number of significant figures for floats (None for full precision).
+        separator: string placed between consecutive vectors.
+    Returns:
+        String representation of the vectors ready for povray.
+    """
+    return ''.join(iter_pov_vectors(v, precision, separator))
+
+def write_data_file(path, fields, precision=None, chunk_size=default_chunk_size):
+    """Write arrays to a text file readable by povray's #read directive.
+
+    Each row holds the values of every field for one item as comma-separated numbers (vectors
+    are flattened into their components), so the file can be read back with a single #read per
+    row inside a #for loop.
+
+    Args:
+        path: file to write to.
+        fields: sequence of (n,) or (n x d) arrays with the same number of rows n.
+        precision: number of significant figures for floats (None for full precision).
+        chunk_size: number of rows formatted at a time.
+    Returns:
+        Number of values in each row.
+    """
+    fields = [np.asarray(field).reshape(len(field), -1) for field in fields]
+    specifiers = [number_format(field.dtype, precision) for field in fields for column in field.T]
+    row = ','.join(specifiers) + ',\n'
+    with open(path, 'w') as f:
+        for start in range(0, len(fields[0]), chunk_size):
+            block = [field[start:start+chunk_size].tolist() for field in fields]
+            values = chain.from_iterable(chain.from_iterable(items) for items in zip(*block))
+            f.write((row * len(block[0])) % tuple(values))
+    return len(specifiers)
+
+def to_identifier(s):
+    """Convert a string (e.g. a file name) into a valid povray identifier.
+
+    >>> to_identifier('data/1st-frame.dat')
+    '_1st_frame'
+
+    Args:
+        s: string, of which only the base file name without extension is used.
+    Returns:
+        String containing only alphanumeric characters and underscores, not starting with a digit.
+    """
+    s = re.sub(r'\W', '_', os.path.splitext(os.path.basename(s))[0])
+    if not s or s[0].isdigit(): s = '_' + s
+    return s
 
 def to_snake_case(s):
     """Convert PascalCase or camelCase (AKA mixedCase in PEP 8) string to snake_case.
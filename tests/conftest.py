@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import stat
+import pytest
+import numpy as np
+
+from povray import Sphere, Expression
+from povray.scene import Scene
+
+@pytest.fixture
+def fakepov(tmp_path):
+    """Path of an executable running the povray stand-in (see fakepov.py) with this interpreter."""
+    script = os.path.join(os.path.dirname(__file__), 'fakepov.py')
+    executable = tmp_path / 'povray'
+    executable.write_text('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, script))
+    executable.chmod(executable.stat().st_mode | stat.S_IXUSR)
+    return str(executable)
+
+def simple_scene(*objects):
+    scene = Scene()
+    scene += [Sphere(np.zeros(3), 1)] + list(objects)
+    return scene
+
+@pytest.fixture
+def scene():
+    return simple_scene()
+
+@pytest.fixture
+def failing_scene():
+    """Scene the stand-in rejects."""
+    return simple_scene(Expression('FAIL'))
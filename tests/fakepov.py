@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Stand-in for the povray executable, so rendering can be tested without povray installed.
+
+It understands the command line options povray.render passes (+I, +O, +W, +H and the partial render
+options +SR/+ER/+SC/+EC), and writes a PPM image with a fixed pattern depending only on the position
+of each pixel, so tiles of a frame can be checked against the whole frame. Pixels outside a partial
+render region are black. Timings are reported on standard error in povray's format.
+
+Its behaviour can be changed through the environment:
+    FAKEPOV_CROP: write only the rendered region of a partial render, as some povray versions do.
+    FAKEPOV_SLEEP: seconds to sleep for a full frame (scaled down for partial renders).
+    FAKEPOV_LOG: file to which the command line of each run is appended.
+A script containing the word FAIL is rejected with a parse error.
+"""
+
+import os
+import re
+import sys
+import time
+import numpy as np
+
+def pattern(height, width):
+    """Image the stand-in renders for a full frame."""
+    rows, columns = np.mgrid[0:height, 0:width]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[..., 0] = rows % 251
+    pixels[..., 1] = columns % 253
+    pixels[..., 2] = (7*rows + 3*columns) % 255
+    return pixels
+
+def main(args):
+    options = {}
+    for arg in args:
+        match = re.match(r'[+-](SR|ER|SC|EC|WT|FP|I|O|W|H)(.*)', arg)
+        if match: options[match.group(1)] = match.group(2)
+    if os.environ.get('FAKEPOV_LOG'):
+        with open(os.environ['FAKEPOV_LOG'], 'a') as f: f.write(' '.join(args) + '\n')
+
+    if options['I'] == '-': script = sys.stdin.buffer.read()
+    else:
+        with open(options['I'], 'rb') as f: script = f.read()
+    if b'FAIL' in script:
+        sys.stderr.write('Parse Error: FAIL\n')
+        return 1
+
+    width, height = int(options['W']), int(options['H'])
+    r0, r1 = int(options.get('SR', 1)) - 1, int(options.get('ER', height))
+    c0, c1 = int(options.get('SC', 1)) - 1, int(options.get('EC', width))
+    fraction = (r1-r0) * (c1-c0) / (width*height)
+    if os.environ.get('FAKEPOV_SLEEP'): time.sleep(float(os.environ['FAKEPOV_SLEEP']) * fraction)
+
+    pixels = pattern(height, width)
+    region = np.zeros((height, width), dtype=bool)
+    region[r0:r1, c0:c1] = True
+    pixels[~region] = 0
+    if os.environ.get('FAKEPOV_CROP'): pixels = pixels[r0:r1, c0:c1]
+    with open(options['O'], 'wb') as f:
+        f.write(b'P6\n%d %d\n255\n' % (pixels.shape[1], pixels.shape[0]))
+        f.write(pixels.tobytes())
+
+    sys.stderr.write('Parser Time\n'
+                     '  Parse Time:       0 hours  0 minutes  0 seconds (0.{:03d} seconds)\n'
+                     'Render Time:\n'
+                     '  Trace Time:       0 hours  0 minutes  0 seconds ({:.3f} seconds)\n'
+                     .format(len(script) % 1000, fraction))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from povray import Union, Sphere, Cylinder, Cone, SphereBatch, CylinderBatch, ConeBatch, Mesh2, triangulate_grid
+
+def points(rng, n, integer):
+    if integer: return rng.integers(-50, 50, (n, 3))
+    return rng.normal(size=(n, 3))
+
+def radii(rng, n, integer):
+    if integer: return rng.integers(1, 5, n)
+    return rng.random(n)
+
+@pytest.mark.parametrize('integer_points', [False, True])
+@pytest.mark.parametrize('integer_radii', [False, True])
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_batches_match_objects(integer_points, integer_radii, chunk_size):
+    rng = np.random.default_rng(0)
+    n = 20
+    p1, p2 = points(rng, n, integer_points), points(rng, n, integer_points)
+    r1, r2 = radii(rng, n, integer_radii), radii(rng, n, integer_radii)
+
+    cases = [(SphereBatch(p1, r1, chunk_size=chunk_size), [Sphere(p, r) for p, r in zip(p1, r1)]),
+             (CylinderBatch(p1, p2, r1, chunk_size=chunk_size), [Cylinder(a, b, r) for a, b, r in zip(p1, p2, r1)]),
+             (ConeBatch(p1, p2, r1, r2, chunk_size=chunk_size),
+              [Cone(a, b, s, t) for a, b, s, t in zip(p1, p2, r1, r2)])]
+    for batch, objects in cases:
+        assert repr(Union(batch)) == repr(Union(*objects))
+
+def test_scalar_radius_matches_objects():
+    positions = np.arange(12).reshape(4, 3)
+    assert repr(Union(SphereBatch(positions, 2))) == repr(Union(*[Sphere(p, 2) for p in positions]))
+    assert repr(Union(SphereBatch(positions, 0.5))) == repr(Union(*[Sphere(p, 0.5) for p in positions]))
+
+def read_rows(path):
+    with open(path) as f: return [[float(value) for value in line.split(',')[:-1]] for line in f]
+
+def test_data_file_written_on_creation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    positions = np.random.default_rng(1).random((10, 3))
+    batch = SphereBatch(positions, np.arange(10), data_file='spheres.dat')
+    assert np.array_equal(read_rows('spheres.dat'), np.column_stack([positions, np.arange(10)]))
+
+    # Writing out the script does not rewrite the file.
+    (tmp_path / 'spheres.dat').unlink()
+    text = repr(batch)
+    assert not (tmp_path / 'spheres.dat').exists()
+    assert text == repr(batch) and '#read (spheres_file, spheres_0, spheres_1, spheres_2, spheres_3)' in text
+
+    batch.write_data()
+    assert len(read_rows('spheres.dat')) == 10
+
+def test_data_file_constant_fields(tmp_path, monkeypatch):
+    # A radius shared by every item is declared once rather than written on every row.
+    monkeypatch.chdir(tmp_path)
+    positions = np.random.default_rng(2).random((10, 3))
+    batch = CylinderBatch(positions, positions + 1, 0.25, colours=['Red', 'Blue'],
+                          colour_indices=np.arange(10) % 2, data_file='bonds.dat')
+    assert np.array_equal(read_rows('bonds.dat'), np.column_stack([positions, positions + 1, np.arange(10) % 2]))
+    text = repr(batch)
+    assert '#declare bonds_constant2 = 0.25;' in text
+    assert 'bonds_item(<bonds_0, bonds_1, bonds_2>, <bonds_3, bonds_4, bonds_5>, bonds_constant2, bonds_6)' in text
+
+    # When every field is shared, the first is still written so each row has a value to read.
+    SphereBatch(np.ones((3, 3)), 1, data_file='same.dat')
+    assert read_rows('same.dat') == [[1., 1., 1.]] * 3
+
+def test_take_writes_data_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    positions = np.random.default_rng(3).random((10, 3))
+    batch = SphereBatch(positions, np.arange(10.), data_file='spheres.dat')
+    subset = batch.take([8, 1], 'subset.dat')
+    assert np.array_equal(read_rows('subset.dat'), np.column_stack([positions[[8, 1]], [8., 1.]]))
+    assert len(read_rows('spheres.dat')) == 10
+
+def test_mesh_data_files_written_on_creation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    x = np.linspace(0, 1, 5)
+    X, Y = np.meshgrid(x, x)
+    mesh = Mesh2(*triangulate_grid(X, Y, X*Y), data_prefix='surface')
+    for suffix in ['vertices', 'normals', 'faces']: (tmp_path / 'surface_{}.dat'.format(suffix)).unlink()
+    assert '#read (surface_vertices_file' in repr(mesh)
+    assert not any(tmp_path.iterdir())
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Run every benchmark once at its smallest size, so that the suite cannot silently break."""
+
+import sys
+import pytest
+
+from benchmarks.__main__ import discover, combinations
+
+def smallest(cls):
+    """Parameters of the cheapest run of a benchmark (the smallest of any numeric parameter)."""
+    def size(params):
+        return sum(p for p in params if isinstance(p, (int, float)) and not isinstance(p, bool))
+    return min(combinations(cls), key=size)
+
+@pytest.mark.parametrize('label, cls, method', list(discover('')), ids=lambda value: value if isinstance(value, str) else '')
+def test_benchmark(label, cls, method, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Benchmarks of a fixed size set at module level are shrunk as well.
+    module = sys.modules[cls.__module__]
+    if hasattr(module, 'n'): monkeypatch.setattr(module, 'n', 1000)
+    params = smallest(cls)
+    benchmark = cls()
+    try:
+        if hasattr(benchmark, 'setup'): benchmark.setup(*params)
+        getattr(benchmark, method)(*params)
+    except NotImplementedError:
+        pytest.skip('not available here')
+    finally:
+        if hasattr(benchmark, 'teardown'): benchmark.teardown(*params)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import pytest
+import numpy as np
+
+from povray import Sphere, Expression, Include, Fopen
+from povray.cache import RenderCache, script_key
+from povray.render import render, RenderError
+from povray.image import read_ppm
+
+from conftest import simple_scene
+
+class CountingScene:
+    """Scene counting how many times its script is generated."""
+    def __init__(self, scene):
+        self.scene = scene
+        self.writes = 0
+
+    def write(self, f):
+        self.writes += 1
+        self.scene.write(f)
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(str(tmp_path / 'cache'))
+
+def test_cache_hit(fakepov, scene, cache, tmp_path, monkeypatch):
+    log = tmp_path / 'log'
+    monkeypatch.setenv('FAKEPOV_LOG', str(log))
+    first = render(scene, str(tmp_path / 'first.ppm'), 20, 10, executable=fakepov, cache=cache)
+    second = render(scene, str(tmp_path / 'second.ppm'), 20, 10, executable=fakepov, cache=cache)
+    assert (first.attempts, second.attempts) == (1, 0)
+    assert len(log.read_text().splitlines()) == 1
+    assert np.array_equal(read_ppm(tmp_path / 'first.ppm'), read_ppm(tmp_path / 'second.ppm'))
+    stats = cache.stats
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+def test_cache_miss_on_change(fakepov, scene, cache, tmp_path):
+    render(scene, str(tmp_path / 'a.ppm'), 20, 10, executable=fakepov, cache=cache)
+    assert render(scene, str(tmp_path / 'b.ppm'), 30, 10, executable=fakepov, cache=cache).attempts == 1
+    changed = simple_scene(Sphere(np.ones(3), 1))
+    assert render(changed, str(tmp_path / 'c.ppm'), 20, 10, executable=fakepov, cache=cache).attempts == 1
+    assert cache.stats['misses'] == 3
+
+def test_failed_render_not_cached(fakepov, failing_scene, cache, tmp_path):
+    with pytest.raises(RenderError):
+        render(failing_scene, str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache)
+    assert cache.stats['entries'] == 0
+
+def test_key_streamed_matches_file(scene, tmp_path):
+    with open(tmp_path / 'scene.pov', 'w') as f: scene.write(f)
+    assert script_key(scene, [1]) == script_key(input='scene.pov', settings=[1], cwd=str(tmp_path))
+
+@pytest.mark.parametrize('reference, path', [
+    (Expression('height_field { png "heights.png" }'), 'heights.png'),
+    (Expression('pigment { image_map { tga "texture.tga" } }'), 'texture.tga'),
+    (Expression('media { density { density_file df3 "cloud.df3" } }'), 'cloud.df3'),
+    (Expression('text { ttf "font.ttf" "abc" 1, 0 }'), 'font.ttf'),
+    (Fopen('data', 'atoms.dat'), 'atoms.dat'),
+    (Include('objects.inc'), 'objects.inc'),
+])
+def test_key_follows_referenced_files(tmp_path, reference, path):
+    scene = simple_scene(reference)
+    (tmp_path / path).write_bytes(b'first')
+    key = script_key(scene, cwd=str(tmp_path))
+    assert script_key(scene, cwd=str(tmp_path)) == key
+    (tmp_path / path).write_bytes(b'second')
+    assert script_key(scene, cwd=str(tmp_path)) != key
+
+def test_key_follows_nested_includes(tmp_path):
+    scene = simple_scene(Include('outer.inc'))
+    (tmp_path / 'outer.inc').write_text('#include "inner.inc"\nheight_field { png "heights.png" }\n')
+    (tmp_path / 'inner.inc').write_text('sphere { 0, 1 }\n')
+    (tmp_path / 'heights.png').write_bytes(b'first')
+    keys = [script_key(scene, cwd=str(tmp_path))]
+    (tmp_path / 'inner.inc').write_text('sphere { 0, 2 }\n')
+    keys += [script_key(scene, cwd=str(tmp_path))]
+    (tmp_path / 'heights.png').write_bytes(b'second')
+    keys += [script_key(scene, cwd=str(tmp_path))]
+    assert len(set(keys)) == 3
+
+def test_eviction(fakepov, cache, tmp_path):
+    cache.max_entries = 2
+    for radius in range(1, 5):
+        scene = simple_scene(Sphere(np.zeros(3), radius))
+        render(scene, str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache)
+    stats = cache.stats
+    assert (stats['entries'], stats['evictions']) == (2, 2)
+    cache.clear()
+    assert cache.stats['entries'] == 0
+
+def test_script_generated_once(fakepov, scene, cache, tmp_path, monkeypatch):
+    log = tmp_path / 'log'
+    monkeypatch.setenv('FAKEPOV_LOG', str(log))
+    counting = CountingScene(scene)
+    render(counting, str(tmp_path / 'first.ppm'), 20, 10, executable=fakepov, cache=cache)
+    render(counting, str(tmp_path / 'second.ppm'), 20, 10, executable=fakepov, cache=cache)
+    assert counting.writes == 2
+    # povray read the script saved while it was hashed, which is removed afterwards.
+    key = script_key(scene, [20, 10, [], 'povray', '.ppm'])
+    assert '+I{}'.format(os.path.join(cache.directory, key + '.pov')) in log.read_text()
+    assert sorted(os.listdir(cache.directory)) == [key + '.image', 'index']
+
+def test_script_removed_on_failure(fakepov, failing_scene, cache, tmp_path):
+    with pytest.raises(RenderError):
+        render(failing_scene, str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache)
+    assert not any(name.endswith('.pov') for name in os.listdir(cache.directory))
+
+def test_least_recently_used_evicted(fakepov, cache, tmp_path):
+    scenes = [simple_scene(Sphere(np.zeros(3), radius)) for radius in range(2, 6)]
+    for k in range(3): render(scenes[k], str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache)
+    assert render(scenes[0], str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache).attempts == 0
+    # The order of use is tracked independently of the files' modification times.
+    for entry in os.scandir(cache.directory): os.utime(entry.path, (0, 0))
+
+    # The order carries over to a new session using the same directory.
+    cache = RenderCache(cache.directory, max_entries=3)
+    render(scenes[3], str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache)
+    attempts = [render(scene, str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache).attempts
+                for scene in [scenes[0], scenes[2], scenes[3]]]
+    assert attempts == [0, 0, 0]
+    assert render(scenes[1], str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, cache=cache).attempts == 1
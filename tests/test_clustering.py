@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import numpy as np
+
+from povray import Union, Merge, Sphere, SphereBatch, CylinderBatch, Box, BoundedBy, For
+from povray.pigments import Pigment, Colour
+from povray.clustering import cluster
+
+def parse_vector(text):
+    return np.array([float(value) for value in text.strip('<>').split(',')])
+
+def leaves(node, bound=None):
+    """Batches and data file loops in the order they are written, with the box bounding each."""
+    for child in node.children:
+        if isinstance(child, BoundedBy):
+            box = child.children[0]
+            bound = parse_vector(box.corner1), parse_vector(box.corner2)
+    for child in node.children:
+        if isinstance(child, (SphereBatch, CylinderBatch, For)): yield child, bound
+        elif isinstance(child, (Union, Merge)): yield from leaves(child, bound)
+
+def inside(points, bound):
+    lower, upper = bound
+    return np.all((points >= lower - 1e-12) & (points <= upper + 1e-12))
+
+def test_union():
+    positions = np.random.default_rng(0).random((1000, 3))
+    tree = Union(SphereBatch(positions, 0.01), CylinderBatch(positions, positions + 0.01, 0.001),
+                 Pigment(Colour('Red')))
+    stats = cluster(tree, leaf_size=16)
+    assert stats['nodes'] == 1 and stats['merged'] == 0
+    assert stats['clusters'] >= 2000 // 16
+    assert isinstance(tree.children[-1], Pigment)
+
+    spheres = []
+    for batch, bound in leaves(tree):
+        assert len(batch) <= 16
+        if isinstance(batch, SphereBatch):
+            assert inside(batch.positions, bound)
+            spheres.append(batch.positions)
+    spheres = np.concatenate(spheres)
+    assert sorted(map(tuple, spheres)) == sorted(map(tuple, positions))
+
+def test_merge_keeps_overlapping_items_together():
+    rng = np.random.default_rng(1)
+    centres = 10 * rng.random((200, 3))
+    positions = np.concatenate([centres[:50], centres[:50] + 0.01, centres[50:]])
+    tree = Merge(SphereBatch(positions, 0.02))
+    stats = cluster(tree, leaf_size=8, min_items=100)
+    assert stats['merged'] == 100
+
+    pairs = 0
+    for batch, bound in leaves(tree):
+        for position in batch.positions:
+            pair = np.linalg.norm(positions - position, axis=1) < 0.02
+            if np.count_nonzero(pair) > 1:
+                # Overlapping spheres are written together, so the merge removes their shared surfaces.
+                assert len(batch) == 2
+                assert np.array_equal(np.sort(batch.positions, axis=0), np.sort(positions[pair], axis=0))
+                pairs += 1
+    assert pairs == 100
+
+def test_small_or_mixed_unchanged():
+    positions = np.random.default_rng(2).random((300, 3))
+    for tree in [Union(SphereBatch(positions, 0.1)), Union(SphereBatch(positions, 0.1), Sphere(np.zeros(3), 1))]:
+        expected = repr(tree)
+        assert cluster(tree, min_items=1000 if len(tree.children) == 1 else 256)['nodes'] == 0
+        assert repr(tree) == expected
+
+def test_nested():
+    positions = np.random.default_rng(3).random((300, 3))
+    tree = Union(Sphere(np.zeros(3), 1), Union(SphereBatch(positions, 0.1)))
+    assert cluster(tree)['nodes'] == 1
+    assert isinstance(tree.children[0], Sphere)
+
+def test_data_file(tmp_path, monkeypatch):
+    # The items are read from a single file, in the order the clusters are written.
+    monkeypatch.chdir(tmp_path)
+    rng = np.random.default_rng(4)
+    n = 500
+    positions = rng.random((n, 3))
+    colour_indices = rng.integers(0, 3, n)
+    tree = Union(SphereBatch(positions, 0.1, colours=['Red', 'Green', 'Blue'], colour_indices=colour_indices,
+                             data_file='atoms.dat'))
+    stats = cluster(tree, leaf_size=10)
+    text = repr(tree)
+    assert os.listdir(tmp_path) == ['atoms.dat']
+    assert text.count('#fopen atoms_file "atoms.dat" read') == 1 and text.count('#fclose atoms_file') == 1
+    assert text.count('#macro atoms_item') == 1 and text.count('#declare atoms_constant1 = 0.1;') == 1
+
+    rows = np.loadtxt('atoms.dat', delimiter=',', usecols=range(4))
+    start = 0
+    loops = list(leaves(tree))
+    assert len(loops) == stats['clusters']
+    for loop, bound in loops:
+        block = rows[start:start+loop.end]
+        assert inside(block[:,:3], bound)
+        start += loop.end
+    assert start == n
+
+    original = {tuple(p): c for p, c in zip(positions.round(12), colour_indices)}
+    assert {tuple(row[:3]): row[3] for row in rows.round(12)} == original
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from povray import Union, SphereBatch, CylinderBatch, Translate, Rotate, Macro, Declare
+from povray.culling import CameraView, frustum_mask, contained_mask, cull
+from povray.molecules import culled_scene, scene, camera_view
+
+# Looking down the z axis from the origin, seeing 1 unit either side of the axis a unit away.
+perspective = CameraView(np.zeros(3), np.array([0, 0, 1.]), np.array([0, 1., 0]),
+                         np.array([2., 0, 0]), np.array([0, 2., 0]), True)
+orthographic = perspective._replace(perspective=False)
+
+# Inside the view, behind the camera, and beyond each side of the view at a depth of 10.
+inside = np.array([[0, 0, 5.], [9, -9, 10]])
+outside = np.array([[0, 0, -5.], [12, 0, 10], [-12, 0, 10], [0, 12, 10], [0, -12, 10]])
+
+def test_frustum_mask():
+    centres = np.concatenate([inside, outside])
+    assert frustum_mask(centres, 0.1, perspective).tolist() == [True]*2 + [False]*5
+    # Spheres overlapping the view, or within the margin of it, are kept.
+    assert frustum_mask(outside[1:], 2, perspective).all()
+    assert frustum_mask(outside[1:], 0.1, perspective, margin=2).all()
+
+def test_frustum_mask_orthographic():
+    centres = np.array([[0.5, -0.5, 5], [0, 0, 100], [2, 0, 5], [0, 0, -1]])
+    assert frustum_mask(centres, 0.1, orthographic).tolist() == [True, True, False, False]
+    assert frustum_mask(centres, 1.5, orthographic).tolist() == [True, True, True, True]
+
+def test_contained_mask():
+    centres = np.array([[0, 0, 0], [0.5, 0, 0], [0, 0, 0], [3, 0, 0], [3.5, 0, 0]])
+    radii = np.array([2, 1, 2, 1, 1])
+    # Of the two identical spheres only the later one is removed; overlapping spheres are kept.
+    assert contained_mask(centres, radii).tolist() == [False, True, True, False, False]
+    assert not contained_mask(np.zeros((0, 3)), 1).any()
+
+def test_cull():
+    centres = np.concatenate([inside, outside])
+    tree = Union(Union(SphereBatch(centres, 0.1)), CylinderBatch(outside, outside + 0.1, 0.1))
+    removed = cull(tree, perspective)
+    assert removed == dict(outside=10, contained=0)
+    assert np.array_equal(tree.children[0].children[0].positions, inside)
+    assert len(tree.children[1]) == 0
+
+def test_cull_contained():
+    tree = Union(SphereBatch(np.array([[0, 0, 5], [0, 0, 5.1], [0, 0, -5]]), np.array([1, 0.5, 1])))
+    assert cull(tree, perspective, contained=True) == dict(outside=1, contained=1)
+    assert np.array_equal(tree.children[0].positions, [[0, 0, 5]])
+
+@pytest.mark.parametrize('transformed', [
+    lambda batch: Union(batch, Translate(np.array([-100, 0, 110.]))),
+    lambda batch: Union(Union(batch), Rotate(np.array([0, 180., 0]))),
+    lambda batch: Declare('shared', batch),
+    lambda batch: Macro('item', Union(batch)),
+])
+def test_transformed_batches_kept(transformed):
+    # The batch is out of view in its own coordinates, but may be placed within view.
+    batch = SphereBatch(np.array([[100, 0, -10.], [0, 0, -5]]), 0.1)
+    tree = Union(transformed(batch))
+    expected = repr(tree)
+    assert cull(tree, perspective) == dict(outside=0, contained=0)
+    assert repr(tree) == expected
+
+def molecule_batches(tree):
+    """Ball and stick batches of a molecule's scene."""
+    balls, sticks = tree.children[-2:]
+    return balls.children[0], sticks.children[0]
+
+def test_culled_scene():
+    rng = np.random.default_rng(0)
+    coordinates = rng.uniform(-10, 10, (2000, 3))
+    coordinates[-100:] = coordinates[:100]
+    options = dict(camera_direction=[0, 0, 1], sky_direction=[0, 1, 0], camera_distance=0.5,
+                   bond_threshold=1.)
+    view = camera_view(coordinates, True, 0.5, [0, 0, 1], [0, 1, 0])
+    full = scene(coordinates, **options)
+    culled, removed = culled_scene(coordinates, contained=True, **options)
+    assert removed['outside'] > 0 and removed['contained'] > 0
+    assert repr(culled) == repr(scene(coordinates, cull=True, cull_contained=True, **options))
+
+    # Only balls and sticks outside the view (or buried inside another ball) are gone.
+    balls, sticks = molecule_batches(culled)
+    all_balls, all_sticks = molecule_batches(full)
+    keep = frustum_mask(all_balls.positions, all_balls.radii, view)
+    keep &= ~contained_mask(all_balls.positions, all_balls.radii)
+    assert np.array_equal(balls.positions, all_balls.positions[keep])
+    assert len(balls) + len(sticks) + removed['outside'] + removed['contained'] == len(all_balls) + len(all_sticks)
+    assert frustum_mask(*sticks.bounding_spheres(), view).all()
+
+    # A margin keeps more of them.
+    assert culled_scene(coordinates, margin=5, **options)[1]['outside'] < removed['outside']
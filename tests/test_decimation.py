@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+from collections import Counter
+
+from povray import Mesh2, triangulate_grid
+from povray.mesh import marching_cubes
+from povray.decimation import decimate, boundary_vertices
+
+tetrahedron = (np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=float),
+               np.array([[0, 2, 1], [0, 1, 3], [0, 3, 2], [1, 2, 3]]))
+
+def closed_sphere():
+    x = np.arange(16) - 7.5
+    volume = 49 - (x[:,None,None]**2 + x[None,:,None]**2 + x[None,None,:]**2)
+    coordinates, triangulation, normals = marching_cubes(volume, 0)
+    return coordinates, triangulation
+
+def open_surface(n=20):
+    x = np.linspace(0, 1, n)
+    X, Y = np.meshgrid(x, x)
+    return triangulate_grid(X, Y, np.sin(3*X) * np.cos(2*Y))
+
+def directed_edges(triangulation):
+    edges = Counter()
+    for a, b, c in triangulation.tolist():
+        assert len({a, b, c}) == 3
+        edges.update([(a, b), (b, c), (c, a)])
+    assert all(count == 1 for count in edges.values())
+    return edges
+
+def assert_closed_oriented_manifold(coordinates, triangulation):
+    edges = directed_edges(triangulation)
+    assert all((b, a) in edges for a, b in edges)
+    assert len({tuple(sorted(face)) for face in triangulation.tolist()}) == len(triangulation)
+    # A closed surface of genus zero has Euler characteristic 2.
+    vertices = len(np.unique(triangulation))
+    assert vertices - len(edges)//2 + len(triangulation) == 2
+    A, B, C = coordinates[triangulation.T]
+    assert np.einsum('ij,ij->i', A - A.mean(axis=0), np.cross(B - A, C - A)).sum() > 0
+
+@pytest.mark.parametrize('target', [0, 1, 2, 3])
+def test_tetrahedron_is_kept(target):
+    coordinates, triangulation, report = decimate(*tetrahedron, target=target)
+    assert (report['before'], report['after']) == (4, 4)
+    assert_closed_oriented_manifold(coordinates, triangulation)
+
+def test_single_triangle_is_kept():
+    coordinates, triangulation, report = decimate(tetrahedron[0][:3], [[0, 1, 2]], target=0)
+    assert np.array_equal(triangulation, [[0, 1, 2]])
+    assert report['max_error'] == 0
+
+@pytest.mark.parametrize('options', [dict(target=0), dict(target=100), dict(max_error=0.2), dict(max_error=10)])
+def test_closed_surface_stays_manifold(options):
+    coordinates, triangulation = closed_sphere()
+    assert_closed_oriented_manifold(coordinates, triangulation)
+    coordinates, triangulation, report = decimate(coordinates, triangulation, **options)
+    assert report['after'] == len(triangulation) < report['before']
+    assert report['after'] >= max(4, options.get('target', 0))
+    assert_closed_oriented_manifold(coordinates, triangulation)
+
+def test_max_error_bounds_error():
+    coordinates, triangulation = closed_sphere()
+    coordinates, triangulation, report = decimate(coordinates, triangulation, max_error=0.05)
+    assert 0 < report['max_error'] <= 0.05
+
+def test_target():
+    coordinates, triangulation = open_surface()
+    coordinates, triangulation, report = decimate(coordinates, triangulation, target=200)
+    assert report['after'] == len(triangulation) == 200
+    assert len(coordinates) == triangulation.max() + 1
+
+def test_boundary_preserved():
+    original, triangulation = open_surface()
+    before = original[boundary_vertices(triangulation, len(original))]
+    coordinates, triangulation, report = decimate(original, triangulation, target=0)
+    after = coordinates[boundary_vertices(triangulation, len(coordinates))]
+    # The outline keeps all of its vertices, exactly where they were.
+    assert sorted(map(tuple, after)) == sorted(map(tuple, before))
+    directed_edges(triangulation)
+    # The grid's triangles all face down; triangles may end up standing upright along the curved
+    # outline, but none is turned over.
+    A, B, C = coordinates[triangulation.T]
+    assert (np.cross(B - A, C - A)[:,2] <= 0).all()
+
+def test_dtype_kept():
+    coordinates, triangulation = open_surface()
+    for dtype in [np.int32, np.int64]:
+        assert decimate(coordinates, triangulation.astype(dtype), target=50)[1].dtype == dtype
+
+def test_needs_target_or_error():
+    with pytest.raises(ValueError):
+        decimate(*tetrahedron)
+
+def test_mesh2_option():
+    coordinates, triangulation = closed_sphere()
+    mesh = Mesh2(coordinates, triangulation, decimate=dict(max_error=0.1))
+    assert mesh.decimation['after'] == len(mesh.triangulation) < len(triangulation)
+    assert len(mesh.normal_vectors.coordinates) == len(mesh.coordinates)
+    with pytest.raises(ValueError):
+        Mesh2(coordinates, triangulation, normals=np.zeros_like(coordinates), decimate=10)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import zlib
+import struct
+import pytest
+import numpy as np
+
+from povray.image import read_ppm, write_ppm, read_png, write_png
+
+@pytest.mark.parametrize('channels', [None, 3, 4])
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16])
+def test_png_round_trip(tmp_path, channels, dtype):
+    shape = (7, 5) if channels is None else (7, 5, channels)
+    pixels = np.random.default_rng(0).integers(0, np.iinfo(dtype).max, shape, endpoint=True).astype(dtype)
+    write_png(tmp_path / 'image.png', pixels)
+    image = read_png(tmp_path / 'image.png')
+    assert image.dtype == dtype
+    assert np.array_equal(image, pixels)
+
+def test_ppm_round_trip(tmp_path):
+    pixels = np.random.default_rng(1).integers(0, 256, (4, 6, 3)).astype(np.uint8)
+    write_ppm(tmp_path / 'image.ppm', pixels)
+    assert np.array_equal(read_ppm(tmp_path / 'image.ppm'), pixels)
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    return a if pa <= pb and pa <= pc else b if pb <= pc else c
+
+def filtered_png(path, pixels, filters):
+    """Write an 8-bit gray-alpha PNG, filtering each row with the given filter type."""
+    height, width, channels = pixels.shape
+    rows = pixels.reshape(height, -1).astype(int)
+    data = bytearray()
+    for i, kind in enumerate(filters):
+        row, up = rows[i], rows[i-1] if i else np.zeros_like(rows[0])
+        left = np.concatenate([np.zeros(channels, int), row[:-channels]])
+        corner = np.concatenate([np.zeros(channels, int), up[:-channels]])
+        predictor = [np.zeros_like(row), left, up, (left + up) // 2,
+                     [paeth(a, b, c) for a, b, c in zip(left, up, corner)]][kind]
+        data += bytes([kind]) + bytes(((row - predictor) % 256).astype(np.uint8))
+
+    def chunk(kind, content):
+        return struct.pack('>I', len(content)) + kind + content + struct.pack('>I', zlib.crc32(kind + content))
+    header = struct.pack('>IIBBBBB', width, height, 8, 4, 0, 0, 0)
+    compressed = zlib.compress(bytes(data))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+                chunk(b'IDAT', compressed[:10]) + chunk(b'IDAT', compressed[10:]) + chunk(b'IEND', b''))
+
+def test_png_filters(tmp_path):
+    # Images from other writers (e.g. povray itself) filter rows and may split the data between chunks.
+    pixels = np.random.default_rng(2).integers(0, 256, (10, 6, 2)).astype(np.uint8)
+    filtered_png(tmp_path / 'image.png', pixels, [0, 1, 2, 3, 4, 4, 3, 2, 1, 0])
+    assert np.array_equal(read_png(tmp_path / 'image.png'), pixels)
+
+def test_png_unsupported(tmp_path):
+    write_ppm(tmp_path / 'image.ppm', np.zeros((2, 2, 3), dtype=np.uint8))
+    with pytest.raises(ValueError, match='not a PNG'): read_png(tmp_path / 'image.ppm')
+
+    # Palette images.
+    write_png(tmp_path / 'image.png', np.zeros((2, 2, 3), dtype=np.uint8))
+    data = bytearray((tmp_path / 'image.png').read_bytes())
+    data[25] = 3
+    (tmp_path / 'palette.png').write_bytes(bytes(data))
+    with pytest.raises(ValueError, match='unsupported'): read_png(tmp_path / 'palette.png')
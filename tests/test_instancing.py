@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from povray import Union, Sphere, SphereBatch, Translate, declare_repeats
+from povray.directives import Declare
+from povray.pigments import Pigment, Colour
+
+from conftest import simple_scene
+
+def coloured_batch(colours, seed=0):
+    rng = np.random.default_rng(seed)
+    return SphereBatch(rng.random((20, 3)), 0.1, colours=colours, colour_indices=rng.integers(0, 2, 20))
+
+def declarations(scene):
+    return [child.name for child in scene.children if isinstance(child, Declare)]
+
+def test_repeated_objects_declared():
+    unit = Union(Sphere(np.zeros(3), 1, Pigment(Colour('Red'))), Sphere(np.ones(3), 1))
+    copies = [Union(*unit.children, Translate(np.array([float(i), 0, 0]))) for i in range(3)]
+    result = declare_repeats(simple_scene(*copies))
+    assert declarations(result) == ['sharedUnion0']
+    text = repr(result)
+    assert text.count('object\n{\n  sharedUnion0\n') == 3
+    for i in range(3): assert 'translate <{}, 0.0, 0.0>'.format(float(i)) in text
+
+def test_repeated_pigments_declared():
+    spheres = [Sphere(np.array([float(i), 0, 0]), 1, Pigment(Colour('Red'))) for i in range(3)]
+    result = declare_repeats(simple_scene(*spheres))
+    assert declarations(result) == ['sharedPigment0']
+    assert repr(result).count('pigment{sharedPigment0}') == 3
+
+def test_min_count():
+    spheres = [Sphere(np.array([float(i), 0, 0]), 1, Pigment(Colour('Red'))) for i in range(3)]
+    assert declarations(declare_repeats(simple_scene(*spheres), min_count=4)) == []
+
+def test_original_unmodified():
+    scene = simple_scene(*[Union(Sphere(np.zeros(3), 1)) for i in range(2)])
+    expected = repr(scene)
+    declare_repeats(scene)
+    assert repr(scene) == expected
+
+def test_coloured_batches():
+    # Palettes given as lists or numpy arrays are compared by their contents.
+    for colours in [['Red', 'Blue'], np.array(['Red', 'Blue'])]:
+        result = declare_repeats(simple_scene(Union(coloured_batch(colours)), Union(coloured_batch(colours))))
+        assert declarations(result) == ['sharedUnion0']
+
+    different = [Union(coloured_batch(np.array(['Red', 'Blue']))), Union(coloured_batch(np.array(['Red', 'Green'])))]
+    assert declarations(declare_repeats(simple_scene(*different))) == []
+    different = [Union(coloured_batch(['Red', 'Blue'])), Union(coloured_batch(['Red', 'Blue'], seed=1))]
+    assert declarations(declare_repeats(simple_scene(*different))) == []
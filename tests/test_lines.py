@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+from scipy import interpolate
+
+from povray.lines import stipple_coordinates, resample, dash_segments, polylines
+
+def reference_stipple_coordinates(coordinates, resolutions=None, exclude_out_of_bounds=False):
+    """Original implementation of stipple_coordinates, built on scipy's interp1d."""
+    if resolutions is None: return coordinates
+    ds = np.linalg.norm(np.diff(coordinates, axis=0), axis=1)
+    path_lengths = np.concatenate(([0], np.cumsum(ds, axis=0)))
+    f = interpolate.interp1d(path_lengths, coordinates.T)
+
+    stencil_size = np.sum(resolutions)
+    stencil = np.cumsum(resolutions)
+    sample_points = np.arange(0, path_lengths[-1], stencil_size)
+    sample_points = (np.tile(sample_points.reshape(-1,1), len(stencil)) + stencil).reshape(-1)
+
+    out_of_bounds = sample_points > path_lengths[-1]
+    if exclude_out_of_bounds:
+        sample_points = sample_points[~out_of_bounds]
+    else:
+        sample_points[out_of_bounds] = path_lengths[-1]
+        sample_points = sample_points[:1+np.where(out_of_bounds)[0][0]]
+
+    return f(sample_points).T
+
+def random_polyline(rng, n, d):
+    return np.cumsum(rng.normal(size=(n, d)), axis=0)
+
+@pytest.mark.parametrize('exclude_out_of_bounds', [False, True])
+@pytest.mark.parametrize('resolutions', [(0.1,), (0.3, 0.2), (0.05, 0.5, 0.25), (7.,)])
+@pytest.mark.parametrize('d', [2, 3])
+def test_matches_interp1d(d, resolutions, exclude_out_of_bounds):
+    rng = np.random.default_rng(d)
+    for n in [2, 3, 10, 100]:
+        coordinates = random_polyline(rng, n, d)
+        try:
+            expected = reference_stipple_coordinates(coordinates, resolutions, exclude_out_of_bounds)
+        except IndexError:
+            # The original failed when no sample fell beyond the end of the line.
+            continue
+        samples = stipple_coordinates(coordinates, resolutions, exclude_out_of_bounds)
+        assert samples.shape == expected.shape
+        assert np.array_equal(samples, expected)
+
+def test_no_sample_past_end():
+    # A line whose length is a whole number of periods has its last sample exactly at the end.
+    coordinates = np.array([[0., 0.], [1., 0.]])
+    samples = stipple_coordinates(coordinates, (0.25,))
+    assert np.allclose(samples[:,0], [0.25, 0.5, 0.75, 1.])
+
+def test_resample_matches_per_polyline():
+    rng = np.random.default_rng(0)
+    polylines = [random_polyline(rng, n, 3) for n in [5, 2, 30, 8]]
+    offsets = np.concatenate(([0], np.cumsum([len(p) for p in polylines])))
+    samples, sample_offsets = resample(np.concatenate(polylines), offsets, (0.4, 0.1))
+    for k, polyline in enumerate(polylines):
+        expected = stipple_coordinates(polyline, (0.4, 0.1))
+        assert np.allclose(samples[sample_offsets[k]:sample_offsets[k+1]], expected)
+
+def test_resample_rejects_empty_period():
+    with pytest.raises(ValueError):
+        resample(np.zeros((2, 3)), [0, 2], (0., 0.))
+
+def concatenate(polylines):
+    points = np.concatenate(polylines) if polylines else np.zeros((0, 3))
+    return points, np.concatenate(([0], np.cumsum([len(p) for p in polylines])))
+
+@pytest.mark.parametrize('empty', [0, 1, 2])
+@pytest.mark.parametrize('exclude_out_of_bounds', [False, True])
+def test_resample_empty_polyline(empty, exclude_out_of_bounds):
+    rng = np.random.default_rng(1)
+    lines = [random_polyline(rng, n, 3) for n in [6, 9]]
+    lines.insert(empty, np.zeros((0, 3)))
+    points, offsets = concatenate(lines)
+    samples, sample_offsets = resample(points, offsets, (0.4, 0.1), exclude_out_of_bounds)
+    assert sample_offsets[empty] == sample_offsets[empty+1]
+    for k, polyline in enumerate(lines):
+        if not len(polyline): continue
+        expected = stipple_coordinates(polyline, (0.4, 0.1), exclude_out_of_bounds)
+        assert np.allclose(samples[sample_offsets[k]:sample_offsets[k+1]], expected)
+
+@pytest.mark.parametrize('empty', [0, 1, 2])
+def test_arrows_with_empty_polyline(empty):
+    rng = np.random.default_rng(2)
+    lines = [random_polyline(rng, n, 3) for n in [6, 9]]
+    expected = dash_segments(*concatenate(lines), (1., 0.3), exclude_out_of_bounds=True)
+    lines.insert(empty, np.zeros((0, 3)))
+    start, end, owner = dash_segments(*concatenate(lines), (1., 0.3), exclude_out_of_bounds=True)
+    assert np.array_equal(start, expected[0]) and np.array_equal(end, expected[1])
+    assert np.array_equal(owner, expected[2] + (expected[2] >= empty))
+    assert repr(polylines(*concatenate(lines), 0.1, arrows=(1., 0.3, 0.2), stipple=(0.2, 0.1))).count('cone') == len(start)
+
+def test_resample_no_points():
+    samples, sample_offsets = resample(np.zeros((0, 3)), [0, 0, 0], (0.4, 0.1))
+    assert samples.shape == (0, 3) and np.array_equal(sample_offsets, [0, 0, 0])
+
+def mixed_polylines(rng):
+    """Polylines of several lengths, including empty and single-point ones."""
+    return [random_polyline(rng, n, 3) for n in [1, 7, 0, 2, 1, 0, 25, 3, 0]]
+
+@pytest.mark.parametrize('exclude_out_of_bounds', [False, True])
+def test_resample_per_polyline_patterns(exclude_out_of_bounds):
+    rng = np.random.default_rng(3)
+    lines = mixed_polylines(rng)
+    patterns = rng.uniform(0.05, 1, (len(lines), 3))
+    samples, sample_offsets = resample(*concatenate(lines), patterns, exclude_out_of_bounds)
+    assert len(sample_offsets) == len(lines) + 1
+    for k, polyline in enumerate(lines):
+        expected = stipple_coordinates(polyline, patterns[k], exclude_out_of_bounds)
+        if len(polyline) < 2: assert len(expected) == 0
+        assert np.allclose(samples[sample_offsets[k]:sample_offsets[k+1]], expected)
+
+def test_dash_segments_per_polyline_patterns():
+    rng = np.random.default_rng(4)
+    lines = mixed_polylines(rng)
+    patterns = rng.uniform(0.1, 1, (len(lines), 2))
+    start, end, owner = dash_segments(*concatenate(lines), patterns)
+    assert np.all(np.diff(owner) >= 0)
+    for k, polyline in enumerate(lines):
+        a, b, single = dash_segments(polyline, [0, len(polyline)], patterns[k])
+        assert np.array_equal(single, np.zeros(len(a)))
+        assert np.allclose(start[owner == k], a) and np.allclose(end[owner == k], b)
+        # Dashes run along the line for the dash length, so their end points are no further apart.
+        assert np.all(np.linalg.norm(b - a, axis=1) <= patterns[k, 1] + 1e-9)
+
+def test_polylines_per_polyline_arrows():
+    rng = np.random.default_rng(5)
+    lines = mixed_polylines(rng)
+    widths = np.arange(1, len(lines) + 1) / 100
+    merge = polylines(*concatenate(lines), 0.01, arrows=(1., 0.2, widths))
+    cones = merge.children[-1]
+    a, b, owner = dash_segments(*concatenate(lines), (1., 0.2), exclude_out_of_bounds=True)
+    assert np.array_equal(cones.positions1, a) and np.array_equal(cones.positions2, b)
+    assert np.array_equal(cones.radii1, widths[owner])
+    assert set(owner) <= {k for k, polyline in enumerate(lines) if len(polyline) > 1}
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+from collections import Counter
+
+from povray.mesh import marching_cubes, cube_corners
+
+def assert_closed_oriented_manifold(triangulation):
+    """Every edge is shared by exactly two triangles, which traverse it in opposite directions."""
+    edges = Counter()
+    for a, b, c in triangulation.tolist():
+        assert len({a, b, c}) == 3
+        edges.update([(a, b), (b, c), (c, a)])
+    assert all(count == 1 for count in edges.values())
+    assert all((b, a) in edges for a, b in edges)
+
+def enclosed_volume(coordinates, triangulation):
+    """Signed volume enclosed by a closed surface, positive if its faces are oriented outwards."""
+    A, B, C = coordinates[triangulation.T]
+    return np.einsum('ij,ij->i', A, np.cross(B, C)).sum() / 6
+
+def face_normals(coordinates, triangulation):
+    A, B, C = coordinates[triangulation.T]
+    return np.cross(B - A, C - A)
+
+def sphere(n, radius, centre=None):
+    if centre is None: centre = (n-1) / 2
+    x = np.arange(n) - np.broadcast_to(np.asarray(centre, dtype=float), 3)[:,None]
+    return radius**2 - (x[0][:,None,None]**2 + x[1][None,:,None]**2 + x[2][None,None,:]**2)
+
+@pytest.mark.parametrize('config', range(1, 255))
+def test_every_cube_configuration(config):
+    # A single cube surrounded by empty space encloses the inside corners in a closed surface.
+    volume = np.zeros((4, 4, 4))
+    for k, (x, y, z) in enumerate(cube_corners):
+        if config & (1 << k): volume[1+x, 1+y, 1+z] = 1
+    coordinates, triangulation, normals = marching_cubes(volume, 0.5)
+    assert_closed_oriented_manifold(triangulation)
+    assert enclosed_volume(coordinates, triangulation) > 0
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_field(seed):
+    # Random values exercise the ambiguous faces, which neighbouring cubes must split alike.
+    volume = np.zeros((14, 12, 10))
+    volume[1:-1, 1:-1, 1:-1] = np.random.default_rng(seed).random((12, 10, 8))
+    coordinates, triangulation, normals = marching_cubes(volume, 0.5, slab_size=5)
+    assert_closed_oriented_manifold(triangulation)
+    assert enclosed_volume(coordinates, triangulation) > 0
+
+def test_sphere():
+    radius, spacing = 8.3, 0.5
+    coordinates, triangulation, normals = marching_cubes(sphere(21, radius), 0, spacing, origin=(1, 2, 3))
+    assert_closed_oriented_manifold(triangulation)
+    centre = np.array([1, 2, 3]) + 10*spacing
+    distance = np.linalg.norm(coordinates - centre, axis=1)
+    assert np.allclose(distance, radius*spacing, rtol=0.02)
+    volume = enclosed_volume(coordinates - centre, triangulation)
+    assert volume == pytest.approx(4/3*np.pi*(radius*spacing)**3, rel=0.02)
+
+    # Faces and vertex normals both point away from the centre.
+    assert np.allclose(normals, (coordinates - centre) / distance[:,None], atol=0.05)
+    outward = coordinates[triangulation].mean(axis=1) - centre
+    assert (np.einsum('ij,ij->i', face_normals(coordinates, triangulation), outward) > 0).all()
+
+def test_open_surface():
+    # A surface cut off by the edges of the volume has a boundary, but is still consistently oriented.
+    coordinates, triangulation, normals = marching_cubes(sphere(15, 9, centre=(0, 7, 7)), 0)
+    edges = Counter()
+    for a, b, c in triangulation.tolist(): edges.update([(a, b), (b, c), (c, a)])
+    assert all(count == 1 for count in edges.values())
+    assert any((b, a) not in edges for a, b in edges)
+
+@pytest.mark.parametrize('slab_size', [1, 2, 7])
+def test_slab_size_invariance(slab_size):
+    volume = sphere(17, 6.5) + np.random.default_rng(0).normal(scale=2, size=(17, 17, 17))
+    expected = marching_cubes(volume, 0, slab_size=100)
+    for array, reference in zip(marching_cubes(volume, 0, slab_size=slab_size), expected):
+        assert np.array_equal(array, reference)
+
+def test_memmap(tmp_path):
+    volume = sphere(12, 4)
+    path = str(tmp_path / 'volume.npy')
+    np.save(path, volume)
+    expected = marching_cubes(volume, 0, slab_size=3)
+    for array, reference in zip(marching_cubes(np.load(path, mmap_mode='r'), 0, slab_size=3), expected):
+        assert np.array_equal(array, reference)
+
+def test_empty():
+    coordinates, triangulation, normals = marching_cubes(np.zeros((5, 5, 5)), 0.5)
+    assert coordinates.shape == (0, 3) and triangulation.shape == (0, 3) and normals.shape == (0, 3)
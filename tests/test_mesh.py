@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from povray import Union, Mesh2, TiledMesh, HeightField, triangulate_grid, vertex_normals, declare_repeats, pov_vector
+from povray import Scale, Translate, SphereSweep, grid_lines, wireframe, polylines
+from povray.mesh import weld_vertices, surface as surface_object
+from povray.pigments import Pigment, Colour
+from povray.culling import cull, CameraView
+from povray.scene import Scene
+from povray.image import read_png
+
+def surface(nrows, ncols):
+    x, y = np.linspace(0, 1, ncols), np.linspace(0, 2, nrows)
+    X, Y = np.meshgrid(x, y)
+    return X, Y, np.sin(3*X) * np.cos(2*Y)
+
+def corner_normals(coordinates, triangulation, normals):
+    """Map each triangle (as the tuple of its corner coordinates) to the normals at its corners."""
+    return {tuple(map(tuple, coordinates[t])): normals[t] for t in triangulation}
+
+def global_mesh(X, Y, Z, mask):
+    coordinates, triangulation = triangulate_grid(X, Y, Z)
+    valid = ~mask.reshape(-1) & np.isfinite(coordinates).all(axis=1)
+    triangulation = triangulation[valid[triangulation].all(axis=1)]
+    return corner_normals(coordinates, triangulation, vertex_normals(coordinates, triangulation))
+
+def tiled_mesh(mesh):
+    triangles = {}
+    for tile in mesh.children:
+        if not isinstance(tile, Mesh2): continue
+        triangles.update(corner_normals(tile.coordinates, tile.triangulation, tile.normal_vectors.coordinates))
+    return triangles
+
+@pytest.mark.parametrize('tile_size', [1, 4, 7, 100])
+@pytest.mark.parametrize('masked', [False, True])
+def test_tiles_match_global_mesh(tile_size, masked):
+    X, Y, Z = surface(23, 17)
+    mask = np.zeros(X.shape, dtype=bool)
+    if masked:
+        mask[5:9, 3:12] = True
+        Z = Z.copy()
+        Z[15, 15] = np.nan
+    expected = global_mesh(X, Y, Z, mask)
+    triangles = tiled_mesh(TiledMesh(X, Y, Z, tile_size=tile_size, mask=mask))
+    assert triangles.keys() == expected.keys()
+    for key, normals in expected.items():
+        assert np.allclose(triangles[key], normals, rtol=0, atol=1e-12)
+
+def test_sparse_meshgrid():
+    X, Y, Z = surface(12, 9)
+    x, y = np.meshgrid(X[0], Y[:,0], sparse=True)
+    mesh = TiledMesh(x, y, Z, tile_size=5)
+    assert repr(mesh) == repr(TiledMesh(X, Y, Z, tile_size=5))
+
+def test_extra_children():
+    mesh = TiledMesh(*surface(10, 10), tile_size=4)
+    mesh += [Pigment(Colour('Red'))]
+    text = repr(mesh)
+    assert text.count('mesh2') == 9
+    assert text.rindex('pigment') > text.rindex('mesh2')
+
+def test_tree_passes_skip_tiles():
+    X, Y, Z = surface(10, 10)
+    scene = Scene()
+    scene += [Union(TiledMesh(X, Y, Z, tile_size=4)), TiledMesh(X, Y, Z, tile_size=4)]
+    expected = repr(scene)
+    view = CameraView(np.array([0.5, 1, -5]), np.array([0.5, 1, 0]), np.array([0, 1, 0]),
+                      np.array([1.33, 0, 0]), np.array([0, 1, 0]), True)
+    assert cull(scene, view) == dict(outside=0, contained=0)
+    declare_repeats(scene)
+    assert repr(scene).count('mesh2') == expected.count('mesh2')
+
+def reference_normals(coordinates, triangulation, weighting):
+    """Vertex normals summed face by face."""
+    normals = np.zeros((len(coordinates), 3))
+    for face in triangulation:
+        corners = coordinates[face]
+        normal = np.cross(corners[1] - corners[0], corners[2] - corners[0])
+        for k, vertex in enumerate(face):
+            if weighting == 'area': weight = normal
+            else:
+                weight = normal / np.linalg.norm(normal)
+                if weighting == 'angle':
+                    u, v = corners[(k+1) % 3] - corners[k], corners[(k+2) % 3] - corners[k]
+                    weight = weight * np.arccos(np.dot(u, v) / np.linalg.norm(u) / np.linalg.norm(v))
+            normals[vertex] += weight
+    norm = np.linalg.norm(normals, axis=1)
+    norm[norm == 0] = 1
+    return normals / norm[:,None]
+
+@pytest.mark.parametrize('weighting', ['area', 'angle', 'uniform'])
+@pytest.mark.parametrize('chunk_size', [1, 5, 1000])
+def test_vertex_normals(weighting, chunk_size):
+    rng = np.random.default_rng(0)
+    X, Y, Z = surface(6, 7)
+    coordinates, triangulation = triangulate_grid(X + 0.05*rng.random(X.shape), Y, Z)
+    # An unused vertex has no normal.
+    coordinates = np.concatenate([coordinates, [[5., 5., 5.]]])
+    normals = vertex_normals(coordinates, triangulation, weighting, chunk_size)
+    assert np.allclose(normals, reference_normals(coordinates, triangulation, weighting), rtol=0, atol=1e-12)
+    assert np.array_equal(normals[-1], np.zeros(3))
+
+def test_vertex_normal_weightings_differ():
+    # Two faces at a vertex, one with a much larger area and one with a much larger angle.
+    coordinates = np.array([[0, 0, 0], [10, 0, 0], [0, 10, 0], [0, 0, 0.1], [-1, 0, 0.1]], dtype=float)
+    triangulation = np.array([[0, 1, 2], [0, 3, 4]])
+    normals = {weighting: vertex_normals(coordinates, triangulation, weighting)[0]
+               for weighting in ['area', 'angle', 'uniform']}
+    assert normals['area'][2] > normals['uniform'][2] and normals['angle'][1] < normals['area'][1]
+    for weighting, normal in normals.items():
+        assert np.allclose(normal, reference_normals(coordinates, triangulation, weighting)[0])
+    with pytest.raises(ValueError):
+        vertex_normals(coordinates, triangulation, 'volume')
+
+def test_flat_normals():
+    coordinates, triangulation = triangulate_grid(*surface(5, 5))
+    mesh = Mesh2(coordinates, triangulation, normals='flat')
+    assert mesh.normal_vectors is None and 'normal_vectors' not in repr(mesh)
+    mesh = Mesh2(coordinates, triangulation, normals='angle')
+    assert np.array_equal(mesh.normal_vectors.coordinates, vertex_normals(coordinates, triangulation, 'angle'))
+
+def test_weld_vertices():
+    # Each triangle has its own copies of its corners, as in an STL file.
+    coordinates, triangulation = triangulate_grid(*surface(5, 6))
+    separate = coordinates[triangulation].reshape(-1, 3)
+    unwelded = np.arange(len(separate)).reshape(-1, 3)
+    welded, welded_triangulation = weld_vertices(separate, unwelded)
+    assert len(welded) == len(coordinates)
+    assert len(np.unique(welded, axis=0)) == len(welded)
+    assert np.array_equal(welded[welded_triangulation], coordinates[triangulation])
+    assert np.allclose(vertex_normals(welded, welded_triangulation)[welded_triangulation],
+                       vertex_normals(coordinates, triangulation)[triangulation])
+
+    # Vertices within the tolerance merge, and triangles collapsing onto a line are dropped.
+    jittered = separate + 1e-9 * np.random.default_rng(1).random(separate.shape)
+    assert len(weld_vertices(jittered, unwelded)[0]) == len(separate)
+    welded, welded_triangulation = weld_vertices(jittered, unwelded, tolerance=1e-6)
+    assert len(welded) == len(coordinates) and len(welded_triangulation) == len(triangulation)
+    sliver = np.array([[0, 0, 0], [1, 0, 0], [1, 1e-9, 0]])
+    assert len(weld_vertices(sliver, [[0, 1, 2]], tolerance=1e-6)[1]) == 0
+
+    mesh = Mesh2(separate, unwelded, weld=0)
+    assert len(mesh.coordinates) == len(coordinates)
+
+def reference_mesh2(coordinates, triangulation, normals):
+    """Text of a mesh2 with every vector converted one at a time."""
+    def vectors(name, v):
+        return '  {}{{{}, {}}}\n'.format(name, len(v), ', '.join([pov_vector(row) for row in v]))
+    return ('mesh2\n{\n' + vectors('vertex_vectors', coordinates) + vectors('normal_vectors', normals) +
+            vectors('face_indices', triangulation) + '}')
+
+@pytest.mark.parametrize('integer', [False, True])
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_mesh2_matches_reference(integer, chunk_size):
+    coordinates, triangulation = triangulate_grid(*surface(6, 5))
+    if integer: coordinates = np.round(10*coordinates).astype(int)
+    # Normals are summed a chunk at a time, so their last digits depend on the chunk size.
+    normals = vertex_normals(coordinates, triangulation, chunk_size=chunk_size)
+    mesh = Mesh2(coordinates, triangulation, chunk_size=chunk_size)
+    assert repr(mesh) == reference_mesh2(coordinates, triangulation, normals)
+
+def test_mesh2_keeps_arrays(tmp_path):
+    # The mesh refers to its input arrays (including memory-mapped ones) rather than copying them.
+    coordinates, triangulation = triangulate_grid(*surface(8, 9))
+    mesh = Mesh2(coordinates, triangulation)
+    assert np.shares_memory(mesh.vertex_vectors.coordinates, coordinates)
+    assert np.shares_memory(mesh.face_indices.coordinates, triangulation)
+
+    np.save(tmp_path / 'coordinates.npy', coordinates)
+    np.save(tmp_path / 'triangulation.npy', triangulation)
+    coordinates = np.load(tmp_path / 'coordinates.npy', mmap_mode='r')
+    triangulation = np.load(tmp_path / 'triangulation.npy', mmap_mode='r')
+    mapped = Mesh2(coordinates, triangulation)
+    assert np.shares_memory(mapped.vertex_vectors.coordinates, coordinates)
+    assert np.shares_memory(mapped.face_indices.coordinates, triangulation)
+    assert repr(mapped) == repr(mesh)
+
+def transformations(node):
+    return {type(child): child.value for child in node.children if isinstance(child, (Scale, Translate))}
+
+def test_height_field_image(tmp_path):
+    x, y = np.linspace(-1, 2, 7), np.linspace(0.5, 1.5, 5)
+    X, Y = np.meshgrid(x, y)
+    Z = np.sin(X) + Y**2
+    field = HeightField(Z, str(tmp_path / 'heights.png'), extent=((-1, 2), (0.5, 1.5)))
+
+    # The first image row is the last row of the grid (at the end of the y range).
+    levels = read_png(tmp_path / 'heights.png')
+    assert levels.dtype == np.uint16 and levels.shape == Z.shape
+    assert np.argmax(levels[0]) == np.argmax(Z[-1]) and levels[0].max() == 65535
+
+    # Scaling the levels to the unit cube and then by the transformations recovers the heights.
+    zmin, zrange = Z.min(), Z.max() - Z.min()
+    assert np.allclose(zmin + levels[::-1] / 65535 * zrange, Z, rtol=0, atol=0.5 * zrange / 65535)
+    assert transformations(field) == {Scale: pov_vector(np.array([3., zrange, 1.])),
+                                      Translate: pov_vector(np.array([-1., zmin, 0.5]))}
+
+def test_height_field_constant(tmp_path):
+    field = HeightField(np.full((3, 4), 2.5), str(tmp_path / 'flat.png'))
+    assert not read_png(tmp_path / 'flat.png').any()
+    assert transformations(field) == {Scale: pov_vector(np.array([1., 1., 1.])),
+                                      Translate: pov_vector(np.array([0., 2.5, 0.]))}
+
+@pytest.mark.parametrize('indexing', ['xy', 'ij'])
+def test_surface_height_field(tmp_path, indexing):
+    x, y = np.linspace(0, 2, 6), np.linspace(-1, 1, 4)
+    X, Y = np.meshgrid(x, y, indexing=indexing)
+    Z = X * Y
+    field = surface_object(X, Y, Z, image=str(tmp_path / 'surface.png'))
+    assert isinstance(field, HeightField)
+    assert np.array_equal(field.heights, Z if indexing == 'xy' else Z.T)
+    assert read_png(tmp_path / 'surface.png').shape == (4, 6)
+    assert transformations(field)[Translate] == pov_vector(np.array([0., Z.min(), -1.]))
+
+    # Without an image, or on a non-uniform grid, the surface is a mesh.
+    assert isinstance(surface_object(X, Y, Z), Mesh2)
+    assert isinstance(surface_object(X**2, Y, Z, image=str(tmp_path / 'other.png')), Mesh2)
+
+def test_grid_lines_are_views():
+    X, Y, Z = surface(5, 4)
+    rows, columns = grid_lines(X, Y, Z)
+    for i in range(len(X)): assert np.array_equal(rows[i], np.column_stack([X[i], Y[i], Z[i]]))
+    for j in range(len(X[0])): assert np.array_equal(columns[j], np.column_stack([X[:,j], Y[:,j], Z[:,j]]))
+    assert np.shares_memory(rows, columns)
+
+def reference_wireframe_lines(X, Y, Z, every):
+    """Grid lines kept by wireframe, selected one line at a time."""
+    lines = []
+    for coords, k in zip(grid_lines(X, Y, Z), np.broadcast_to(every, 2)):
+        selected = [line for i, line in enumerate(coords) if i % k == 0 or i == len(coords) - 1]
+        lines += selected
+    return lines
+
+@pytest.mark.parametrize('every', [1, 2, 3, (2, 4), (5, 1)])
+def test_wireframe_matches_grid_lines(every):
+    X, Y, Z = surface(7, 9)
+    lines = reference_wireframe_lines(X, Y, Z, every)
+    offsets = np.cumsum([0] + [len(line) for line in lines])
+    assert repr(wireframe(X, Y, Z, 0.1, every=every)) == repr(polylines(np.concatenate(lines), offsets, 0.1))
+
+    # Each cylinder joins neighbouring points along one of the lines.
+    cylinders = wireframe(X, Y, Z, 0.1, every=every, smooth=False).children[0]
+    expected = {(tuple(a), tuple(b)) for line in lines for a, b in zip(line[:-1], line[1:])}
+    assert len(cylinders.positions1) == len(expected)
+    assert set(zip(map(tuple, cylinders.positions1), map(tuple, cylinders.positions2))) == expected
+
+def test_wireframe_sweeps():
+    X, Y, Z = surface(4, 6)
+    sweeps = wireframe(X, Y, Z, 0.1, every=(3, 2), sweep=True).children
+    lines = reference_wireframe_lines(X, Y, Z, (3, 2))
+    assert all(isinstance(sweep, SphereSweep) for sweep in sweeps)
+    assert len(sweeps) == len(lines) == 2 + 4
+    for sweep, line in zip(sweeps, lines): assert np.array_equal(sweep.points, line)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import itertools
+import pytest
+import numpy as np
+
+from povray.molecules import find_bonds, minimum_image, ball_and_stick, NeighbourList, write_trajectory
+
+def brute_force_image(displacement, box):
+    """Shortest of the periodic images of a displacement within two boxes of it."""
+    if box is None: return displacement
+    box = np.broadcast_to(np.asarray(box, dtype=float), displacement.shape)
+    shifts = np.array(list(itertools.product(range(-2, 3), repeat=len(displacement))))
+    images = displacement + shifts * box
+    return images[np.argmin(np.linalg.norm(images, axis=1))]
+
+def brute_force_bonds(coordinates, bond_threshold, box):
+    bonds = [(i, j) for i, j in itertools.combinations(range(len(coordinates)), 2)
+             if np.linalg.norm(brute_force_image(coordinates[j] - coordinates[i], box)) < bond_threshold]
+    return np.array(bonds, dtype=int).reshape(-1, 2)
+
+@pytest.mark.parametrize('box', [None, 5., (4., 6., 5.)])
+def test_minimum_image(box):
+    displacements = np.random.default_rng(0).uniform(-9, 9, (200, 3))
+    expected = np.array([brute_force_image(d, box) for d in displacements])
+    assert np.allclose(minimum_image(displacements, box), expected)
+
+@pytest.mark.parametrize('box', [None, 5., (4., 6., 5.)])
+@pytest.mark.parametrize('bond_threshold', [0.5, 1.2])
+def test_find_bonds(box, bond_threshold):
+    rng = np.random.default_rng(1)
+    # Particles may lie outside the box, which are wrapped back inside.
+    coordinates = rng.uniform(-2, 7, (80, 3))
+    bonds = find_bonds(coordinates, bond_threshold, box)
+    assert np.array_equal(bonds, brute_force_bonds(coordinates, bond_threshold, box))
+
+def test_bond_across_boundary():
+    coordinates = np.array([[0.25, 2, 2], [4.75, 2, 2], [2.5, 2, 2]])
+    assert np.array_equal(find_bonds(coordinates, 0.6, box=5.), [[0, 1]])
+    assert len(find_bonds(coordinates, 0.6)) == 0
+    # Separations equal to the threshold are not bonds.
+    assert len(find_bonds(coordinates, 0.5, box=5.)) == 0
+
+def test_ball_and_stick_splits_wrapped_bonds():
+    coordinates = np.array([[0.1, 2, 2], [4.9, 2, 2], [2.5, 2, 2], [2.8, 2, 2]])
+    balls, sticks = ball_and_stick(coordinates, 0.1, 0.05, bond_threshold=0.5, box=5.)
+    cylinders = sticks.children[0]
+    # The bond inside the box is drawn whole, and the wrapped one as two half-sticks leaving the box.
+    assert np.allclose(cylinders.positions1, [[2.5, 2, 2], [0.1, 2, 2], [4.9, 2, 2]])
+    assert np.allclose(cylinders.positions2, [[2.8, 2, 2], [-0.0, 2, 2], [5.0, 2, 2]])
+
+@pytest.mark.parametrize('box', [None, 6.])
+def test_neighbour_list_matches_find_bonds(box):
+    rng = np.random.default_rng(2)
+    coordinates = rng.uniform(0, 6, (300, 3))
+    neighbours = NeighbourList(1., skin=0.3, box=box)
+    for frame in range(40):
+        assert np.array_equal(neighbours.bonds(coordinates), find_bonds(coordinates, 1., box))
+        coordinates = coordinates + rng.normal(scale=0.02, size=coordinates.shape)
+    # Particles move far enough to need a few rebuilds, but most frames reuse the candidates.
+    assert neighbours.frames == 40
+    assert 1 < neighbours.builds < 20
+
+def test_neighbour_list_rebuilds():
+    coordinates = np.random.default_rng(3).uniform(0, 5, (100, 3))
+    neighbours = NeighbourList(1., skin=0.4)
+    neighbours.bonds(coordinates)
+    # Moving a particle by less than half the skin keeps the candidates; moving it further rebuilds.
+    moved = coordinates.copy()
+    moved[0] += [0.19, 0, 0]
+    assert np.array_equal(neighbours.bonds(moved), find_bonds(moved, 1.))
+    assert neighbours.builds == 1
+    moved[0] += [0.02, 0, 0]
+    assert np.array_equal(neighbours.bonds(moved), find_bonds(moved, 1.))
+    assert neighbours.builds == 2
+    # So does a change in the number of particles.
+    assert np.array_equal(neighbours.bonds(moved[:50]), find_bonds(moved[:50], 1.))
+    assert neighbours.builds == 3
+
+def test_neighbour_list_wraps_box():
+    # A particle crossing the periodic boundary has only moved a little.
+    coordinates = np.array([[0.05, 1, 1], [4.7, 1, 1], [2.5, 1, 1]])
+    neighbours = NeighbourList(0.5, skin=0.4, box=5.)
+    neighbours.bonds(coordinates)
+    coordinates[0, 0] = 4.95
+    assert np.array_equal(neighbours.bonds(coordinates), find_bonds(coordinates, 0.5, box=5.))
+    assert np.array_equal(neighbours.bonds(coordinates), [[0, 1]])
+    assert neighbours.builds == 1
+
+def trajectory(frames=4, n=60, seed=4):
+    """Random walk of a cloud of particles close enough to form bonds."""
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(-2, 2, (n, 3))
+    return start + np.cumsum(rng.normal(scale=0.05, size=(frames, n, 3)), axis=0)
+
+def read_frames(paths):
+    return [open(path).read() for path in paths]
+
+def test_write_trajectory(tmp_path):
+    frames = trajectory()
+    paths = write_trajectory(frames, str(tmp_path), ball_radius=0.3, stick_radius=0.05)
+    assert paths == [str(tmp_path / 'frame{:04d}.pov'.format(t)) for t in range(len(frames))]
+
+    # The camera and materials are written once, and each frame only adds its balls and sticks.
+    shared = (tmp_path / 'trajectory.inc').read_text()
+    assert shared.count('camera\n{') == 1 and 'ballFinish' in shared
+    for coordinates, text in zip(frames, read_frames(paths)):
+        assert text.startswith('#version') and '#include "trajectory.inc"' in text and 'camera' not in text
+        balls, sticks = ball_and_stick(coordinates, 0.3, 0.05)
+        for batch in [balls.children[0], sticks.children[0]]: assert ''.join(batch.iter_chunks(1)) in text
+
+def test_write_trajectory_options_agree(tmp_path):
+    # Worker processes, neighbour lists and lazily read frames all give the same scripts.
+    frames = trajectory()
+    expected = read_frames(write_trajectory(frames, str(tmp_path)))
+    for options in [dict(workers=2), dict(skin=0.3), dict(workers=2, skin=0.3)]:
+        directory = tmp_path / '_'.join(options)
+        directory.mkdir()
+        assert read_frames(write_trajectory(iter(frames), str(directory), **options)) == expected
+
+    np.save(tmp_path / 'frames.npy', frames)
+    mapped = np.load(tmp_path / 'frames.npy', mmap_mode='r')
+    assert read_frames(write_trajectory(mapped, str(tmp_path), workers=2)) == expected
+
+def test_write_trajectory_data_files(tmp_path):
+    frames = trajectory(frames=3)
+    prefix = str(tmp_path / 'frame{:04d}')
+    paths = write_trajectory(frames, str(tmp_path), data_prefix=prefix, workers=2)
+    for t, text in enumerate(read_frames(paths)):
+        for suffix in ['atoms', 'bonds']:
+            path = '{}_{}.dat'.format(prefix.format(t), suffix)
+            assert os.path.exists(path) and '"{}"'.format(path) in text
+        rows = np.loadtxt('{}_atoms.dat'.format(prefix.format(t)), delimiter=',', usecols=range(3))
+        assert np.array_equal(rows, frames[t])
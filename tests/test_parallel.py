@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import pytest
+import numpy as np
+
+from povray import Union, Merge, Sphere, SphereBatch, CylinderBatch, Mesh2, TiledMesh, triangulate_grid, write_parallel
+from povray.scene import Scene
+from povray.pigments import Pigment, Colour, Transmit
+
+def mixed_tree():
+    """Scene combining nested unions of small objects, large batches and meshes."""
+    rng = np.random.default_rng(0)
+    scene = Scene()
+    scene += [Union(*[Sphere(x, 0.5, Pigment(Colour('White'), Transmit(0.5))) for x in rng.random((300, 3))])]
+    scene += [Merge(SphereBatch(rng.random((2000, 3)), rng.random(2000), colours=['Red', 'Blue'],
+                                colour_indices=rng.integers(0, 2, 2000)),
+                    CylinderBatch(rng.random((500, 3)), rng.random((500, 3)), 0.1, precision=6),
+                    Pigment(Colour('Green')))]
+    x = np.linspace(0, 1, 40)
+    X, Y = np.meshgrid(x, x)
+    Z = X*(1-X) * Y*(1-Y)
+    scene += [Mesh2(*triangulate_grid(X, Y, Z)), TiledMesh(X, Y, Z, tile_size=16)]
+    scene += [Union(Union(Union(Sphere(np.zeros(3), 1))))]
+    return scene
+
+@pytest.fixture(scope='module')
+def tree():
+    return mixed_tree()
+
+@pytest.mark.parametrize('processes', [1, 2, 3])
+@pytest.mark.parametrize('tasks_per_process', [1, 8, 64])
+def test_identical_to_repr(tree, processes, tasks_per_process):
+    f = io.StringIO()
+    write_parallel(tree, f, processes=processes, tasks_per_process=tasks_per_process, buffer_size=1000)
+    assert f.getvalue() == repr(tree)
+
+def test_identical_to_write_binary(tree):
+    f, expected = io.BytesIO(), io.BytesIO()
+    write_parallel(tree, f, processes=2)
+    tree.write(expected)
+    assert f.getvalue() == expected.getvalue()
+
+def test_data_file_batch(tmp_path, monkeypatch):
+    # Batches written to a data file are written whole, by a single worker.
+    monkeypatch.chdir(tmp_path)
+    positions = np.random.default_rng(1).random((5000, 3))
+    tree = Union(SphereBatch(positions, 0.1, data_file='spheres.dat'), Sphere(np.zeros(3), 1))
+    expected = repr(tree)
+    with open('spheres.dat') as f: data = f.read()
+    f = io.StringIO()
+    write_parallel(tree, f, processes=3, tasks_per_process=16)
+    assert f.getvalue() == expected
+    with open('spheres.dat') as f: assert f.read() == data
+
+class ScaledSphereBatch(SphereBatch):
+    """Batch type defined outside the library, with an extra per-item field."""
+    __slots__ = ('scales',)
+    row_fields = SphereBatch.row_fields + ('scales',)
+
+    def __init__(self, positions, radii, scales, **kwargs):
+        self.scales = np.asarray(scales)
+        super().__init__(positions, radii, **kwargs)
+
+    @property
+    def fields(self):
+        return [self.positions, self.radii*self.scales]
+
+def test_take_slices_row_fields():
+    rng = np.random.default_rng(2)
+    batch = ScaledSphereBatch(rng.random((10, 3)), 0.5, rng.random(10))
+    subset = batch.take([7, 2, 3])
+    assert np.array_equal(subset.scales, batch.scales[[7, 2, 3]])
+    assert len(subset.radii) == 3
+
+def test_subclass_identical_to_repr():
+    rng = np.random.default_rng(3)
+    tree = Union(ScaledSphereBatch(rng.random((3000, 3)), 0.5, rng.random(3000)), Sphere(np.zeros(3), 1))
+    f = io.StringIO()
+    write_parallel(tree, f, processes=2, tasks_per_process=8)
+    assert f.getvalue() == repr(tree)
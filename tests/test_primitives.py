@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from povray import Primitive, Sphere, Union, Translate, pov_vector
+from povray.pigments import Pigment, Colour
+
+def baseline_pov_vector(v):
+    """Original conversion of numpy arrays to povray vectors."""
+    return str(v.tolist()).replace('[', '<').replace(']', '>')
+
+@pytest.mark.parametrize('v', [np.float64(2.0), np.array(3), np.int64(-4), np.array([1, 2, 3]),
+                               np.array([0.1, -2.5, 1e-20]), np.array([[1., 2.], [3., 4.]]), np.zeros(0)])
+def test_pov_vector(v):
+    assert pov_vector(v) == baseline_pov_vector(v)
+
+def test_pov_vector_string():
+    assert pov_vector('x') == 'x'
+
+def test_user_subclass_attributes():
+    # Classes defined outside the library are ordinary classes, free to set any attribute.
+    class Labelled(Primitive):
+        def __init__(self, label, *args, **kwargs):
+            self.label = label
+            super().__init__(*args, **kwargs)
+
+        @property
+        def body(self):
+            return self.label
+
+    node = Labelled('abc')
+    node.extra = 1
+    assert repr(node) == 'labelled{abc}'
+
+def test_library_nodes_have_no_dict():
+    for node in [Sphere(np.zeros(3), 1), Union(), Translate(np.zeros(3)), Pigment(Colour('Red')), Colour('Red')]:
+        assert not hasattr(node, '__dict__')
+
+def test_children_are_lists():
+    sphere = Sphere(np.zeros(3), 1)
+    sphere.children += [Translate(np.ones(3))]
+    sphere += [Pigment(Colour('Red'))]
+    assert isinstance(Union().children, list)
+    assert Union().children is not Union().children
+    text = repr(sphere)
+    assert 'translate <1.0, 1.0, 1.0>' in text and 'colour Red' in text
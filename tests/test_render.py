@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+import pytest
+import numpy as np
+
+from povray.render import render, render_frames, RenderPool, RenderError
+from povray.image import read_ppm
+
+from fakepov import pattern
+
+class BrokenScene:
+    """Scene whose script fails part way through being written."""
+    def write(self, f):
+        f.write(b'#version 3.7;\n')
+        raise ValueError('cannot generate scene')
+
+def test_render_streams_scene(fakepov, scene, tmp_path):
+    output = str(tmp_path / 'image.ppm')
+    result = render(scene, output, 40, 30, executable=fakepov)
+    assert result.output == output
+    assert result.attempts == 1
+    assert result.parse_time is not None and result.render_time == pytest.approx(1)
+    assert np.array_equal(read_ppm(output), pattern(30, 40))
+
+def test_render_from_file(fakepov, scene, tmp_path):
+    with open(tmp_path / 'scene.pov', 'w') as f: scene.write(f)
+    result = render(None, 'image.ppm', 20, 10, executable=fakepov, input='scene.pov', cwd=str(tmp_path))
+    assert result.attempts == 1
+    assert np.array_equal(read_ppm(tmp_path / 'image.ppm'), pattern(10, 20))
+
+def test_render_failure(fakepov, failing_scene, tmp_path):
+    with pytest.raises(RenderError, match='FAIL'):
+        render(failing_scene, str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, retries=2)
+
+def test_render_retries(fakepov, scene, tmp_path, monkeypatch):
+    log = tmp_path / 'log'
+    monkeypatch.setenv('FAKEPOV_LOG', str(log))
+    with pytest.raises(RenderError):
+        render(scene, str(tmp_path / 'missing' / 'image.ppm'), 20, 10, executable=fakepov, retries=2)
+    assert len(log.read_text().splitlines()) == 3
+
+def test_render_timeout(fakepov, scene, tmp_path, monkeypatch):
+    monkeypatch.setenv('FAKEPOV_SLEEP', '30')
+    start = time.perf_counter()
+    with pytest.raises(RenderError, match='timed out'):
+        render(scene, str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, timeout=0.5)
+    assert time.perf_counter() - start < 10
+
+def test_scene_error_stops_povray(fakepov, tmp_path):
+    # The error generating the script is raised, rather than povray waiting forever for its input
+    # (the timeout only stops this test from hanging if that happens).
+    start = time.perf_counter()
+    with pytest.raises(ValueError, match='cannot generate scene'):
+        render(BrokenScene(), str(tmp_path / 'image.ppm'), 20, 10, executable=fakepov, timeout=30)
+    assert time.perf_counter() - start < 10
+
+def test_render_pool(fakepov, scene, tmp_path):
+    outputs = [str(tmp_path / 'frame{}.ppm'.format(i)) for i in range(5)]
+    with RenderPool(workers=3, executable=fakepov) as pool:
+        results = list(pool.map([scene]*5, outputs, 20, 10))
+    assert [result.output for result in results] == outputs
+    for output in outputs: assert np.array_equal(read_ppm(output), pattern(10, 20))
+
+def test_render_pool_failure(fakepov, scene, failing_scene, tmp_path):
+    with RenderPool(workers=2, executable=fakepov) as pool:
+        good = pool.submit(scene, str(tmp_path / 'good.ppm'), 20, 10)
+        bad = pool.submit(failing_scene, str(tmp_path / 'bad.ppm'), 20, 10)
+        assert good.result().attempts == 1
+        with pytest.raises(RenderError): bad.result()
+
+def test_render_frames(fakepov, scene, tmp_path):
+    pattern_path = str(tmp_path / 'frame{:02d}.ppm')
+    results = render_frames([scene]*3, pattern_path, 20, 10, workers=2, executable=fakepov)
+    assert [result.output for result in results] == [pattern_path.format(i) for i in range(3)]
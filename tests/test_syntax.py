@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from povray.syntax import pov_vector, pov_vectors, iter_pov_vectors, number_format
+
+def vectors(dtype):
+    rng = np.random.default_rng(0)
+    if np.issubdtype(dtype, np.integer): return rng.integers(0, 100, (50, 3)).astype(dtype)
+    v = rng.normal(scale=1e3, size=(50, 3))
+    v[0] = [0., -0., 1.]
+    v[1] = [1e-30, 1e30, 0.1]
+    return v.astype(dtype)
+
+@pytest.mark.parametrize('dtype', [np.int32, np.int64, np.uint8, np.float32, np.float64])
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_matches_pov_vector(dtype, chunk_size):
+    v = vectors(dtype)
+    expected = ', '.join([pov_vector(row) for row in v])
+    assert ''.join(iter_pov_vectors(v, chunk_size=chunk_size)) == expected
+    assert pov_vectors(v) == expected
+
+def test_single_vector_and_separator():
+    v = np.array([1.5, 2, -3])
+    assert pov_vectors(v) == pov_vector(v)
+    assert pov_vectors(np.arange(6).reshape(3, 2), separator=',\n') == '<0, 1>,\n<2, 3>,\n<4, 5>'
+    assert pov_vectors(np.zeros((0, 3))) == ''
+
+@pytest.mark.parametrize('precision', [1, 3, 6, 17])
+def test_precision(precision):
+    v = vectors(np.float64)
+    text = pov_vectors(v, precision)
+    values = np.array([float(x) for x in text.replace('<', '').replace('>', '').split(',')]).reshape(v.shape)
+    assert np.allclose(values, v, rtol=10.**(1-precision), atol=0)
+    if precision == 17: assert np.array_equal(values, v)
+    # Integers are always written exactly.
+    assert pov_vectors(vectors(np.int64), precision) == pov_vectors(vectors(np.int64))
+
+def test_number_format():
+    assert number_format(np.dtype(np.int16)) == number_format(np.dtype(np.int64), 3) == '%d'
+    assert number_format(np.dtype(float)) == '%r'
+    assert number_format(np.dtype(np.float32), 6) == '%.6g'
+    assert number_format(np.dtype(float), 6) % 0.0 == '0'
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from povray.render import render_tiled, plan_tiles, TileBalancer, RenderError
+from povray.image import read_ppm, read_png
+
+from fakepov import pattern
+
+def covered(tiles, width, height):
+    count = np.zeros((height, width), dtype=int)
+    for r0, r1, c0, c1 in tiles: count[r0:r1, c0:c1] += 1
+    return count
+
+@pytest.mark.parametrize('columns', [1, 3])
+def test_plan_tiles_cover_frame(columns):
+    row_cost = np.linspace(0, 5, 37)**2
+    tiles = plan_tiles(50, 37, 6, columns, row_cost)
+    assert (covered(tiles, 50, 37) == 1).all()
+
+def test_plan_tiles_balance_cost():
+    row_cost = np.where(np.arange(100) < 20, 10., 1.)
+    tiles = plan_tiles(10, 100, 4, row_cost=row_cost)
+    costs = [row_cost[r0:r1].sum() for r0, r1, c0, c1 in tiles]
+    assert max(costs) <= 1.2 * np.mean(costs)
+
+@pytest.mark.parametrize('crop', [False, True])
+@pytest.mark.parametrize('columns', [1, 2])
+def test_render_tiled_matches_full_frame(fakepov, scene, tmp_path, monkeypatch, crop, columns):
+    # povray either writes the whole frame with only the region rendered, or just the region.
+    if crop: monkeypatch.setenv('FAKEPOV_CROP', '1')
+    output = str(tmp_path / 'image.ppm')
+    result = render_tiled(scene, output, 41, 29, workers=3, ntiles=5, columns=columns, executable=fakepov,
+                          scratch=str(tmp_path))
+    assert (covered(result.tiles, 41, 29) == 1).all()
+    assert len(result.results) == len(result.tiles)
+    assert np.array_equal(read_ppm(output), pattern(29, 41))
+
+def test_render_tiled_png(fakepov, scene, tmp_path):
+    output = str(tmp_path / 'image.png')
+    render_tiled(scene, output, 30, 20, workers=2, executable=fakepov)
+    assert np.array_equal(read_png(output), pattern(20, 30))
+
+def test_render_tiled_updates_balancer(fakepov, scene, tmp_path):
+    balancer = TileBalancer(40)
+    render_tiled(scene, str(tmp_path / 'image.ppm'), 30, 40, workers=2, ntiles=4, balancer=balancer,
+                 executable=fakepov)
+    # The stand-in reports uniform costs per pixel, so rows stay (nearly) equally expensive.
+    assert np.allclose(balancer.row_cost, balancer.row_cost.mean(), rtol=0.05)
+    with pytest.raises(ValueError):
+        render_tiled(scene, str(tmp_path / 'image.ppm'), 30, 20, balancer=balancer, executable=fakepov)
+
+def test_render_tiled_failure(fakepov, failing_scene, tmp_path):
+    with pytest.raises(RenderError):
+        render_tiled(failing_scene, str(tmp_path / 'image.ppm'), 30, 20, workers=2, executable=fakepov)
+
+def test_balancer_learns_row_costs():
+    balancer = TileBalancer(100, smoothing=0)
+    tiles = balancer.tiles(10, 4)
+    # Make the top quarter of the image ten times as costly per row as the rest.
+    times = [sum(10. if row < 25 else 1. for row in range(r0, r1)) for r0, r1, c0, c1 in tiles]
+    balancer.update(tiles, times)
+    tiles = balancer.tiles(10, 4)
+    assert (covered(tiles, 10, 100) == 1).all()
+    assert tiles[0][1] < 25
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2022 Joshua Robinson
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import os
+import socket
+import threading
+import pytest
+import numpy as np
+
+from povray import Union, Sphere, SphereBatch, Mesh2, triangulate_grid
+from povray.pigments import Pigment, Colour
+
+from conftest import simple_scene
+
+@pytest.fixture(scope='module')
+def tree():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 1, 20)
+    X, Y = np.meshgrid(x, x)
+    return simple_scene(Union(*[Sphere(p, 0.1, Pigment(Colour('Red'))) for p in rng.random((200, 3))]),
+                        SphereBatch(rng.random((3000, 3)), 0.05), Mesh2(*triangulate_grid(X, Y, X*Y)))
+
+class Recorder:
+    """Text stream recording the size of each write."""
+    def __init__(self):
+        self.writes = []
+
+    def write(self, s):
+        self.writes.append(s)
+
+@pytest.mark.parametrize('buffer_size', [1, 1000, 1<<16, 1<<30])
+def test_buffered_writes(tree, buffer_size):
+    recorder = Recorder()
+    tree.write(recorder, buffer_size=buffer_size)
+    assert ''.join(recorder.writes) == str(tree) == repr(tree)
+    # Every write but the last holds at least a buffer's worth of text.
+    assert all(len(s) >= buffer_size for s in recorder.writes[:-1])
+    if buffer_size >= len(str(tree)): assert len(recorder.writes) == 1
+
+def test_text_and_binary_streams(tree, tmp_path):
+    expected = str(tree)
+    f = io.StringIO()
+    tree.write(f)
+    assert f.getvalue() == expected
+    f = io.BytesIO()
+    tree.write(f)
+    assert f.getvalue() == expected.encode()
+
+    for mode in ['w', 'wb']:
+        with open(tmp_path / 'scene.pov', mode) as f: tree.write(f, buffer_size=4096)
+        assert (tmp_path / 'scene.pov').read_text() == expected
+
+    descriptor = os.open(tmp_path / 'raw.pov', os.O_WRONLY | os.O_CREAT)
+    try: tree.write(descriptor)
+    finally: os.close(descriptor)
+    assert (tmp_path / 'raw.pov').read_text() == expected
+
+def read_all(connection, received):
+    while True:
+        data = connection.recv(1 << 16)
+        if not data: break
+        received.append(data)
+
+def test_socket(tree):
+    # The script is larger than the socket's buffer, so is read while it is written.
+    a, b = socket.socketpair()
+    received = []
+    reader = threading.Thread(target=read_all, args=(b, received))
+    reader.start()
+    with a: tree.write(a)
+    reader.join()
+    b.close()
+    assert b''.join(received).decode() == str(tree)
+
+def test_nested_indentation():
+    sphere = Sphere(np.zeros(3), 1)
+    f = io.StringIO()
+    sphere.write(f, nest=2)
+    assert f.getvalue() == ''.join(sphere.iter_chunks(2))
+    assert f.getvalue().startswith('    sphere')